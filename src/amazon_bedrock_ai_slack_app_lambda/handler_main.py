@@ -1,7 +1,12 @@
+import contextvars
+import itertools
 import json
+import math
 import os
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import date, datetime
+from typing import Optional, cast
 
 from amazon_bedrock_ai_slack_app_lambda.helpers.bedroc_invoker_metadata import (
     BedrockInvokerMetadata,
@@ -9,14 +14,25 @@ from amazon_bedrock_ai_slack_app_lambda.helpers.bedroc_invoker_metadata import (
 from amazon_bedrock_ai_slack_app_lambda.helpers.bedrock_helper import (  # noqa: F401
     invoke_bedrock_streaming,
 )
-from amazon_bedrock_ai_slack_app_lambda.helpers.command_helper import handle_command
+from amazon_bedrock_ai_slack_app_lambda.helpers.command_helper import handle_command, is_command
 from amazon_bedrock_ai_slack_app_lambda.helpers.constants import (
     DEFAULT_LAST_DISCLAIMER_DATE,
     DISCLAIMER,
+    HANDLER_MAX_WORKERS,
+    SQS_RECORD_MAX_WORKERS,
+    THINKING_FACE,
 )
-from amazon_bedrock_ai_slack_app_lambda.helpers.ddb_helper import get_user_settings, save_settings
+from amazon_bedrock_ai_slack_app_lambda.helpers.ddb_helper import (
+    get_user_settings,
+    get_users_settings,
+    qualified_user_id,
+    save_last_disclaimer_date,
+)
+from amazon_bedrock_ai_slack_app_lambda.helpers.event_deduplicator import EVENT_DEDUPLICATOR
 from amazon_bedrock_ai_slack_app_lambda.helpers.logging import LOGGER
 from amazon_bedrock_ai_slack_app_lambda.helpers.metrics_publisher import (
+    flush_metrics,
+    report_slack_rate_limiter_metrics,
     report_slack_request_message_size_bytes,
 )
 from amazon_bedrock_ai_slack_app_lambda.helpers.model_helper import get_model
@@ -28,10 +44,17 @@ from amazon_bedrock_ai_slack_app_lambda.helpers.slack_helper import (  # noqa: F
     get_bot_user_id,
     get_channel_type,
     get_conversation_history,
+    get_slack_rate_limiter_stats,
     get_thread_replies,
     get_user_from_userid,
     send_chat,
 )
+from amazon_bedrock_ai_slack_app_lambda.helpers.thread_summary import (
+    THREAD_SUMMARY_STORE,
+    get_recent_messages,
+    needs_summary,
+    summarize_thread,
+)
 from amazon_bedrock_ai_slack_app_lambda.helpers.utils import check_if_mentioning_bot, get_thread_ts
 from amazon_bedrock_ai_slack_app_lambda.validation.request_response_validator import (
     validate_request_message_from_slack,
@@ -43,31 +66,160 @@ from amazon_bedrock_ai_slack_app_lambda.validation.user_validator import (  # no
     validate_slack_user,
 )
 
+# Shared across warm invocations of the container
+HANDLER_EXECUTOR = ThreadPoolExecutor(max_workers=HANDLER_MAX_WORKERS, thread_name_prefix="handler")
+RECORD_EXECUTOR = ThreadPoolExecutor(max_workers=SQS_RECORD_MAX_WORKERS, thread_name_prefix="record")
+
+SLACK_RETRY_NUM_ATTRIBUTE = "X-Slack-Retry-Num"
+
+# Environment variable to set to "true" when ReportBatchItemFailures is enabled on the SQS event source mapping.
+# Otherwise the batchItemFailures of the response are ignored, so a batch with failed records fails the invocation
+# and is redelivered as a whole. Its completed events are skipped as duplicates only if the redelivery reaches the
+# same container or EVENT_DEDUPE_TABLE_NAME is set; without the table other containers answer them again.
+REPORT_BATCH_ITEM_FAILURES = "REPORT_BATCH_ITEM_FAILURES"
+BATCH_ITEM_FAILURES_REPORTED = os.getenv(REPORT_BATCH_ITEM_FAILURES, "false").lower() == "true"
+
 
 def lambda_handler(event, context):
     """
     Main entry point for the lambda.
-    The JSON body of the request is provided in the event slot.
+    Every SQS record carries a Slack event in its JSON body. The records of a batch are handled concurrently; the
+    records that failed are reported as batchItemFailures, so only they are redelivered. Unless
+    REPORT_BATCH_ITEM_FAILURES is set, failed records fail the invocation instead.
+    """
+
+    try:
+        records = event.get("Records") or []
+        bodies = [__parse_body(record) for record in records]
+        # events are claimed until the invocation times out at the latest
+        lease_seconds = math.ceil(context.get_remaining_time_in_millis() / 1000) if context is not None else None
+        if len(records) == 1:
+            failed = [not __handle_record(records[0], bodies[0], None, lease_seconds)]
+        else:
+            user_settings = __prefetch_user_settings(bodies)
+            failed = [not succeeded for succeeded in
+                      RECORD_EXECUTOR.map(__handle_record, records, bodies, itertools.repeat(user_settings),
+                                          itertools.repeat(lease_seconds))]
+        failures = [{"itemIdentifier": record.get("messageId")}
+                    for record, record_failed in zip(records, failed) if record_failed]
+        if failures and not BATCH_ITEM_FAILURES_REPORTED:
+            raise RuntimeError("{} of {} SQS records failed".format(len(failures), len(records)))
+        return {"batchItemFailures": failures}
+    finally:
+        # metrics are buffered during the invocation; publish them before the container is frozen
+        report_slack_rate_limiter_metrics(get_slack_rate_limiter_stats(reset=True))
+        flush_metrics()
+
+
+def __parse_body(record):
+    """
+    :param record: SQS record
+    :return: the Slack event callback of the record, None if the body is invalid
+    """
+    try:
+        return json.loads(record.get("body"))
+    except Exception as e:
+        LOGGER.error("Dropping SQS record {} with an invalid body: {}".format(record.get("messageId"), e))
+        return None
+
+
+def __prefetch_user_settings(bodies):
+    """
+    Reads the settings of the users of a batch with one batch request instead of one read per record. Only the
+    events that are answered are looked up, so no settings are created for users who did not talk to the bot.
+    :param bodies: Slack event callbacks of the records, None for invalid records
+    :return: dict of qualified user id to settings, users missing from it are read by their record
+    """
+    try:
+        bot_user_id = get_bot_user_id()
+        channel_user_ids = []
+        for body in bodies:
+            slack_event = (body or {}).get("event") or {}
+            channel_id = slack_event.get("channel")
+            user_id = slack_event.get("user")
+            if not channel_id or not user_id or user_id == bot_user_id or "subtype" in slack_event:
+                continue
+            # the Slack lookups validate the channel of the request, every event is checked in its own context
+            if not contextvars.Context().run(__is_answered, slack_event, bot_user_id):
+                continue
+            channel_user_ids.append((channel_id, user_id))
+        return get_users_settings(channel_user_ids) if channel_user_ids else {}
+    except Exception as e:
+        LOGGER.error("Prefetching the user settings failed: {}".format(e))
+        return {}
+
+
+def __is_answered(slack_event, bot_user_id):
+    """
+    :param slack_event: Slack message event with a channel and a user
+    :param bot_user_id: The user ID of the bot.
+    :return: True if the bot answers the event, i.e. it is a direct message or mentions the bot
+    """
+    channel_id = slack_event.get("channel")
+    SLACK_PARAMETER_VALIDATOR.set_channel_id(channel_id)
+    return get_channel_type(channel_id) == 'im' or check_if_mentioning_bot(slack_event, bot_user_id)
+
+
+def __handle_record(record, body, user_settings=None, lease_seconds=None):
     """
+    Handles the Slack event of an SQS record in a new context, so the per request state (SLACK_PARAMETER_VALIDATOR)
+    of concurrent records is kept apart. Events are deduplicated on the Slack event_id.
+    :param record: SQS record
+    :param body: Slack event callback of the record, None if the body is invalid
+    :param user_settings: dict of qualified user id to the settings prefetched for the batch
+    :param lease_seconds: time the event is claimed for while it is handled, None for the default lease
+    :return: False if the record has to be redelivered
+    """
+    if body is None:
+        return True
+
+    event_id = body.get("event_id")
+    retry_num = record.get("messageAttributes", {}).get(SLACK_RETRY_NUM_ATTRIBUTE, {}).get("stringValue")
+    if event_id and not EVENT_DEDUPLICATOR.claim(event_id, lease_seconds):
+        LOGGER.info("Skipping Slack event {} (retry {}) that was already handled".format(event_id, retry_num))
+        return True
+
+    try:
+        contextvars.Context().run(__handle_event, body, user_settings)
+    except Exception:
+        LOGGER.exception("Handling Slack event {} failed".format(event_id))
+        if event_id:
+            EVENT_DEDUPLICATOR.release(event_id)
+        return False
+    if event_id:
+        EVENT_DEDUPLICATOR.complete(event_id)
+    return True
+
+
+def __submit(fn, *args):
+    # work of a record runs in a copy of the record's context
+    return HANDLER_EXECUTOR.submit(contextvars.copy_context().run, fn, *args)
+
 
+def __handle_event(body, prefetched_user_settings=None):
+    """
+    Processes the Slack event and generates the response.
+    :param body: Slack event callback, the JSON body of the SQS record
+    :param prefetched_user_settings: dict of qualified user id to settings, users missing from it are read here
+    """
     # By default, treat the user request as coming from Eastern Standard Time.
     os.environ["TZ"] = "America/New_York"
     time.tzset()
-    LOGGER.debug("event={}".format(json.dumps(event, indent=4)))
-
-    bot_user_id = get_bot_user_id()
-    LOGGER.debug("bot_user_id={}".format(bot_user_id))
+    LOGGER.debug("event={}".format(json.dumps(body, indent=4)))
 
-    records = json.dumps(event.get("Records"))
-    body = json.loads(records)[0].get("body")
-    slack_event = json.loads(body).get("event")
+    slack_event = body.get("event")
     channel_id = slack_event.get("channel")
     user_id = slack_event.get("user")
     parent_ts = slack_event.get('event_ts')
     event_thread_ts = slack_event.get('thread_ts')
     SLACK_PARAMETER_VALIDATOR.set_channel_id(channel_id)
 
-    channel_type = get_channel_type(channel_id)
+    # stage 1: the bot identity and the channel type are needed by the filters below
+    bot_user_id_future = __submit(get_bot_user_id)
+    channel_type_future = __submit(get_channel_type, channel_id)
+    bot_user_id = bot_user_id_future.result()
+    LOGGER.debug("bot_user_id={}".format(bot_user_id))
+    channel_type = channel_type_future.result()
 
     thread_ts = get_thread_ts({"channel_type": channel_type, "parent_ts": parent_ts, 'thread_ts': event_thread_ts})
 
@@ -84,7 +236,32 @@ def lambda_handler(event, context):
         LOGGER.info("Skipping response generation due to message sent not in IM and Bot wasn't mentioned")
         return {"status": "success"}
 
-    user_settings: dict = get_user_settings(channel_id, user_id)
+    message = slack_event.get("text")
+    if validate_request_message_from_slack(channel_id=channel_id, message=message, thread_ts=thread_ts) is not True:
+        return {"status": "failure"}
+
+    # stage 2: acknowledge the message right away, settings, user and history lookups only depend on the event and
+    # run concurrently with the placeholder post
+    command = is_command(message, bot_user_id)
+    processing_future = None
+    if not command:
+        processing_future = __submit(send_chat, channel_id, THINKING_FACE, thread_ts)
+    prefetched_settings = (prefetched_user_settings or {}).get(qualified_user_id(channel_id, user_id))
+    user_settings_future = __submit(get_user_settings, channel_id, user_id) if prefetched_settings is None else None
+    user_future = __submit(get_user_from_userid, user_id)
+    conversation_history_future: Optional[Future] = None
+    thread_summary_future = None
+    is_thread = channel_type != 'im' and event_thread_ts
+    if not command:
+        if is_thread:
+            conversation_history_future = __submit(get_thread_replies, channel_id, thread_ts)
+            thread_summary_future = __submit(THREAD_SUMMARY_STORE.get, channel_id, thread_ts)
+        else:
+            conversation_history_future = __submit(get_conversation_history, channel_id, 5)
+
+    # the settings are only read here if they were not prefetched
+    user_settings = (cast(dict, prefetched_settings) if user_settings_future is None
+                     else user_settings_future.result())
     model_id = user_settings.get('model_id')
     model_attr = get_model(model_id)
     mode = user_settings.get('mode')
@@ -92,24 +269,28 @@ def lambda_handler(event, context):
         user_settings.get('last_disclaimer_date', str(DEFAULT_LAST_DISCLAIMER_DATE)), '%Y-%m-%d').date()
     days_elapsed = date.today() - last_disclaimer_date
     # send disclaimer at least once a day
+    save_settings_future = None
     if days_elapsed.days > 0:
+        # keep the disclaimer below the placeholder
+        if processing_future is not None:
+            processing_future.result()
         send_chat(
             channel_id,
             DISCLAIMER,
             thread_ts
         )
-        save_settings(channel_id, user_id, model_id, mode)
+        save_settings_future = __submit(save_last_disclaimer_date, channel_id, user_id, user_settings)
 
-    login = get_user_from_userid(user_id).get('user').get('name')
+    login = user_future.result().get('user').get('name')
     # if not validate_slack_user(channel_id, login, 'user', user_settings.get('model_id'), thread_ts=thread_ts):
     #      return {"status": "failure"}
 
-    message = slack_event.get("text")
-    if validate_request_message_from_slack(channel_id=channel_id, message=message, thread_ts=thread_ts) is not True:
-        return {"status": "failure"}
+    # the disclaimer date must be saved before settings commands read and rewrite the settings item
+    if save_settings_future is not None:
+        save_settings_future.result()
 
-    command_handler_response = handle_command(channel_id, user_id, message, bot_user_id, thread_ts)
-    if command_handler_response:
+    if command:
+        command_handler_response = handle_command(channel_id, user_id, message, bot_user_id, thread_ts)
         LOGGER.info("Command {} processed with response {}".format(message, command_handler_response))
         return command_handler_response
 
@@ -117,16 +298,33 @@ def lambda_handler(event, context):
     report_slack_request_message_size_bytes(bedrock_invoker_metadata=bedrock_invoker_metadata,
                                             size_bytes=len(message.encode('utf-8')))
 
-    conversation_history = (
-        get_thread_replies(channel_id, thread_ts)
-        if channel_type != 'im' and event_thread_ts
-        else get_conversation_history(channel_id, 5)
-    )
+    # the placeholder is posted and the history fetched for every message that is not a command
+    processing_slack_api_response = cast(Future, processing_future).result()
+    LOGGER.debug("processing message response: {}".format(processing_slack_api_response))
+    processing_ts = processing_slack_api_response.get("ts")
+    SLACK_PARAMETER_VALIDATOR.set_disclaimer_ts(processing_ts)
+
+    # the placeholder may have been posted before the history was read, it is no turn of the conversation
+    conversation_history = [message for message in cast(Future, conversation_history_future).result()
+                            if message.ts != processing_ts and message.msg != THINKING_FACE]
+    # long threads are sent as the summary of the older turns plus the turns after its watermark
+    thread_summary = thread_summary_future.result() if thread_summary_future is not None else None
 
     payload = generate_payload(
-        conversation_history, bot_user_id, model_attr, mode
+        get_recent_messages(conversation_history, thread_summary), bot_user_id, model_attr, mode,
+        thread_summary.summary if thread_summary is not None else None
     )
     LOGGER.debug("Channel Type - {}; Payload={}".format(channel_type, json.dumps(payload, indent=4)))
 
-    invoke_bedrock_streaming(bedrock_invoker_metadata, payload, thread_ts)
+    # folding a long thread does not change this response, it runs while the response streams
+    summary_future = None
+    if is_thread and needs_summary(conversation_history, thread_summary):
+        summary_future = __submit(summarize_thread, channel_id, thread_ts, conversation_history, thread_summary,
+                                  bot_user_id)
+
+    invoke_bedrock_streaming(bedrock_invoker_metadata, payload, thread_ts, processing_ts)
+
+    # the invocation must not end, and freeze the worker, before the summary is stored
+    if summary_future is not None:
+        summary_future.result()
     return {"status": "success"}
@@ -0,0 +1,86 @@
+import os
+import threading
+from typing import Any, Dict, Tuple
+
+import boto3
+from botocore.config import Config
+
+from amazon_bedrock_ai_slack_app_lambda.helpers.logging import LOGGER
+
+# botocore configuration per service. Bedrock streams can stay open for minutes, the other services are on the
+# request path and should fail fast.
+SERVICE_CONFIGS = {
+    "bedrock-runtime": Config(
+        max_pool_connections=20,
+        connect_timeout=5,
+        read_timeout=300,
+        retries={"max_attempts": 2, "mode": "standard"},
+    ),
+    "comprehend": Config(
+        max_pool_connections=20,
+        connect_timeout=3,
+        read_timeout=10,
+        retries={"max_attempts": 3, "mode": "adaptive"},
+    ),
+    "dynamodb": Config(
+        max_pool_connections=20,
+        connect_timeout=2,
+        read_timeout=5,
+        retries={"max_attempts": 3, "mode": "standard"},
+    ),
+    "secretsmanager": Config(
+        max_pool_connections=5,
+        connect_timeout=2,
+        read_timeout=5,
+        retries={"max_attempts": 3, "mode": "standard"},
+    ),
+    "cloudwatch": Config(
+        max_pool_connections=5,
+        connect_timeout=2,
+        read_timeout=10,
+        retries={"max_attempts": 3, "mode": "standard"},
+    ),
+}
+
+__CLIENTS: Dict[Tuple[str, str], Any] = {}
+__CLIENTS_LOCK = threading.Lock()
+__SESSION = None
+
+
+def get_client(service_name, region_name=None):
+    """
+    Returns the boto3 client for the service, creating it on first use. Clients are cached per service and region
+    for the life of the Lambda container, so endpoint resolution, service model loading and credential lookup
+    happen once instead of on every call.
+
+    :param service_name: boto3 service name, e.g. comprehend
+    :param region_name: region, defaults to AWS_REGION
+    :return: the shared boto3 client
+    """
+    global __SESSION
+    region_name = region_name or os.getenv('AWS_REGION', default='us-west-2')
+    key = (service_name, region_name)
+    client = __CLIENTS.get(key)
+    if client is None:
+        # boto3 sessions are not thread safe, clients are created under the lock
+        with __CLIENTS_LOCK:
+            client = __CLIENTS.get(key)
+            if client is None:
+                if __SESSION is None:
+                    __SESSION = boto3.session.Session()
+                client = __SESSION.client(service_name=service_name, region_name=region_name,
+                                          config=SERVICE_CONFIGS.get(service_name))
+                __CLIENTS[key] = client
+                LOGGER.debug("Created boto3 client for {} in {}".format(service_name, region_name))
+    return client
+
+
+def clear_clients():
+    """
+    Drops every cached client, e.g. for tests.
+    :return: None
+    """
+    global __SESSION
+    with __CLIENTS_LOCK:
+        __CLIENTS.clear()
+        __SESSION = None
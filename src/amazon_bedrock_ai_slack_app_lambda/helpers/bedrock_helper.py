@@ -1,15 +1,21 @@
+import contextvars
 import json
-import os
 import threading
 import time
+from typing import NamedTuple, Optional
 
-import boto3
-
+from amazon_bedrock_ai_slack_app_lambda.helpers.aws_clients import get_client
 from amazon_bedrock_ai_slack_app_lambda.helpers.comprehend_helper import (
+    IncrementalPiiRedactor,
     detect_and_redact_pii,
+    detect_and_redact_pii_concurrently,
     remove_unwanted_text_from_llm_response,
 )
 from amazon_bedrock_ai_slack_app_lambda.helpers.constants import (
+    BEDROCK_CONVERSE_BACKEND,
+    FIRST_UPDATE_DELAY_SECONDS,
+    MAX_UPDATE_TIME_DELAY_SECONDS,
+    STREAMING_UPDATE_TIMEOUT_SECONDS,
     THINKING_FACE,
     UPDATE_TIME_DELAY_SECONDS,
 )
@@ -23,8 +29,10 @@ from amazon_bedrock_ai_slack_app_lambda.helpers.metrics_publisher import (
     report_bedrock_invoke_model_latency_first_chunk,
     report_bedrock_invoke_model_response_size_bytes,
     report_bedrock_invoke_model_response_status,
+    report_bedrock_token_usage,
     report_comprehend_pii_metrics,
 )
+from amazon_bedrock_ai_slack_app_lambda.helpers.model_helper import get_model_by_bedrock_id
 from amazon_bedrock_ai_slack_app_lambda.helpers.slack_helper import send_chat, update_chat
 from amazon_bedrock_ai_slack_app_lambda.helpers.time_utils import StopWatch
 from amazon_bedrock_ai_slack_app_lambda.validation.request_response_validator import (
@@ -46,6 +54,50 @@ class ResponseTracker:
         self.uid = uid
         self.message = message
         self.status = status
+        self.__version = 0
+        self.__condition = threading.Condition()
+
+    def append(self, text):
+        """
+        Called by the producer for every decoded chunk; wakes up the Slack message updater.
+        :param text: text delta from the bedrock response stream
+        :return: None
+        """
+        with self.__condition:
+            self.message += text
+            self.__version += 1
+            self.__condition.notify_all()
+
+    def complete(self):
+        """
+        Marks the end of the stream; wakes up the Slack message updater for the final flush.
+        :return: None
+        """
+        with self.__condition:
+            self.status = True
+            self.__condition.notify_all()
+
+    def wait_for_update(self, seen_version, timeout):
+        """
+        Blocks until text newer than seen_version was appended, the stream completed or the timeout elapsed.
+        :param seen_version: version returned by the previous call, 0 initially
+        :param timeout: maximum seconds to wait
+        :return: tuple (version, message, status)
+        """
+        with self.__condition:
+            self.__condition.wait_for(lambda: self.__version != seen_version or self.status, timeout)
+            return self.__version, self.message, self.status
+
+    def wait_for_completion(self, timeout):
+        """
+        Blocks until the stream completed or the timeout elapsed, letting text deltas accumulate meanwhile.
+        :param timeout: maximum seconds to wait
+        :return: tuple (version, message, status)
+        """
+        with self.__condition:
+            if timeout > 0:
+                self.__condition.wait_for(lambda: self.status, timeout)
+            return self.__version, self.message, self.status
 
 
 def invoke_bedrock(payload):
@@ -55,8 +107,7 @@ def invoke_bedrock(payload):
 
     :return: A dictionary containing the status code and completion from the Bedrock model response.
     """
-    bedrock_runtime = boto3.client(service_name="bedrock-runtime",
-                                   region_name=os.getenv('AWS_REGION', default='us-west-2'))
+    bedrock_runtime = get_client("bedrock-runtime")
 
     LOGGER.info("Making bedrock call with prompt: {}".format(payload.get("body")))
 
@@ -80,41 +131,44 @@ def invoke_bedrock(payload):
         }
 
 
-def invoke_bedrock_streaming(bedrock_invoker_metadata, payload, thread_ts=None):
+def invoke_bedrock_streaming(bedrock_invoker_metadata, payload, thread_ts=None, processing_ts=None):
     """
     Invoke a Bedrock model with the given prompt.
 
+    :param processing_ts: ts of the placeholder message the response is streamed into; posted here if None
     :return: None
     """
     response_tracker = ResponseTracker("", "", False)
-    processing_slack_api_response = send_chat(
-        bedrock_invoker_metadata.channel_id,
-        THINKING_FACE,
-        thread_ts
-    )
-
     model_id = bedrock_invoker_metadata.model_id
 
-    processing_slack_api_response = json.loads(processing_slack_api_response.decode("UTF-8"))
-    LOGGER.debug("disclaimer response: {}".format(processing_slack_api_response))
-    processing_ts = processing_slack_api_response.get("ts")
-    SLACK_PARAMETER_VALIDATOR.set_disclaimer_ts(processing_ts)
+    if processing_ts is None:
+        processing_slack_api_response = send_chat(
+            bedrock_invoker_metadata.channel_id,
+            THINKING_FACE,
+            thread_ts
+        )
+        LOGGER.debug("disclaimer response: {}".format(processing_slack_api_response))
+        processing_ts = processing_slack_api_response.get("ts")
+        SLACK_PARAMETER_VALIDATOR.set_disclaimer_ts(processing_ts)
 
     # call comprehend to validate the payload for PII and redact if needed
-    body = json.loads(payload["body"])
-    if model_id == 'anthropic.claude-3-sonnet-20240229-v1:0':
-        un_allowed_pii_entities = set()
-        messages = body.get('messages')
-        for msg in messages:
-            redacted_msg, un_allowed_pii_entities_tmp = detect_and_redact_pii(msg.get('content'))
-            msg['content'] = redacted_msg
-            un_allowed_pii_entities.update(un_allowed_pii_entities_tmp)
+    if payload.get("backend") == BEDROCK_CONVERSE_BACKEND:
+        un_allowed_pii_entities = __redact_converse_request(payload)
     else:
-        prompt = body["prompt"]
-        redacted_prompt, un_allowed_pii_entities = detect_and_redact_pii(prompt)
-        body["prompt"] = redacted_prompt
-
-    payload["body"] = json.dumps(body)
+        body = json.loads(payload["body"])
+        if model_id == 'anthropic.claude-3-sonnet-20240229-v1:0':
+            un_allowed_pii_entities = set()
+            messages = body.get('messages')
+            redacted_messages = detect_and_redact_pii_concurrently([msg.get('content') for msg in messages])
+            for msg, (redacted_msg, un_allowed_pii_entities_tmp) in zip(messages, redacted_messages):
+                msg['content'] = redacted_msg
+                un_allowed_pii_entities.update(un_allowed_pii_entities_tmp)
+        else:
+            prompt = body["prompt"]
+            redacted_prompt, un_allowed_pii_entities = detect_and_redact_pii(prompt)
+            body["prompt"] = redacted_prompt
+
+        payload["body"] = json.dumps(body)
 
     if len(un_allowed_pii_entities) > 0:
         # publish metrics for comprehend PII detection
@@ -125,10 +179,10 @@ def invoke_bedrock_streaming(bedrock_invoker_metadata, payload, thread_ts=None):
         # publish metrics for comprehend PII detection
         report_comprehend_pii_metrics(True, False)
 
-    # Asynchronously generate response
+    # Asynchronously generate response, in a copy of the context holding the request's SLACK_PARAMETER_VALIDATOR state
     generate_response_thread = threading.Thread(
-        target=__generate_response,
-        args={},
+        target=contextvars.copy_context().run,
+        args=(__generate_response,),
         kwargs={"bedrock_invoker_metadata": bedrock_invoker_metadata, "payload": payload, "response_tracker": response_tracker, "thread_ts": thread_ts},
     )
     generate_response_thread.start()
@@ -136,40 +190,94 @@ def invoke_bedrock_streaming(bedrock_invoker_metadata, payload, thread_ts=None):
                                       parent_ts=processing_ts)
 
 
+def __redact_converse_request(payload):
+    """
+    Redacts the text blocks of the messages and of the system prompt of a Converse request in place.
+    :param payload: payload of a model with the Converse backend
+    :return: set of the PII entities that the slack app cannot process
+    """
+    blocks = [block for message in payload.get("messages", []) for block in message.get("content", [])
+              if "text" in block]
+    blocks += [block for block in payload.get("system", []) if "text" in block]
+    un_allowed_pii_entities = set()
+    redacted_texts = detect_and_redact_pii_concurrently([block["text"] for block in blocks])
+    for block, (redacted_text, un_allowed_pii_entities_tmp) in zip(blocks, redacted_texts):
+        block["text"] = redacted_text
+        un_allowed_pii_entities.update(un_allowed_pii_entities_tmp)
+    return un_allowed_pii_entities
+
+
 def __update_message_until_completion(response_tracker, bedrock_invoker_metadata, parent_ts):
     """
-    Every n seconds, update the Slack message until status is complete.
+    Update the Slack message whenever the response tracker signals new text, until the stream is complete.
+    Text deltas are coalesced: the first text is flushed after FIRST_UPDATE_DELAY_SECONDS, later updates are sent
+    at most every UPDATE_TIME_DELAY_SECONDS (backing off while Slack rate limits) and the end of the stream is
+    flushed immediately. Unchanged text does not call Slack.
+    PII is redacted incrementally while streaming and with one full pass at the end of the stream; the PII warning
+    and metric are published once per response.
     :param response_tracker: the ResponseTracker object for synchronization
     :param bedrock_invoker_metadata: the channel id
     :param parent_ts: parent time stamp of the response message which needs to be updated with the message
     :return: None
     """
+    deadline = time.monotonic() + STREAMING_UPDATE_TIMEOUT_SECONDS
+    update_interval: float = UPDATE_TIME_DELAY_SECONDS
+    last_update_time = None
+    last_sent_message = None
+    version = 0
     status = False
-    counter = 0
-    while (status is False) and (counter < 500):
-        time.sleep(UPDATE_TIME_DELAY_SECONDS)
-        status = response_tracker.status
-        counter += 1
-        LOGGER.debug("counter value is {}. Message={}".format(counter, str(response_tracker.message)))
-        if response_tracker.message:
+    pii_redactor = IncrementalPiiRedactor()
+    pii_warning_sent = False
+    while status is False:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            LOGGER.error("Response stream did not complete within {} seconds".format(STREAMING_UPDATE_TIMEOUT_SECONDS))
+            return False
+
+        version, message, status = response_tracker.wait_for_update(version, remaining)
+        if not status:
+            # debounce: let more text accumulate unless the stream ends first
+            next_update_time = (time.monotonic() + FIRST_UPDATE_DELAY_SECONDS if last_update_time is None
+                                else last_update_time + update_interval)
+            version, message, status = response_tracker.wait_for_completion(
+                min(next_update_time, deadline) - time.monotonic())
+
+        LOGGER.debug("version is {}. Message={}".format(version, str(message)))
+        if message:
             # validate the response from bedrock
             if validate_response_from_bedrock(channel_id=bedrock_invoker_metadata.channel_id,
-                                              message=response_tracker.message, thread_ts=parent_ts) is not True:
+                                              message=message, thread_ts=parent_ts) is not True:
                 return False
 
             # call comprehend to validate the payload for PII
-            redacted_message, un_allowed_pii_entities = detect_and_redact_pii(response_tracker.message)
-            clean_message = remove_unwanted_text_from_llm_response(redacted_message)
-            if len(un_allowed_pii_entities) > 0:
-                # publish metrics for comprehend PII detection
-                report_comprehend_pii_metrics(False, True)
+            if status:
+                redacted_message, un_allowed_pii_entities = pii_redactor.finalize(message)
+            else:
+                redacted_message = pii_redactor.update(message)
+                un_allowed_pii_entities = pii_redactor.un_allowed_entities
+            if len(un_allowed_pii_entities) > 0 and not pii_warning_sent:
                 comprehend_pii_error_message(bedrock_invoker_metadata.channel_id, un_allowed_pii_entities,
                                              is_request=False, thread_ts=parent_ts)
-            else:
-                # publish metrics for comprehend PII detection
-                report_comprehend_pii_metrics(False, False)
+                pii_warning_sent = True
 
-            update_chat(bedrock_invoker_metadata, clean_message, parent_ts)
+            clean_message = remove_unwanted_text_from_llm_response(redacted_message)
+            if clean_message and clean_message != last_sent_message:
+                response = update_chat(bedrock_invoker_metadata, clean_message, parent_ts)
+                last_update_time = time.monotonic()
+                if response.get("error") == "ratelimited":
+                    update_interval = min(update_interval * 2, MAX_UPDATE_TIME_DELAY_SECONDS)
+                    LOGGER.info("Slack rate limited chat.update, next update in {} seconds".format(update_interval))
+                    if status:
+                        # the final text must not be lost, retry once the interval passed
+                        status = False
+                        time.sleep(update_interval)
+                else:
+                    last_sent_message = clean_message
+                    update_interval = max(UPDATE_TIME_DELAY_SECONDS, update_interval / 2)
+
+    # publish metrics for comprehend PII detection
+    report_comprehend_pii_metrics(False, len(pii_redactor.un_allowed_entities) > 0)
+    return True
 
 
 def __generate_response(bedrock_invoker_metadata, payload, response_tracker, thread_ts=None):
@@ -180,58 +288,117 @@ def __generate_response(bedrock_invoker_metadata, payload, response_tracker, thr
     :param response_tracker: the ResponseTracker object for synchronization
     :return: None
     """
-    bedrock_runtime = boto3.client(service_name="bedrock-runtime",
-                                   region_name=os.getenv('AWS_REGION', default='us-west-2'))
+    bedrock_runtime = get_client("bedrock-runtime")
 
     stop_watch_first_chunk = StopWatch().start()
     stop_watch_last_chunk = StopWatch().start()
     LOGGER.debug("Making streaming bedrock call with : {}".format(payload))
     try:
-        api_response = bedrock_runtime.invoke_model_with_response_stream(
-            body=payload.get("body"),
-            modelId=payload.get("model_id"),
-            accept=payload.get("accept"),
-            contentType=payload.get("content_type"),
-        )
+        if payload.get("backend") == BEDROCK_CONVERSE_BACKEND:
+            request = {"modelId": payload.get("model_id"), "messages": payload.get("messages"),
+                       "inferenceConfig": payload.get("inferenceConfig")}
+            if payload.get("system"):
+                request["system"] = payload.get("system")
+            api_response = bedrock_runtime.converse_stream(**request)
+            deltas = __decode_converse_stream(api_response.get("stream"))
+        else:
+            api_response = bedrock_runtime.invoke_model_with_response_stream(
+                body=payload.get("body"),
+                modelId=payload.get("model_id"),
+                accept=payload.get("accept"),
+                contentType=payload.get("content_type"),
+            )
+            deltas = __decode_invoke_model_stream(api_response.get("body"),
+                                                  get_model_by_bedrock_id(payload.get("model_id")).decode_chunk)
         LOGGER.debug("Api response of streaming bedrock call: {}".format(api_response))
     except Exception as exception:
-        bedrock_streaming_api_call_error(bedrock_invoker_metadata.channel_id, exception, thread_ts)
-        report_bedrock_invoke_model_response_status(bedrock_invoker_metadata=bedrock_invoker_metadata,
-                                                    response_status=False,
-                                                    exception_name=exception.__class__.__name__)
-    else:
-        stream = api_response.get("body")
-        model_name = payload.get("model_name")
+        __report_streaming_error(bedrock_invoker_metadata, response_tracker, exception, thread_ts)
+        return
 
-    if stream:
-        for chunk_count, event in enumerate(stream, start=1):
-            chunk = event.get("chunk")
-            if chunk:
+    first_text = True
+    usage = None
+    stop_reason = None
+    try:
+        for delta in deltas:
+            if delta.text:
                 # record first chunk time
-                if chunk_count == 1:
+                if first_text:
+                    first_text = False
                     report_bedrock_invoke_model_latency_first_chunk(
                         bedrock_invoker_metadata=bedrock_invoker_metadata,
                         latency_first_chunk_ms=stop_watch_first_chunk.stop().get_elapsed_time()
                     )
+                response_tracker.append(delta.text)
+            if delta.stop_reason:
+                stop_reason = delta.stop_reason
+            if delta.input_tokens is not None:
+                usage = (delta.input_tokens, delta.output_tokens)
+    except Exception as exception:
+        # the stream failed partway, e.g. with an error event; the text received so far stays posted
+        __report_streaming_error(bedrock_invoker_metadata, response_tracker, exception, thread_ts)
+        return
+    finally:
+        response_tracker.complete()
+
+    LOGGER.info("Bedrock response stopped with reason {}, token usage (input, output): {}".format(stop_reason, usage))
+    report_bedrock_invoke_model_latency(bedrock_invoker_metadata=bedrock_invoker_metadata,
+                                        latency_ms=stop_watch_last_chunk.stop().get_elapsed_time())
+    report_bedrock_invoke_model_response_status(bedrock_invoker_metadata=bedrock_invoker_metadata,
+                                                response_status=True,
+                                                bedrock_request_id=api_response["ResponseMetadata"]["RequestId"])
+    report_bedrock_invoke_model_response_size_bytes(bedrock_invoker_metadata=bedrock_invoker_metadata,
+                                                    size_bytes=len(response_tracker.message.encode('utf-8')))
+    if usage is not None:
+        report_bedrock_token_usage(bedrock_invoker_metadata, *usage)
+
+
+def __report_streaming_error(bedrock_invoker_metadata, response_tracker, exception, thread_ts):
+    # unblock the Slack message updater before reporting the error
+    response_tracker.complete()
+    bedrock_streaming_api_call_error(bedrock_invoker_metadata.channel_id, exception, thread_ts)
+    report_bedrock_invoke_model_response_status(bedrock_invoker_metadata=bedrock_invoker_metadata,
+                                                response_status=False,
+                                                exception_name=exception.__class__.__name__)
+
+
+class StreamDelta(NamedTuple):
+    """
+    Event of a streamed model response, the same for every model and backend.
+    """
+    text: str = ""
+    stop_reason: Optional[str] = None
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+
 
-                chunk_obj = json.loads(chunk.get("bytes").decode())
-
-                if model_name in ["claude-v2", "claude-instant"]:
-                    chunk_part = chunk_obj.get("completion")
-                elif model_name == "claude-v3-sonet":
-                    chunk_part = chunk_obj.get("delta", {}).get("text", '')
-                elif model_name == "titan":
-                    chunk_part = chunk_obj.get("outputText")
-                elif model_name == "llama2":
-                    chunk_part = chunk_obj.get("generation")
-
-                response_tracker.message += chunk_part
-
-        response_tracker.status = True
-        report_bedrock_invoke_model_latency(bedrock_invoker_metadata=bedrock_invoker_metadata,
-                                            latency_ms=stop_watch_last_chunk.stop().get_elapsed_time())
-        report_bedrock_invoke_model_response_status(bedrock_invoker_metadata=bedrock_invoker_metadata,
-                                                    response_status=True,
-                                                    bedrock_request_id=api_response["ResponseMetadata"]["RequestId"])
-        report_bedrock_invoke_model_response_size_bytes(bedrock_invoker_metadata=bedrock_invoker_metadata,
-                                                        size_bytes=len(response_tracker.message.encode('utf-8')))
+def __decode_invoke_model_stream(stream, decode_chunk):
+    """
+    :param stream: event stream of InvokeModelWithResponseStream
+    :param decode_chunk: function of the ModelDescriptor returning the text of a decoded chunk
+    :return: generator of StreamDelta
+    """
+    for event in stream:
+        chunk = event.get("chunk")
+        if chunk:
+            chunk_obj = json.loads(chunk.get("bytes").decode())
+            yield StreamDelta(text=decode_chunk(chunk_obj) or "")
+            # Bedrock adds the invocation metrics to the last chunk
+            metrics = chunk_obj.get("amazon-bedrock-invocationMetrics")
+            if metrics:
+                yield StreamDelta(input_tokens=metrics.get("inputTokenCount"),
+                                  output_tokens=metrics.get("outputTokenCount"))
+
+
+def __decode_converse_stream(stream):
+    """
+    :param stream: event stream of ConverseStream, botocore parses its events into dicts
+    :return: generator of StreamDelta
+    """
+    for event in stream:
+        if "contentBlockDelta" in event:
+            yield StreamDelta(text=event["contentBlockDelta"].get("delta", {}).get("text", ""))
+        elif "messageStop" in event:
+            yield StreamDelta(stop_reason=event["messageStop"].get("stopReason"))
+        elif "metadata" in event:
+            usage = event["metadata"].get("usage", {})
+            yield StreamDelta(input_tokens=usage.get("inputTokens"), output_tokens=usage.get("outputTokens"))
@@ -1,6 +1,5 @@
 from amazon_bedrock_ai_slack_app_lambda.helpers.argument_parser import CustomArgumentParser
 from amazon_bedrock_ai_slack_app_lambda.helpers.constants import (
-    AVAILABLE_MODELS,
     AVAILABLE_MODES,
     DEFAULT_MODE,
     DEFAULT_MODEL,
@@ -12,11 +11,14 @@ from amazon_bedrock_ai_slack_app_lambda.helpers.error_message_helper import (
     settings_parse_error,
 )
 from amazon_bedrock_ai_slack_app_lambda.helpers.logging import LOGGER
+from amazon_bedrock_ai_slack_app_lambda.helpers.model_helper import AVAILABLE_MODELS
 from amazon_bedrock_ai_slack_app_lambda.helpers.slack_helper import send_chat
 from amazon_bedrock_ai_slack_app_lambda.helpers.utils import validate_and_set
 from amazon_bedrock_ai_slack_app_lambda.validation.user_validator import validate_slack_user  # noqa: F401
 
 
+COMMANDS = ("help", "settings", "list-settings", "new-conversation")
+
 SETTINGS_PARSER = CustomArgumentParser(description='parse settings')
 SETTINGS_PARSER.add_argument('--model-id', metavar='N', type=str, nargs='?', default=None, help='Bedrock model id')
 SETTINGS_PARSER.add_argument('--mode', metavar='N', type=str, nargs='?', default=None, help='Chat mode')
@@ -33,12 +35,7 @@ def handle_command(channel_id, user_id, message, bot_user_id, thread_ts=None):
     :return: A dictionary indicating the status of the command execution; None if the message was not a command
     """
 
-    if message.startswith(f'<@{bot_user_id}>'):
-        message_parts = message.split(' ')
-        if len(message_parts) > 1:
-            message = ' '.join(message_parts[1:]).strip()
-        else:
-            message = ''
+    message = __strip_bot_mention(message, bot_user_id)
 
     if message.startswith("help"):
         return __help_command(channel_id, thread_ts)
@@ -53,6 +50,26 @@ def handle_command(channel_id, user_id, message, bot_user_id, thread_ts=None):
         return None
 
 
+def is_command(message, bot_user_id):
+    """
+    Checks locally, without calling Slack or DynamoDB, whether handle_command would process the message.
+
+    :param message: Slack Incomming Message.
+    :param bot_user_id: the bot user id, a leading mention of the bot is ignored
+    :return: True if the message is a command
+    """
+    return __strip_bot_mention(message, bot_user_id).startswith(COMMANDS)
+
+
+def __strip_bot_mention(message, bot_user_id):
+    if message.startswith(f'<@{bot_user_id}>'):
+        message_parts = message.split(' ')
+        if len(message_parts) > 1:
+            return ' '.join(message_parts[1:]).strip()
+        return ''
+    return message
+
+
 def __new_conversation(channel_id):
     send_chat(
         channel_id,
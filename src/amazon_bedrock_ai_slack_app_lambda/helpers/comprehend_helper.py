@@ -1,9 +1,21 @@
-import boto3
-import os
 import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
-from amazon_bedrock_ai_slack_app_lambda.helpers.constants import ALLOWED_COMPREHEND_PII_ENTITIES
+from amazon_bedrock_ai_slack_app_lambda.helpers.constants import (
+    ALLOWED_COMPREHEND_PII_ENTITIES,
+    PII_DETECTION_MAX_WORKERS,
+    PII_SCAN_MIN_SEGMENT_CHARS,
+    PII_SCAN_OVERLAP_CHARS,
+)
 from amazon_bedrock_ai_slack_app_lambda.helpers.logging import LOGGER
+from amazon_bedrock_ai_slack_app_lambda.helpers.pii_cache import PII_SCAN_CACHE
+from amazon_bedrock_ai_slack_app_lambda.helpers.pii_detector import PII_DETECTOR
+
+SENTENCE_BOUNDARY_PATTERN = re.compile(r"[.!?\n]\s+|\n")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+PII_DETECTION_EXECUTOR = ThreadPoolExecutor(max_workers=PII_DETECTION_MAX_WORKERS, thread_name_prefix="comprehend")
 
 
 class ComprehendHelper:
@@ -18,32 +30,117 @@ class ComprehendHelper:
         self.message = message
 
 
-def detect_and_redact_pii(message):
-    comprehend_client = boto3.client(service_name="comprehend",
-                                     region_name=os.getenv('AWS_REGION', default='us-west-2'))
+class IncrementalPiiRedactor:
+    """
+    Redacts a streamed response incrementally so that Comprehend only sees every part of the response about once
+    instead of the whole accumulated text on every Slack update.
 
+    Text is scanned in segments cut at sentence (or whitespace) boundaries. Of every scanned segment only the part
+    before the last PII_SCAN_OVERLAP_CHARS is frozen into the redacted prefix; the tail is scanned again together
+    with the next segment, so an entity spanning the cut is seen whole. Text after the last cut is held back until
+    it is scanned. At the end of the stream finalize() runs one full pass over the complete response.
     """
-        Detects personally identifiable information (PII) in a document. PII can be
-        things like names, account numbers, or addresses.
+    def __init__(self, min_segment_chars=PII_SCAN_MIN_SEGMENT_CHARS, overlap_chars=PII_SCAN_OVERLAP_CHARS):
+        self.min_segment_chars = min_segment_chars
+        self.overlap_chars = overlap_chars
+        self.un_allowed_entities = set()
+        self.__redacted_prefix = ""
+        self.__committed_offset = 0
+        self.__redacted_pending = ""
+        self.__scanned_offset = 0
+        self.__final_message = None
+        self.__final_redacted_message = None
 
-        :param message: The text message to inspect.
-        :return: tuple (redacted prompt, The list of PII entities that the slack app cannot process)
+    def update(self, message):
+        """
+        Scans the newly finalized text of the growing response.
+        :param message: the accumulated response so far
+        :return: the redacted response up to the last scanned boundary
         """
-    LOGGER.debug("comprehend.detect_pii_entities message = {}".format(message))
-    response = comprehend_client.detect_pii_entities(
-        Text=message, LanguageCode='en'
-    )
-    LOGGER.debug("comprehend.detect_pii_entities response = {}".format(response))
+        cut = self.__find_boundary(message, self.__committed_offset, len(message))
+        if cut is None or cut - self.__scanned_offset < self.min_segment_chars:
+            return self.__redacted_prefix + self.__redacted_pending
+
+        segment = message[self.__committed_offset:cut]
+        entities = detect_pii_entities(segment)
+
+        # keep the overlap tail pending, but never split an entity between the frozen prefix and the tail
+        commit = self.__find_boundary(segment, 0, max(0, len(segment) - self.overlap_chars))
+        if commit is None:
+            commit = max(0, len(segment) - self.overlap_chars)
+        for entity in entities:
+            if entity["BeginOffset"] < commit < entity["EndOffset"]:
+                commit = entity["BeginOffset"]
+
+        committed_entities = [entity for entity in entities if entity["EndOffset"] <= commit]
+        pending_entities = [dict(entity, BeginOffset=entity["BeginOffset"] - commit,
+                                 EndOffset=entity["EndOffset"] - commit)
+                            for entity in entities if entity["BeginOffset"] >= commit]
+        redacted_committed, un_allowed_committed = redact_pii_entities(segment[:commit], committed_entities)
+        redacted_pending, un_allowed_pending = redact_pii_entities(segment[commit:], pending_entities)
+
+        self.__redacted_prefix += redacted_committed
+        self.__committed_offset += commit
+        self.__redacted_pending = redacted_pending
+        self.__scanned_offset = cut
+        self.un_allowed_entities.update(un_allowed_committed, un_allowed_pending)
+        return self.__redacted_prefix + self.__redacted_pending
+
+    def finalize(self, message):
+        """
+        Full pass over the complete response at the end of the stream.
+        :param message: the complete response
+        :return: tuple (redacted response, The list of PII entities that the slack app cannot process)
+        """
+        if message != self.__final_message:
+            self.__final_redacted_message, un_allowed_entities = detect_and_redact_pii(message)
+            self.__final_message = message
+            self.un_allowed_entities.update(un_allowed_entities)
+        return self.__final_redacted_message, self.un_allowed_entities
+
+    @staticmethod
+    def __find_boundary(text, start, end):
+        """
+        :return: the offset right after the last sentence boundary in text[start:end], falling back to the last
+        whitespace; None if there is neither
+        """
+        boundary = None
+        for match in SENTENCE_BOUNDARY_PATTERN.finditer(text, start, end):
+            boundary = match.end()
+        if boundary is None:
+            for match in WHITESPACE_PATTERN.finditer(text, start, end):
+                boundary = match.end()
+        return boundary
+
+
+def detect_pii_entities(message):
+    """
+    Detects personally identifiable information (PII) in a document. PII can be
+    things like names, account numbers, or addresses.
+
+    :param message: The text message to inspect.
+    :return: The list of entities (Type, BeginOffset, EndOffset, Score) found by the configured PII_DETECTOR
+    """
+    return PII_DETECTOR.detect(message)
+
 
+def redact_pii_entities(message, entities):
+    """
+    Replaces the entities that are not in ALLOWED_COMPREHEND_PII_ENTITIES with <REDACTED>.
+
+    :param message: The text message the entities were detected in.
+    :param entities: Comprehend entities sorted by offset.
+    :return: tuple (redacted prompt, The list of PII entities that the slack app cannot process)
+    """
     # Extract just the types into a list
-    entities = []
-    for entity in response['Entities']:
-        entities.append(entity['Type'])
-    un_allowed_entities = set(entities).difference(ALLOWED_COMPREHEND_PII_ENTITIES)
+    entity_types = []
+    for entity in entities:
+        entity_types.append(entity['Type'])
+    un_allowed_entities = set(entity_types).difference(ALLOWED_COMPREHEND_PII_ENTITIES)
 
     redacted = []
     prev_end = 0
-    for entity in response['Entities']:
+    for entity in entities:
         if entity['Type'] in ALLOWED_COMPREHEND_PII_ENTITIES:
             continue
         redacted.append(message[prev_end:entity["BeginOffset"]])
@@ -57,6 +154,47 @@ def detect_and_redact_pii(message):
     return redacted_text, un_allowed_entities
 
 
+def detect_and_redact_pii(message):
+    """
+    Detects personally identifiable information (PII) in a document and redacts the entities the slack app
+    cannot process.
+
+    :param message: The text message to inspect.
+    :return: tuple (redacted prompt, The list of PII entities that the slack app cannot process)
+    """
+    return redact_pii_entities(message, detect_pii_entities(message))
+
+
+def detect_and_redact_pii_concurrently(messages):
+    """
+    Redacts every message like detect_and_redact_pii. With a remote detector, messages already scanned (e.g. the
+    earlier messages of a thread) are served from the PII scan cache; the others are sent to Comprehend concurrently
+    on a bounded thread pool and cached.
+
+    :param messages: The text messages to inspect.
+    :return: list of tuples (redacted message, The list of PII entities that the slack app cannot process), in the
+    order of messages
+    """
+    if not PII_DETECTOR.remote:
+        # local detection is cheaper than a cache lookup
+        return [detect_and_redact_pii(message) for message in messages]
+
+    entities_by_message = PII_SCAN_CACHE.get_many(messages)
+    missing = list(OrderedDict.fromkeys(message for message in messages if message not in entities_by_message))
+    LOGGER.debug("PII scan cache hits: {}, misses: {}".format(len(messages) - len(missing), len(missing)))
+
+    if missing:
+        if len(missing) == 1:
+            detected = [detect_pii_entities(missing[0])]
+        else:
+            detected = list(PII_DETECTION_EXECUTOR.map(detect_pii_entities, missing))
+        scanned = dict(zip(missing, detected))
+        entities_by_message.update(scanned)
+        PII_SCAN_CACHE.put_many(scanned)
+
+    return [redact_pii_entities(message, entities_by_message[message]) for message in messages]
+
+
 def remove_unwanted_text_from_llm_response(message):
     # remove all text between the <function> </function> from bedrock response
     clean_message = re.sub(r"<function>.*?</function>", "", message)
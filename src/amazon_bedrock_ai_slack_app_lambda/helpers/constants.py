@@ -5,17 +5,79 @@ DEFAULT_MODEL = "anthropic.claude-3-sonnet-20240229-v1:0"
 DEFAULT_MODE = 'assistant'
 DEFAULT_LAST_DISCLAIMER_DATE = date(2020, 1, 1)
 
-AVAILABLE_MODELS = ["anthropic.claude-v2:1", "anthropic.claude-instant-v1", 'anthropic.claude-3-sonnet-20240229-v1:0']
 AVAILABLE_MODES = ["assistant", "passthrough"]
 
+# Bedrock Runtime APIs a model is invoked with: InvokeModelWithResponseStream with a model specific body, or the model
+# independent ConverseStream
+BEDROCK_INVOKE_MODEL_BACKEND = "invoke_model"
+BEDROCK_CONVERSE_BACKEND = "converse"
+
 ALLOWED_COMPREHEND_PII_ENTITIES = ['USERNAME', 'URL', 'NAME', 'DATE_TIME', 'AGE', 'ADDRESS']
 
+# Incremental PII redaction of streamed responses: new text is sent to Comprehend once at least
+# PII_SCAN_MIN_SEGMENT_CHARS are available up to a sentence/whitespace boundary. The last PII_SCAN_OVERLAP_CHARS of
+# every scanned segment are scanned again with the next one so entities spanning the boundary are caught.
+PII_SCAN_MIN_SEGMENT_CHARS = 200
+PII_SCAN_OVERLAP_CHARS = 64
+
+# Comprehend DetectPiiEntities accepts documents of up to 100 KB of UTF-8 text; longer texts are scanned in chunks.
+# Messages of a conversation are scanned concurrently by up to PII_DETECTION_MAX_WORKERS threads.
+COMPREHEND_MAX_DOCUMENT_BYTES = 100000
+PII_DETECTION_MAX_WORKERS = 8
+
+# Prompt context: the newest turns are packed into the context_token_budget of the model (its max_context_tokens if
+# unset), minus the max_token_sample reserved for the output. Tokens are estimated locally from the UTF-8 length
+# (English averages ~4 bytes per token, the estimate errs on the high side) plus the role markers of every turn.
+BYTES_PER_TOKEN = 3.5
+MESSAGE_OVERHEAD_TOKENS = 4
+PROMPT_OVERHEAD_TOKENS = 32
+
+# Rolling thread summaries: once a thread has more than SUMMARY_TRIGGER_TURNS turns after the summary watermark, all
+# but the newest SUMMARY_KEEP_RECENT_TURNS are folded into the summary by SUMMARY_MODEL after the response is posted
+SUMMARY_TRIGGER_TURNS = 24
+SUMMARY_KEEP_RECENT_TURNS = 8
+SUMMARY_MODEL = "anthropic.claude-instant-v1"
+SUMMARY_MAX_TOKENS = 500
+SUMMARY_PROMPT = (
+    "\n\nHuman: Update the summary of a Slack conversation between users and an AI assistant with the new messages "
+    "below. Keep the facts, decisions, open questions and user preferences needed to continue the conversation, "
+    "drop greetings and repetitions, and answer with the updated summary only, in at most 300 words."
+    "\n<summary>\n{summary}\n</summary>\n<new_messages>{messages}\n</new_messages>\n\nAssistant:"
+)
+
 MODE_DESCRIPTION = {
     "assistant": "Mode uses Assistant Prompt that is passed to the model which sets model behaviour",
     "passthrough": "Only Human inputs are passed to model"
 }
 
+# Streaming Slack message updates: the first text is flushed after a short debounce, later updates at most every
+# UPDATE_TIME_DELAY_SECONDS. The interval backs off up to MAX_UPDATE_TIME_DELAY_SECONDS when Slack rate limits.
 UPDATE_TIME_DELAY_SECONDS = 1
+FIRST_UPDATE_DELAY_SECONDS = 0.2
+MAX_UPDATE_TIME_DELAY_SECONDS = 8
+STREAMING_UPDATE_TIMEOUT_SECONDS = 500
+
+# Process level caches for Slack metadata that rarely changes
+BOT_IDENTITY_CACHE_TTL_SECONDS = 3600
+CHANNEL_INFO_CACHE_TTL_SECONDS = 900
+CHANNEL_INFO_CACHE_MAX_SIZE = 512
+USER_INFO_CACHE_TTL_SECONDS = 900
+USER_INFO_CACHE_MAX_SIZE = 512
+# Users whose settings are cached per container
+SETTINGS_CACHE_MAX_SIZE = 1024
+
+# Slack history pagination: messages per conversations.replies/history page and maximum pages per fetch
+SLACK_HISTORY_PAGE_SIZE = 200
+SLACK_HISTORY_MAX_PAGES = 50
+
+# Worker threads for the concurrent Slack/DynamoDB lookups made by the handler before generation
+HANDLER_MAX_WORKERS = 8
+# SQS records of a batch handled concurrently
+SQS_RECORD_MAX_WORKERS = 5
+
+# DynamoDB batch requests: attempts for the unprocessed keys/items, with exponential backoff from the base delay
+DYNAMODB_BATCH_MAX_ATTEMPTS = 4
+DYNAMODB_BATCH_BACKOFF_SECONDS = 0.05
 
 SYSTEM_MESSAGES = ("new-conversation", "list-settings", "settings", "help", "[SYSTEM]", "[ERROR]")
 PII_SYSTEM_MESSAGE_TAG = "[WARNING] PII DATA DETECTED!!"
@@ -0,0 +1,77 @@
+import math
+
+from amazon_bedrock_ai_slack_app_lambda.helpers.constants import (
+    BYTES_PER_TOKEN,
+    DEFAULT_ASSISTANT_PROMPT,
+    MESSAGE_OVERHEAD_TOKENS,
+    PROMPT_OVERHEAD_TOKENS,
+)
+from amazon_bedrock_ai_slack_app_lambda.helpers.logging import LOGGER
+
+
+def estimate_tokens(text):
+    """
+    Approximate the number of tokens of a text without a tokenizer.
+
+    :param text: text sent to the model
+    :return: estimated token count, on the high side for English text
+    """
+    return math.ceil(len(text.encode('utf-8')) / BYTES_PER_TOKEN)
+
+
+def get_input_token_budget(model, mode):
+    """
+    :param model: ModelDescriptor from model_helper.get_model
+    :param mode: 'assistant' adds the assistant prompt to every request
+    :return: number of input tokens available for the conversation turns
+    """
+    budget = model.max_context_tokens
+    if model.context_token_budget is not None:
+        budget = min(budget, model.context_token_budget)
+    budget -= model.max_token_sample + PROMPT_OVERHEAD_TOKENS
+    if mode == 'assistant':
+        budget -= estimate_tokens(DEFAULT_ASSISTANT_PROMPT)
+    return budget
+
+
+def build_context(messages, bot_user_id, model, mode, summary=None):
+    """
+    Keep the newest turns of a conversation that fit into the input token budget of the model.
+
+    The newest message is always kept. Older messages are added from newest to oldest until the next one does not
+    fit; that message and everything before it are dropped. System messages are kept but not counted, the prompt
+    builders skip them. The context never starts with a bot turn, Claude 3 requires the first message to be a user
+    message.
+
+    :param messages: A list of SlackMessage records sorted by timestamp.
+    :param bot_user_id: The user ID of the bot.
+    :param model: ModelDescriptor from model_helper.get_model
+    :param mode: 'assistant' or 'passthrough'
+    :param summary: summary of the earlier conversation sent with the turns, or None
+    :return: the newest SlackMessage records that fit into the budget
+    """
+    if not messages:
+        return messages
+
+    budget = get_input_token_budget(model, mode)
+    if summary:
+        budget -= estimate_tokens(summary)
+    used = estimate_tokens(messages[-1].msg) + MESSAGE_OVERHEAD_TOKENS
+    start = len(messages) - 1
+    while start > 0:
+        message = messages[start - 1]
+        if not message.is_system_message:
+            tokens = estimate_tokens(message.msg) + MESSAGE_OVERHEAD_TOKENS
+            if used + tokens > budget:
+                break
+            used += tokens
+        start -= 1
+
+    if start == 0:
+        return messages
+
+    while start < len(messages) - 1 and (messages[start].user == bot_user_id or messages[start].is_system_message):
+        start += 1
+    LOGGER.info("Dropped {} of {} messages to fit the context of {} into {} tokens".format(
+        start, len(messages), model.name, budget))
+    return messages[start:]
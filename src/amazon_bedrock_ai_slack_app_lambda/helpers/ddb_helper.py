@@ -2,84 +2,318 @@ from datetime import date
 
 import json
 import os
+import random
+import time
 
-import boto3
+from botocore.exceptions import ClientError
 
+from amazon_bedrock_ai_slack_app_lambda.helpers.aws_clients import get_client
 from amazon_bedrock_ai_slack_app_lambda.helpers.constants import (
     DEFAULT_MODE,
     DEFAULT_MODEL,
+    DYNAMODB_BATCH_BACKOFF_SECONDS,
+    DYNAMODB_BATCH_MAX_ATTEMPTS,
     METADATA_TABLE_NAME, DEFAULT_LAST_DISCLAIMER_DATE,
+    SETTINGS_CACHE_MAX_SIZE,
 )
 from amazon_bedrock_ai_slack_app_lambda.helpers.payload_generator import DEFAULT_ASSISTANT_PROMPT
 from amazon_bedrock_ai_slack_app_lambda.helpers.logging import LOGGER
+from amazon_bedrock_ai_slack_app_lambda.helpers.ttl_cache import TtlLruCache
 
-dynamodb = boto3.client("dynamodb", region_name=os.getenv('AWS_REGION', default='us-west-2'))
+# Environment variable overriding the lifetime of the in-memory settings cache, 0 disables the cache. Settings changed
+# through another container are picked up once the entry expires.
+SETTINGS_CACHE_TTL_SECONDS = "SETTINGS_CACHE_TTL_SECONDS"
+DEFAULT_SETTINGS_CACHE_TTL_SECONDS = 60
 
+# Write-through cache of the settings per qualified user id, the values are never handed out, only copies of them
+SETTINGS_CACHE = TtlLruCache(
+    max_size=SETTINGS_CACHE_MAX_SIZE,
+    ttl_seconds=int(os.getenv(SETTINGS_CACHE_TTL_SECONDS, DEFAULT_SETTINGS_CACHE_TTL_SECONDS)),
+)
 
-def save_settings(channel_id, user_id, model_id, mode, last_disclaimer_date=date.today()):
-    """
-    TODO: Handle exceptions
+# Settings items hold one string attribute per setting and the schema version. Items without a schema version are
+# legacy items holding the settings as a JSON string attribute, they are rewritten to the current schema on their next
+# update.
+SETTINGS_SCHEMA_VERSION = 2
+SETTINGS_ATTRIBUTES = ('model_id', 'mode', 'last_disclaimer_date')
+SCHEMA_VERSION_ATTRIBUTE = 'schema_version'
+LEGACY_SETTINGS_ATTRIBUTE = 'settings'
+
+# Attempts of a settings update that raced with the migration of a legacy item
+MAX_SETTINGS_UPDATE_ATTEMPTS = 2
+
+# Keys per BatchGetItem request
+BATCH_GET_MAX_KEYS = 100
+
+
+def save_settings(channel_id, user_id, model_id, mode, last_disclaimer_date=None):
     """
-    get_item_response = dynamodb.get_item(
-        TableName=METADATA_TABLE_NAME,
-        Key={
-            'qualified_user_id': {'S': "{}/{}".format(channel_id, user_id)}
-        }
-    )
-    LOGGER.info("GetItem response: {}".format(get_item_response))
+    Saves the model and mode of the user with a single write.
 
-    item = get_item_response.get("Item")
-    if item:
-        settings = json.loads(get_item_response["Item"]["settings"]["S"])
-    else:
-        settings = {}
+    :param channel_id: Slack Channel_id.
+    :param user_id: Slack User_id.
+    :param model_id: model to use
+    :param mode: mode to use
+    :param last_disclaimer_date: date the disclaimer was last sent, defaults to today
+    :return: the saved settings, None if the item kept changing concurrently
+    """
+    return __update_settings(channel_id, user_id, {
+        'model_id': model_id,
+        'mode': mode,
+        'last_disclaimer_date': str(last_disclaimer_date or date.today()),
+    })
 
-    settings.update({'model_id': model_id})
-    settings.update({'mode': mode})
-    settings.update({'last_disclaimer_date': str(last_disclaimer_date)})
 
-    LOGGER.info("Writing settings: {}".format(settings))
+def save_last_disclaimer_date(channel_id, user_id, user_settings, last_disclaimer_date=None):
+    """
+    Records that the disclaimer was sent by setting the date alone, without reading the settings.
 
-    put_item_response = dynamodb.put_item(
-        TableName=METADATA_TABLE_NAME,
-        Item={
-            'qualified_user_id': {'S': "{}/{}".format(channel_id, user_id)},
-            'settings': {'S': json.dumps(settings)}
-        }
-    )
-    LOGGER.info(put_item_response)
-    return settings
+    :param channel_id: Slack Channel_id.
+    :param user_id: Slack User_id.
+    :param user_settings: settings returned by get_user_settings, written in full if the item is a legacy item
+    :param last_disclaimer_date: date the disclaimer was sent, defaults to today
+    :return: the saved settings, None if the item kept changing concurrently
+    """
+    return __update_settings(channel_id, user_id, {'last_disclaimer_date': str(last_disclaimer_date or date.today())},
+                             user_settings)
 
 
 def get_user_settings(channel_id, user_id) -> dict:
     """
-    Get user settings from DynamoDB.
+    Get user settings from the settings cache or DynamoDB. Default settings are created for new users.
 
     :param channel_id (str): The channel ID.
     :param user_id (str): The user ID.
 
     Returns:
-        str: dict with user settings
-
-    Raises:
-        Exception: If an error occurs during DynamoDB operation.
+        str: dict with user settings, the defaults if DynamoDB failed
     """
+    key = qualified_user_id(channel_id, user_id)
+    settings = SETTINGS_CACHE.get(key)
+    if settings is not None:
+        return dict(settings)
+
     try:
-        get_item_response = dynamodb.get_item(
-            TableName=METADATA_TABLE_NAME,
-            Key={
-                'qualified_user_id': {'S': "{}/{}".format(channel_id, user_id)}
-            }
-        )
-        item = get_item_response.get("Item")
-        if item:
-            settings = json.loads(get_item_response["Item"]["settings"]["S"])
+        settings = __read_settings(key)
+        if settings is not None:
             LOGGER.info("user_settings_found:={}".format(json.dumps(settings, indent=4)))
-            return settings
         else:
-            response = save_settings(channel_id, user_id, DEFAULT_MODEL, DEFAULT_MODE, DEFAULT_LAST_DISCLAIMER_DATE)
-            LOGGER.info("defaulting_user_settings:={}".format(json.dumps(response, indent=4)))
-            return response
+            settings = __create_default_settings(key)
+            LOGGER.info("defaulting_user_settings:={}".format(json.dumps(settings, indent=4)))
+        SETTINGS_CACHE.put(key, settings)
+        return dict(settings)
     except Exception as e:
         LOGGER.error(f"An error occurred getting user settings: {e}")
         return {'model_id': DEFAULT_MODEL, 'mode': DEFAULT_MODE, 'assistant_prompt': DEFAULT_ASSISTANT_PROMPT}
+
+
+def get_users_settings(channel_user_ids) -> dict:
+    """
+    Batch counterpart of get_user_settings: reads the settings that are not cached with BatchGetItem and creates the
+    default settings of new users with the conditional write of get_user_settings, so settings a concurrent request
+    wrote in the meantime are kept.
+
+    :param channel_user_ids: iterable of tuples (channel id, user id)
+    :return: dict of qualified user id to settings. Users missing from it, e.g. after a DynamoDB failure, are left to
+    get_user_settings.
+    """
+    settings_by_key = {}
+    keys = []
+    for channel_id, user_id in channel_user_ids:
+        key = qualified_user_id(channel_id, user_id)
+        if key in settings_by_key or key in keys:
+            continue
+        settings = SETTINGS_CACHE.get(key)
+        if settings is not None:
+            settings_by_key[key] = dict(settings)
+        else:
+            keys.append(key)
+
+    try:
+        unread_keys = set()
+        for start in range(0, len(keys), BATCH_GET_MAX_KEYS):
+            read_settings, unprocessed_keys = __batch_read_settings(keys[start:start + BATCH_GET_MAX_KEYS])
+            for key, settings in read_settings.items():
+                SETTINGS_CACHE.put(key, settings)
+                settings_by_key[key] = dict(settings)
+            unread_keys.update(unprocessed_keys)
+
+        for key in keys:
+            if key in settings_by_key or key in unread_keys:
+                continue
+            settings = __create_default_settings(key)
+            if settings is not None:
+                SETTINGS_CACHE.put(key, settings)
+                settings_by_key[key] = dict(settings)
+    except Exception as e:
+        LOGGER.error("An error occurred getting the settings of {} users: {}".format(len(keys), e))
+    return settings_by_key
+
+
+def qualified_user_id(channel_id, user_id):
+    """
+    :param channel_id: Slack Channel_id.
+    :param user_id: Slack User_id.
+    :return: partition key of the settings of the user in the channel
+    """
+    return "{}/{}".format(channel_id, user_id)
+
+
+def __update_settings(channel_id, user_id, changes, settings=None):
+    """
+    Sets the changed attributes only, concurrent updates of other settings are kept. Legacy and missing items are
+    written in full, merging the changes into the current settings.
+
+    :param changes: dict of the settings to change
+    :param settings: current settings, None to take them from the cache or DynamoDB if a legacy item is migrated
+    :return: the saved settings, None if the item kept changing concurrently
+    """
+    key = qualified_user_id(channel_id, user_id)
+    for _ in range(MAX_SETTINGS_UPDATE_ATTEMPTS):
+        LOGGER.info("Writing settings: {}".format(changes))
+        try:
+            new_settings = __set_attributes(key, changes)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                raise
+            if settings is None:
+                settings = SETTINGS_CACHE.get(key)
+            if settings is None:
+                settings = __read_settings(key)
+            new_settings = __default_settings()
+            new_settings.update({name: value for name, value in (settings or {}).items() if name in new_settings})
+            new_settings.update(changes)
+            LOGGER.info("Migrating the settings of {} to schema version {}".format(key, SETTINGS_SCHEMA_VERSION))
+            try:
+                __write_settings(key, new_settings, 'attribute_not_exists({})'.format(SCHEMA_VERSION_ATTRIBUTE))
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                    raise
+                # a concurrent request migrated the item, the changed attributes can be set now
+                settings = None
+                continue
+        SETTINGS_CACHE.put(key, new_settings)
+        return dict(new_settings)
+
+    LOGGER.error("Could not update the settings of {}, they kept changing concurrently".format(key))
+    return None
+
+
+def __default_settings():
+    return {
+        'model_id': DEFAULT_MODEL,
+        'mode': DEFAULT_MODE,
+        'last_disclaimer_date': str(DEFAULT_LAST_DISCLAIMER_DATE),
+    }
+
+
+def __create_default_settings(key):
+    settings = __default_settings()
+    try:
+        __write_settings(key, settings, 'attribute_not_exists(qualified_user_id)')
+        return settings
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+            raise
+    # a concurrent request of the user created the settings first
+    return __read_settings(key)
+
+
+def __batch_read_settings(keys):
+    """
+    :param keys: at most BATCH_GET_MAX_KEYS qualified user ids
+    :return: tuple (dict of qualified user id to the stored settings, keys DynamoDB left unprocessed)
+    """
+    attributes = ('qualified_user_id',) + SETTINGS_ATTRIBUTES + (SCHEMA_VERSION_ATTRIBUTE, LEGACY_SETTINGS_ATTRIBUTE)
+    request_items: dict = {METADATA_TABLE_NAME: {
+        'Keys': [{'qualified_user_id': {'S': key}} for key in keys],
+        'ProjectionExpression': ', '.join('#{}'.format(name) for name in attributes),
+        'ExpressionAttributeNames': {'#{}'.format(name): name for name in attributes},
+        # missing items are created with defaults, a stale read must not report an item written a moment ago
+        'ConsistentRead': True,
+    }}
+    settings_by_key = {}
+    for attempt in range(DYNAMODB_BATCH_MAX_ATTEMPTS):
+        if attempt:
+            __backoff(attempt)
+        response = get_client("dynamodb").batch_get_item(RequestItems=request_items)
+        for item in response.get('Responses', {}).get(METADATA_TABLE_NAME, []):
+            settings_by_key[item['qualified_user_id']['S']] = __parse_settings(item)
+        request_items = response.get('UnprocessedKeys')
+        if not request_items:
+            return settings_by_key, []
+    LOGGER.info("{} settings were left unprocessed by BatchGetItem".format(
+        len(request_items[METADATA_TABLE_NAME]['Keys'])))
+    return settings_by_key, [key['qualified_user_id']['S'] for key in request_items[METADATA_TABLE_NAME]['Keys']]
+
+
+def __backoff(attempt):
+    # exponential backoff with full jitter
+    time.sleep(random.uniform(0, DYNAMODB_BATCH_BACKOFF_SECONDS * 2 ** attempt))
+
+
+def __read_settings(key):
+    """
+    :return: the stored settings, None if the user has none
+    """
+    attributes = SETTINGS_ATTRIBUTES + (SCHEMA_VERSION_ATTRIBUTE, LEGACY_SETTINGS_ATTRIBUTE)
+    item = get_client("dynamodb").get_item(
+        TableName=METADATA_TABLE_NAME,
+        Key={'qualified_user_id': {'S': key}},
+        ProjectionExpression=', '.join('#{}'.format(name) for name in attributes),
+        ExpressionAttributeNames={'#{}'.format(name): name for name in attributes},
+    ).get("Item")
+    return __parse_settings(item) if item else None
+
+
+def __parse_settings(item):
+    if SCHEMA_VERSION_ATTRIBUTE not in item:
+        return json.loads(item[LEGACY_SETTINGS_ATTRIBUTE]['S'])
+    return {name: item[name]['S'] for name in SETTINGS_ATTRIBUTES if name in item}
+
+
+def __set_attributes(key, changes):
+    """
+    Sets the changed settings of an item with the current schema.
+
+    :return: the settings of the updated item
+    :raise ClientError: ConditionalCheckFailedException if the item is missing or a legacy item
+    """
+    names = {'#{}'.format(name): name for name in changes}
+    names['#' + SCHEMA_VERSION_ATTRIBUTE] = SCHEMA_VERSION_ATTRIBUTE
+    values = {':{}'.format(name): {'S': value} for name, value in changes.items()}
+    values[':' + SCHEMA_VERSION_ATTRIBUTE] = {'N': str(SETTINGS_SCHEMA_VERSION)}
+    attributes = get_client("dynamodb").update_item(
+        TableName=METADATA_TABLE_NAME,
+        Key={'qualified_user_id': {'S': key}},
+        UpdateExpression='SET ' + ', '.join('#{0} = :{0}'.format(name) for name in changes),
+        ConditionExpression='#{0} = :{0}'.format(SCHEMA_VERSION_ATTRIBUTE),
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values,
+        ReturnValues='ALL_NEW',
+    )['Attributes']
+    return __parse_settings(attributes)
+
+
+def __write_settings(key, settings, condition):
+    """
+    Writes every setting with the current schema version and removes the legacy JSON attribute.
+
+    :param condition: ConditionExpression the item must satisfy
+    :raise ClientError: ConditionalCheckFailedException if the condition failed
+    """
+    names = {'#{}'.format(name): name for name in SETTINGS_ATTRIBUTES}
+    names['#' + SCHEMA_VERSION_ATTRIBUTE] = SCHEMA_VERSION_ATTRIBUTE
+    names['#' + LEGACY_SETTINGS_ATTRIBUTE] = LEGACY_SETTINGS_ATTRIBUTE
+    values = {':{}'.format(name): {'S': settings[name]} for name in SETTINGS_ATTRIBUTES}
+    values[':' + SCHEMA_VERSION_ATTRIBUTE] = {'N': str(SETTINGS_SCHEMA_VERSION)}
+    get_client("dynamodb").update_item(
+        TableName=METADATA_TABLE_NAME,
+        Key={'qualified_user_id': {'S': key}},
+        UpdateExpression='SET {} REMOVE #{}'.format(
+            ', '.join('#{0} = :{0}'.format(name) for name in SETTINGS_ATTRIBUTES + (SCHEMA_VERSION_ATTRIBUTE,)),
+            LEGACY_SETTINGS_ATTRIBUTE),
+        ConditionExpression=condition,
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values,
+    )
@@ -1,10 +1,10 @@
 from amazon_bedrock_ai_slack_app_lambda.helpers.constants import (
-    AVAILABLE_MODELS,
     AVAILABLE_MODES,
     PII_ERROR_MESSAGE,
     PII_SYSTEM_MESSAGE_TAG,
 )
 from amazon_bedrock_ai_slack_app_lambda.helpers.logging import LOGGER
+from amazon_bedrock_ai_slack_app_lambda.helpers.model_helper import AVAILABLE_MODELS
 from amazon_bedrock_ai_slack_app_lambda.helpers.slack_helper import send_chat
 
 
@@ -0,0 +1,123 @@
+import os
+import time
+
+from botocore.exceptions import ClientError
+
+from amazon_bedrock_ai_slack_app_lambda.helpers.aws_clients import get_client
+from amazon_bedrock_ai_slack_app_lambda.helpers.logging import LOGGER
+from amazon_bedrock_ai_slack_app_lambda.helpers.ttl_cache import TtlLruCache
+
+# Environment variables configuring the Slack event deduplication. Without a table name events are only
+# deduplicated within the container.
+EVENT_DEDUPE_TABLE_NAME = "EVENT_DEDUPE_TABLE_NAME"
+EVENT_DEDUPE_TTL_SECONDS = "EVENT_DEDUPE_TTL_SECONDS"
+EVENT_DEDUPE_LEASE_SECONDS = "EVENT_DEDUPE_LEASE_SECONDS"
+
+# Slack retries an event up to three times within about five minutes
+DEFAULT_EVENT_DEDUPE_TTL_SECONDS = 3600
+# An event in progress is claimed for at most the maximum Lambda timeout, unless the caller knows its deadline
+DEFAULT_EVENT_DEDUPE_LEASE_SECONDS = 900
+EVENT_DEDUPE_CACHE_MAX_SIZE = 4096
+
+# Partition key, and the DynamoDB TTL attribute (epoch seconds) the table must be configured with
+EVENT_ID_ATTRIBUTE = "event_id"
+EXPIRES_AT_ATTRIBUTE = "expires_at"
+
+
+class EventDeduplicator:
+    """
+    Claims Slack event ids so an event delivered more than once (Slack retries, SQS redeliveries) is answered once.
+
+    An event is claimed with a short lease before it is processed and the claim is kept for the full TTL once it is
+    completed. A claim is released when processing fails, so the redelivered record is processed again; when the
+    invocation times out or crashes the lease expires instead. Claims are kept in memory and, with a table name, in
+    a DynamoDB table with a TTL attribute through a conditional put, which also deduplicates between containers.
+    Table failures are logged and the event is processed, a duplicate answer is better than none.
+    """
+    def __init__(self, table_name=None, ttl_seconds=DEFAULT_EVENT_DEDUPE_TTL_SECONDS,
+                 lease_seconds=DEFAULT_EVENT_DEDUPE_LEASE_SECONDS,
+                 dynamodb_client_provider=lambda: get_client("dynamodb")):
+        """
+        :param table_name: DynamoDB table, None to only deduplicate in memory
+        :param ttl_seconds: time during which a completed event id is treated as a duplicate
+        :param lease_seconds: time during which an event in progress is treated as a duplicate
+        :param dynamodb_client_provider: function returning the DynamoDB client
+        """
+        self.table_name = table_name
+        self.ttl_seconds = ttl_seconds
+        self.lease_seconds = lease_seconds
+        self.__claims = TtlLruCache(max_size=EVENT_DEDUPE_CACHE_MAX_SIZE, ttl_seconds=ttl_seconds)
+        self.__dynamodb_client_provider = dynamodb_client_provider
+
+    def claim(self, event_id, lease_seconds=None):
+        """
+        :param event_id: Slack event id
+        :param lease_seconds: time the event is claimed for until it is completed, None for the default lease
+        :return: True if the event has to be processed, False if it was already claimed
+        """
+        # a timeout or crash of the invocation resets the container, so the claims in memory go with it
+        if not self.__claims.put_if_absent(event_id, True):
+            return False
+
+        if self.table_name:
+            now = int(time.time())
+            try:
+                self.__dynamodb_client_provider().put_item(
+                    TableName=self.table_name,
+                    Item={
+                        EVENT_ID_ATTRIBUTE: {'S': event_id},
+                        EXPIRES_AT_ATTRIBUTE: {'N': str(now + (lease_seconds or self.lease_seconds))},
+                    },
+                    # DynamoDB deletes expired items lazily
+                    ConditionExpression='attribute_not_exists({}) OR {} < :now'.format(
+                        EVENT_ID_ATTRIBUTE, EXPIRES_AT_ATTRIBUTE),
+                    ExpressionAttributeValues={':now': {'N': str(now)}},
+                )
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                    return False
+                LOGGER.error("Claiming Slack event {} failed: {}".format(event_id, e))
+            except Exception as e:
+                LOGGER.error("Claiming Slack event {} failed: {}".format(event_id, e))
+        return True
+
+    def complete(self, event_id):
+        """
+        Keeps the claim of an event that was processed for the full TTL.
+        :param event_id: Slack event id
+        :return: None
+        """
+        if self.table_name:
+            try:
+                self.__dynamodb_client_provider().put_item(
+                    TableName=self.table_name,
+                    Item={
+                        EVENT_ID_ATTRIBUTE: {'S': event_id},
+                        EXPIRES_AT_ATTRIBUTE: {'N': str(int(time.time()) + self.ttl_seconds)},
+                    },
+                )
+            except Exception as e:
+                LOGGER.error("Completing Slack event {} failed: {}".format(event_id, e))
+
+    def release(self, event_id):
+        """
+        Drops the claim of an event that failed, so it is processed again when it is redelivered.
+        :param event_id: Slack event id
+        :return: None
+        """
+        self.__claims.invalidate(event_id)
+        if self.table_name:
+            try:
+                self.__dynamodb_client_provider().delete_item(
+                    TableName=self.table_name,
+                    Key={EVENT_ID_ATTRIBUTE: {'S': event_id}},
+                )
+            except Exception as e:
+                LOGGER.error("Releasing Slack event {} failed: {}".format(event_id, e))
+
+
+EVENT_DEDUPLICATOR = EventDeduplicator(
+    table_name=os.getenv(EVENT_DEDUPE_TABLE_NAME),
+    ttl_seconds=int(os.getenv(EVENT_DEDUPE_TTL_SECONDS, DEFAULT_EVENT_DEDUPE_TTL_SECONDS)),
+    lease_seconds=int(os.getenv(EVENT_DEDUPE_LEASE_SECONDS, DEFAULT_EVENT_DEDUPE_LEASE_SECONDS)),
+)
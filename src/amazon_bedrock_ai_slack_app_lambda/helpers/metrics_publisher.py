@@ -1,14 +1,36 @@
 import os
 
-import boto3
-
+from amazon_bedrock_ai_slack_app_lambda.helpers.aws_clients import get_client
 from amazon_bedrock_ai_slack_app_lambda.helpers.bedroc_invoker_metadata import BedrockInvokerMetadata
 from amazon_bedrock_ai_slack_app_lambda.helpers.logging import LOGGER
-
-cloudwatch = boto3.client('cloudwatch', region_name=os.getenv('AWS_REGION', default='us-west-2'))
+from amazon_bedrock_ai_slack_app_lambda.helpers.metrics_sink import CloudWatchMetricsSink, EmfMetricsSink
 
 METRIC_NAMESPACE = "BedrockAiSlackApp"
 
+# Environment variable selecting how metrics are published: "cloudwatch" (PutMetricData) or "emf" (log lines)
+METRICS_BACKEND = "METRICS_BACKEND"
+METRICS_BACKEND_CLOUDWATCH = "cloudwatch"
+METRICS_BACKEND_EMF = "emf"
+
+
+def __create_metrics_sink():
+    if os.getenv(METRICS_BACKEND, METRICS_BACKEND_CLOUDWATCH).lower() == METRICS_BACKEND_EMF:
+        return EmfMetricsSink(METRIC_NAMESPACE)
+    return CloudWatchMetricsSink(METRIC_NAMESPACE, lambda: get_client("cloudwatch"))
+
+
+# Metrics are buffered for the invocation and published in batches, see flush_metrics
+METRICS_SINK = __create_metrics_sink()
+
+
+def flush_metrics():
+    """
+    Publishes the buffered metrics. Has to be called before the handler returns.
+
+    :return: True if metrics were published successfully, False otherwise
+    """
+    return METRICS_SINK.flush()
+
 
 def report_bedrock_invoke_model_response_status(bedrock_invoker_metadata: BedrockInvokerMetadata, response_status: bool,
                                                 bedrock_request_id="None", exception_name="None"):
@@ -23,7 +45,7 @@ def report_bedrock_invoke_model_response_status(bedrock_invoker_metadata: Bedroc
     :param bedrock_invoker_metadata: metadata
     :param response_status: True or False
     :param bedrock_request_id: request id for logging purposes to facilitate dive deep during security incidents
-    :return: True if metric was published successfully, False otherwise
+    :return: True if metric was buffered for publishing, False otherwise
 
     """
     metric_data_response_status_with_login = [{
@@ -61,17 +83,9 @@ def report_bedrock_invoke_model_response_status(bedrock_invoker_metadata: Bedroc
         'Value': 1
     }]
     LOGGER.debug("Metric data is {}".format(metric_data_response_status_with_login))
-    response = cloudwatch.put_metric_data(
-        Namespace=METRIC_NAMESPACE,
-        MetricData=metric_data_response_status_with_login
-    )
     # info log level for debuggability during security incidents as per Appsec recommendation
     LOGGER.info("CloudWatch metric reported: {} Bedrock request id is {}".format(metric_data_response_status_with_login,
                                                                                  bedrock_request_id))
-    LOGGER.info("CloudWatch metric response0: {} Bedrock request id is {}".format(response, bedrock_request_id))
-
-    if response['ResponseMetadata']['HTTPStatusCode'] != 200:
-        LOGGER.error("CloudWatch report_bedrock_response_status call failed")
 
     metric_data_response_status_aggregate_with_modelid_and_mode = [{
         'MetricName': 'BedrockInvokeModelResponseStatus',
@@ -95,14 +109,6 @@ def report_bedrock_invoke_model_response_status(bedrock_invoker_metadata: Bedroc
         ],
         'Value': 1
     }]
-    response = cloudwatch.put_metric_data(
-        Namespace=METRIC_NAMESPACE,
-        MetricData=metric_data_response_status_aggregate_with_modelid_and_mode
-    )
-    LOGGER.info("CloudWatch metric response1: {} Bedrock request id is {}".format(response, bedrock_request_id))
-
-    if response['ResponseMetadata']['HTTPStatusCode'] != 200:
-        LOGGER.error("CloudWatch report_bedrock_response_status call failed")
 
     metric_data_response_status_aggregate = [{
         'MetricName': 'BedrockInvokeModelResponseStatus',
@@ -118,21 +124,14 @@ def report_bedrock_invoke_model_response_status(bedrock_invoker_metadata: Bedroc
         ],
         'Value': 1
     }]
-    response = cloudwatch.put_metric_data(
-        Namespace=METRIC_NAMESPACE,
-        MetricData=metric_data_response_status_aggregate
-    )
 
     # info log level for debuggability during security incidents as per Appsec recommendation
     LOGGER.info("CloudWatch metric reported: {} Bedrock request id is {}".format(metric_data_response_status_aggregate,
                                                                                  bedrock_request_id))
-    LOGGER.info("CloudWatch metric response: {} Bedrock request id is {}".format(response, bedrock_request_id))
-
-    if response['ResponseMetadata']['HTTPStatusCode'] != 200:
-        LOGGER.error("CloudWatch report_bedrock_response_status call failed")
-        return False
 
-    return True
+    return METRICS_SINK.put(metric_data_response_status_with_login
+                            + metric_data_response_status_aggregate_with_modelid_and_mode
+                            + metric_data_response_status_aggregate)
 
 
 def report_bedrock_invoke_model_latency_first_chunk(bedrock_invoker_metadata: BedrockInvokerMetadata,
@@ -140,7 +139,7 @@ def report_bedrock_invoke_model_latency_first_chunk(bedrock_invoker_metadata: Be
     """
     Metric to record invoke model latency for the first chunk
 
-    :return: True if metric was published successfully, False otherwise
+    :return: True if metric was buffered for publishing, False otherwise
 
     """
     metric_data = [{
@@ -157,19 +156,9 @@ def report_bedrock_invoke_model_latency_first_chunk(bedrock_invoker_metadata: Be
         ],
         'Value': latency_first_chunk_ms
     }]
-    response = cloudwatch.put_metric_data(
-        Namespace=METRIC_NAMESPACE,
-        MetricData=metric_data
-    )
-
     LOGGER.debug("CloudWatch metric reported: {}".format(metric_data))
-    LOGGER.debug("CloudWatch metric response: {}".format(response))
-
-    if response['ResponseMetadata']['HTTPStatusCode'] != 200:
-        LOGGER.error("CloudWatch report_bedrock_response_status call failed")
-        return False
 
-    return True
+    return METRICS_SINK.put(metric_data)
 
 
 def report_bedrock_invoke_model_latency(bedrock_invoker_metadata: BedrockInvokerMetadata,
@@ -177,9 +166,7 @@ def report_bedrock_invoke_model_latency(bedrock_invoker_metadata: BedrockInvoker
     """
     Metric to record invoke model latency for the bedrock invoke model call up until the last byte is received.
 
-    :return: True if metric was published successfully, False otherwise
-
-    TODO: Catch errors appropriately and test this out
+    :return: True if metric was buffered for publishing, False otherwise
     """
     metric_data = [{
         'MetricName': 'BedrockInvokeModelResponseLatencyMs',
@@ -195,28 +182,16 @@ def report_bedrock_invoke_model_latency(bedrock_invoker_metadata: BedrockInvoker
         ],
         'Value': latency_ms
     }]
-    response = cloudwatch.put_metric_data(
-        Namespace=METRIC_NAMESPACE,
-        MetricData=metric_data
-    )
-
     LOGGER.debug("CloudWatch metric reported: {}".format(metric_data))
-    LOGGER.debug("CloudWatch metric response: {}".format(response))
 
-    if response['ResponseMetadata']['HTTPStatusCode'] != 200:
-        LOGGER.error("CloudWatch report_bedrock_response_status call failed")
-        return False
-
-    return True
+    return METRICS_SINK.put(metric_data)
 
 
 def report_slack_request_message_size_bytes(bedrock_invoker_metadata: BedrockInvokerMetadata, size_bytes):
     """
     Metric to record the Slack message size.
 
-    :return: True if metric was published successfully, False otherwise
-
-    TODO: Catch errors appropriately and test this out
+    :return: True if metric was buffered for publishing, False otherwise
     """
     metric_data = [{
         'MetricName': 'SlackRequestMessageSizeBytes',
@@ -232,28 +207,16 @@ def report_slack_request_message_size_bytes(bedrock_invoker_metadata: BedrockInv
         ],
         'Value': size_bytes
     }]
-    response = cloudwatch.put_metric_data(
-        Namespace=METRIC_NAMESPACE,
-        MetricData=metric_data
-    )
-
     LOGGER.debug("CloudWatch metric reported: {}".format(metric_data))
-    LOGGER.debug("CloudWatch metric response: {}".format(response))
 
-    if response['ResponseMetadata']['HTTPStatusCode'] != 200:
-        LOGGER.error("CloudWatch report_bedrock_response_status call failed")
-        return False
-
-    return True
+    return METRICS_SINK.put(metric_data)
 
 
 def report_bedrock_invoke_model_response_size_bytes(bedrock_invoker_metadata: BedrockInvokerMetadata, size_bytes):
     """
     Metric to record bedrock invoke model response size.
 
-    :return: True if metric was published successfully, False otherwise
-
-    TODO: Catch errors appropriately and test this out
+    :return: True if metric was buffered for publishing, False otherwise
     """
     metric_data = [{
         'MetricName': 'BedrockInvokeModelResponseMessageSizeBytes',
@@ -269,26 +232,41 @@ def report_bedrock_invoke_model_response_size_bytes(bedrock_invoker_metadata: Be
         ],
         'Value': size_bytes
     }]
-    response = cloudwatch.put_metric_data(
-        Namespace=METRIC_NAMESPACE,
-        MetricData=metric_data
-    )
-
     LOGGER.debug("CloudWatch metric reported: {}".format(metric_data))
-    LOGGER.debug("CloudWatch metric response: {}".format(response))
 
-    if response['ResponseMetadata']['HTTPStatusCode'] != 200:
-        LOGGER.error("CloudWatch report_bedrock_response_status call failed")
-        return False
+    return METRICS_SINK.put(metric_data)
+
 
-    return True
+def report_bedrock_token_usage(bedrock_invoker_metadata: BedrockInvokerMetadata, input_tokens, output_tokens):
+    """
+    Metric to record the input and output tokens Bedrock billed for a response.
+
+    :return: True if metric was buffered for publishing, False otherwise
+    """
+    dimensions = [
+        {
+            'Name': 'ModelId',
+            'Value': bedrock_invoker_metadata.model_id
+        },
+        {
+            'Name': 'Mode',
+            'Value': bedrock_invoker_metadata.mode
+        }
+    ]
+    metric_data = [
+        {'MetricName': 'BedrockInputTokens', 'Dimensions': dimensions, 'Value': input_tokens},
+        {'MetricName': 'BedrockOutputTokens', 'Dimensions': dimensions, 'Value': output_tokens},
+    ]
+    LOGGER.debug("CloudWatch metric reported: {}".format(metric_data))
+
+    return METRICS_SINK.put(metric_data)
 
 
 def report_comprehend_pii_metrics(is_request, is_detected):
     """
     Metric to record comprehend PII detection.
 
-    :return: True if metric was published successfully, False otherwise
+    :return: True if metric was buffered for publishing, False otherwise
 
     """
     if is_detected:
@@ -313,16 +291,30 @@ def report_comprehend_pii_metrics(is_request, is_detected):
                 'MetricName': 'ComprehendPIIDetectedInLLMResponse',
                 'Value': 0
             }]
-    response = cloudwatch.put_metric_data(
-        Namespace=METRIC_NAMESPACE,
-        MetricData=metric_data
-    )
-
     LOGGER.debug("CloudWatch metric reported: {}".format(metric_data))
-    LOGGER.debug("CloudWatch metric response: {}".format(response))
 
-    if response['ResponseMetadata']['HTTPStatusCode'] != 200:
-        LOGGER.error("CloudWatch report_comprehend_pii_metrics call failed")
-        return False
+    return METRICS_SINK.put(metric_data)
+
+
+def report_slack_rate_limiter_metrics(stats):
+    """
+    Metrics to record how much the Slack calls of the invocation were queued and throttled, per method family.
+
+    :param stats: counters from SlackRateLimiter.stats
+    :return: True if metric was buffered for publishing, False otherwise
+    """
+    metric_data = []
+    for prefix, counters in stats.items():
+        if not any(counters[name] for name in ("max_queue_depth", "waited_seconds", "throttled")):
+            continue
+        dimensions = [{'Name': 'ApiMethod', 'Value': prefix}]
+        metric_data.extend([
+            {'MetricName': 'SlackRequestQueueDepth', 'Dimensions': dimensions, 'Value': counters["max_queue_depth"]},
+            {'MetricName': 'SlackRateLimitWaitSeconds', 'Dimensions': dimensions, 'Value': counters["waited_seconds"]},
+            {'MetricName': 'SlackRateLimitedRequests', 'Dimensions': dimensions, 'Value': counters["throttled"]},
+        ])
+    if not metric_data:
+        return True
+    LOGGER.debug("CloudWatch metric reported: {}".format(metric_data))
 
-    return True
+    return METRICS_SINK.put(metric_data)
@@ -0,0 +1,273 @@
+import json
+import sys
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple
+
+from amazon_bedrock_ai_slack_app_lambda.helpers.logging import LOGGER
+
+# PutMetricData limits: datums per request and distinct values per datum
+MAX_DATUMS_PER_REQUEST = 1000
+MAX_VALUES_PER_DATUM = 150
+
+# Embedded Metric Format limits: metrics per document and values per metric
+MAX_EMF_METRICS_PER_DOCUMENT = 100
+MAX_EMF_VALUES_PER_METRIC = 100
+
+DEFAULT_MAX_BUFFERED_VALUES = 10000
+DEFAULT_FLUSH_THRESHOLD_VALUES = 500
+
+# EMF documents are whole lines of stdout, writes of concurrent flushes must not interleave
+EMF_STDOUT_LOCK = threading.Lock()
+
+
+class MetricsSink(ABC):
+    """
+    Buffers metric datums in memory and aggregates repeated datums (same metric name, dimensions and unit) into
+    a single datum with Values/Counts arrays.
+
+    The buffer is bounded: datums arriving while max_buffered_values distinct values are buffered are dropped and
+    counted. Subclasses publish the aggregated datums in publish().
+    """
+    def __init__(self, max_buffered_values=DEFAULT_MAX_BUFFERED_VALUES,
+                 flush_threshold_values=DEFAULT_FLUSH_THRESHOLD_VALUES, background_flush=True):
+        """
+        :param max_buffered_values: maximum number of distinct values held before datums are dropped
+        :param flush_threshold_values: buffered values that trigger a flush on the background thread
+        :param background_flush: False flushes only on explicit flush() calls
+        """
+        self.max_buffered_values = max_buffered_values
+        self.flush_threshold_values = flush_threshold_values
+        self.background_flush = background_flush
+        self.__buffer = OrderedDict()
+        self.__buffered_values = 0
+        self.__lock = threading.Lock()
+        self.__flush_lock = threading.Lock()
+        self.__flush_requested = threading.Event()
+        self.__flush_thread = None
+        self.__enqueued = 0
+        self.__dropped = 0
+        self.__published = 0
+        self.__failed = 0
+
+    def put(self, metric_data):
+        """
+        Enqueues metric datums in the PutMetricData format ('MetricName', optional 'Dimensions', 'Value', 'Unit').
+        :param metric_data: list of metric datums
+        :return: True if every datum was buffered, False if any was dropped
+        """
+        timestamp = datetime.now(timezone.utc)
+        all_buffered = True
+        with self.__lock:
+            for datum in metric_data:
+                key = (datum['MetricName'],
+                       tuple((dimension['Name'], dimension['Value']) for dimension in datum.get('Dimensions', [])),
+                       datum.get('Unit'))
+                entry = self.__buffer.get(key)
+                value = datum['Value']
+                if entry is None or value not in entry['values']:
+                    if self.__buffered_values >= self.max_buffered_values:
+                        self.__dropped += 1
+                        all_buffered = False
+                        continue
+                    self.__buffered_values += 1
+                if entry is None:
+                    entry = {'timestamp': timestamp, 'values': OrderedDict()}
+                    self.__buffer[key] = entry
+                entry['values'][value] = entry['values'].get(value, 0) + 1
+                self.__enqueued += 1
+            flush_due = self.__buffered_values >= self.flush_threshold_values
+
+        if not all_buffered:
+            LOGGER.error("Metrics buffer is full, dropped metric data {}".format(metric_data))
+        if flush_due and self.background_flush:
+            self.__start_flush_thread()
+            self.__flush_requested.set()
+        return all_buffered
+
+    def flush(self):
+        """
+        Publishes every buffered datum. Called at handler exit since the Lambda container is frozen afterwards.
+        :return: True if everything was published successfully, False otherwise
+        """
+        with self.__flush_lock:
+            with self.__lock:
+                buffer = self.__buffer
+                self.__buffer = OrderedDict()
+                self.__buffered_values = 0
+            if not buffer:
+                return True
+
+            datums = []
+            for (metric_name, dimensions, unit), entry in buffer.items():
+                values = list(entry['values'].items())
+                for start in range(0, len(values), MAX_VALUES_PER_DATUM):
+                    datum = {
+                        'MetricName': metric_name,
+                        'Timestamp': entry['timestamp'],
+                        'Values': [value for value, _ in values[start:start + MAX_VALUES_PER_DATUM]],
+                        'Counts': [count for _, count in values[start:start + MAX_VALUES_PER_DATUM]],
+                    }
+                    if dimensions:
+                        datum['Dimensions'] = [{'Name': name, 'Value': value} for name, value in dimensions]
+                    if unit:
+                        datum['Unit'] = unit
+                    datums.append(datum)
+
+            try:
+                success = self.publish(datums)
+            except Exception as e:
+                LOGGER.error("Publishing metrics failed: {}".format(e))
+                success = False
+
+            with self.__lock:
+                if success:
+                    self.__published += len(datums)
+                else:
+                    self.__failed += len(datums)
+            return success
+
+    @abstractmethod
+    def publish(self, datums):
+        """
+        :param datums: aggregated datums with Values/Counts arrays
+        :return: True if published successfully
+        """
+
+    def stats(self):
+        """
+        :return: dict with the enqueued, dropped, published and failed counters and the buffered value count
+        """
+        with self.__lock:
+            return {
+                "enqueued": self.__enqueued,
+                "dropped": self.__dropped,
+                "published": self.__published,
+                "failed": self.__failed,
+                "buffered": self.__buffered_values,
+            }
+
+    def __start_flush_thread(self):
+        with self.__lock:
+            if self.__flush_thread is None:
+                self.__flush_thread = threading.Thread(target=self.__flush_loop, daemon=True)
+                self.__flush_thread.start()
+
+    def __flush_loop(self):
+        while True:
+            self.__flush_requested.wait()
+            self.__flush_requested.clear()
+            self.flush()
+
+
+class CloudWatchMetricsSink(MetricsSink):
+    """
+    Publishes the buffered datums with as few PutMetricData calls as possible.
+    """
+    def __init__(self, namespace, cloudwatch_client_provider, **kwargs):
+        """
+        :param namespace: CloudWatch metric namespace
+        :param cloudwatch_client_provider: function returning the CloudWatch client
+        """
+        super().__init__(**kwargs)
+        self.namespace = namespace
+        self.__cloudwatch_client_provider = cloudwatch_client_provider
+
+    def publish(self, datums):
+        success = True
+        for start in range(0, len(datums), MAX_DATUMS_PER_REQUEST):
+            response = self.__cloudwatch_client_provider().put_metric_data(
+                Namespace=self.namespace,
+                MetricData=datums[start:start + MAX_DATUMS_PER_REQUEST]
+            )
+            LOGGER.debug("CloudWatch metric response: {}".format(response))
+            if response['ResponseMetadata']['HTTPStatusCode'] != 200:
+                LOGGER.error("CloudWatch put_metric_data call failed")
+                success = False
+        return success
+
+
+class EmfMetricsSink(MetricsSink):
+    """
+    Writes the buffered datums as CloudWatch Embedded Metric Format (EMF) documents to the Lambda log instead of
+    calling PutMetricData. CloudWatch extracts the metrics from the log lines, so no API call is made. The documents
+    are written to stdout directly, independent of the log level and formatter of the application logger.
+
+    One document is written per dimension set; repeated values are expanded into EMF value arrays.
+    """
+    def __init__(self, namespace, writer=None, **kwargs):
+        """
+        :param namespace: CloudWatch metric namespace
+        :param writer: function taking an EMF document (dict); defaults to writing it as a JSON line to stdout
+        """
+        super().__init__(**kwargs)
+        self.namespace = namespace
+        self.__writer = writer or self.__write_document
+
+    def publish(self, datums):
+        for document in self.to_emf_documents(datums):
+            self.__writer(document)
+        return True
+
+    def to_emf_documents(self, datums):
+        """
+        :param datums: aggregated datums with Values/Counts arrays
+        :return: list of EMF documents
+        """
+        groups: Dict[Tuple[Tuple[str, str], ...], Dict[str, Dict[str, Any]]] = OrderedDict()
+        for datum in datums:
+            dimensions = tuple((dimension['Name'], dimension['Value']) for dimension in datum.get('Dimensions', []))
+            metrics = groups.setdefault(dimensions, OrderedDict())
+            # a metric name appears once per document, so datums split by the per datum value limit are merged
+            metric = metrics.setdefault(datum['MetricName'], {
+                'name': datum['MetricName'], 'unit': datum.get('Unit'), 'timestamp': datum['Timestamp'], 'values': []})
+            metric['values'].extend(value for value, count in zip(datum['Values'], datum['Counts'])
+                                    for _ in range(count))
+
+        documents = []
+        for dimensions, metrics in groups.items():
+            # split the value arrays into chunks that fit one document each
+            chunks: List[List[Tuple[Dict[str, Any], List[float]]]] = []
+            for metric in metrics.values():
+                for index, start in enumerate(range(0, len(metric['values']), MAX_EMF_VALUES_PER_METRIC)):
+                    if index == len(chunks):
+                        chunks.append([])
+                    chunks[index].append((metric, metric['values'][start:start + MAX_EMF_VALUES_PER_METRIC]))
+
+            for chunk in chunks:
+                for start in range(0, len(chunk), MAX_EMF_METRICS_PER_DOCUMENT):
+                    documents.append(
+                        self.__to_emf_document(dimensions, chunk[start:start + MAX_EMF_METRICS_PER_DOCUMENT]))
+        return documents
+
+    def __to_emf_document(self, dimensions, metrics):
+        metric_definitions = []
+        document = {}
+        for metric, values in metrics:
+            metric_definition = {'Name': metric['name']}
+            if metric['unit']:
+                metric_definition['Unit'] = metric['unit']
+            metric_definitions.append(metric_definition)
+            document[metric['name']] = values[0] if len(values) == 1 else values
+        for name, value in dimensions:
+            document[name] = value
+
+        document['_aws'] = {
+            'Timestamp': int(min(metric['timestamp'] for metric, _ in metrics).timestamp() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': self.namespace,
+                'Dimensions': [[name for name, _ in dimensions]],
+                'Metrics': metric_definitions,
+            }],
+        }
+        return document
+
+    @staticmethod
+    def __write_document(document):
+        # EMF documents need the _aws key at the top level of the JSON log line
+        line = json.dumps(document, separators=(',', ':')) + "\n"
+        with EMF_STDOUT_LOCK:
+            sys.stdout.write(line)
+            sys.stdout.flush()
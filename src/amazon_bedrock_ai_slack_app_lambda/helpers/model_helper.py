@@ -1,47 +1,146 @@
+from typing import Callable, NamedTuple, Optional
+
+from amazon_bedrock_ai_slack_app_lambda.helpers.constants import (
+    BEDROCK_CONVERSE_BACKEND,
+    BEDROCK_INVOKE_MODEL_BACKEND,
+)
+from amazon_bedrock_ai_slack_app_lambda.helpers.payload_generator import (
+    build_claude_messages_body,
+    build_claude_text_body,
+    build_llama2_body,
+    build_titan_body,
+)
+
+
+class ModelDescriptor(NamedTuple):
+    """
+    Immutable description of a Bedrock model: request parameters, limits, on-demand pricing, the API it is invoked
+    with and the functions building its InvokeModel request body and decoding its response stream chunks.
+    """
+    name: str
+    id: str
+    max_token_sample: int
+    max_context_tokens: int
+    # USD per 1000 input and output tokens
+    input_price_per_1k_tokens: float
+    output_price_per_1k_tokens: float
+    # function (messages, bot_user_id, model, mode, summary) returning the request body dict
+    build_body: Callable
+    # function of the decoded JSON of a response stream chunk returning its text
+    decode_chunk: Callable
+    accept: str = "application/json"
+    content_type: str = "application/json"
+    temperature: float = 0.5
+    # False for models that are known but cannot be chosen with the settings command
+    selectable: bool = True
+    # BEDROCK_INVOKE_MODEL_BACKEND or BEDROCK_CONVERSE_BACKEND
+    backend: str = BEDROCK_INVOKE_MODEL_BACKEND
+    # False for models whose Converse API takes no system prompt, it is sent with the first user turn instead
+    converse_system_prompt: bool = True
+    # tokens a request may use of the context window, None for all of it; caps the input token cost and the time to
+    # first token of the models with large windows
+    context_token_budget: Optional[int] = None
+
+
+def __decode_claude_text_chunk(chunk):
+    return chunk.get("completion")
+
+
+def __decode_claude_messages_chunk(chunk):
+    return chunk.get("delta", {}).get("text", '')
+
+
+def __decode_titan_chunk(chunk):
+    return chunk.get("outputText")
+
+
+def __decode_llama2_chunk(chunk):
+    return chunk.get("generation")
+
+
+# Model registry keyed by the model id of the user settings, adding a model only takes an entry here
+MODELS = {
+    "amazon.titan-text-express-v1": ModelDescriptor(
+        name="titan",
+        id="amazon.titan-tg1-large",
+        accept="*/*",
+        max_token_sample=750,
+        max_context_tokens=8000,
+        input_price_per_1k_tokens=0.0002,
+        output_price_per_1k_tokens=0.0006,
+        build_body=build_titan_body,
+        decode_chunk=__decode_titan_chunk,
+        selectable=False,
+        backend=BEDROCK_CONVERSE_BACKEND,
+        converse_system_prompt=False,
+    ),
+    "anthropic.claude-v2:1": ModelDescriptor(
+        name="claude-v2",
+        id="anthropic.claude-v2:1",
+        max_token_sample=750,
+        max_context_tokens=200000,
+        input_price_per_1k_tokens=0.008,
+        output_price_per_1k_tokens=0.024,
+        build_body=build_claude_text_body,
+        decode_chunk=__decode_claude_text_chunk,
+        context_token_budget=32000,
+    ),
+    "anthropic.claude-instant-v1": ModelDescriptor(
+        name="claude-instant",
+        id="anthropic.claude-instant-v1",
+        max_token_sample=750,
+        max_context_tokens=100000,
+        input_price_per_1k_tokens=0.0008,
+        output_price_per_1k_tokens=0.0024,
+        build_body=build_claude_text_body,
+        decode_chunk=__decode_claude_text_chunk,
+        context_token_budget=32000,
+    ),
+    "anthropic.claude-3-sonnet-20240229-v1:0": ModelDescriptor(
+        name="claude-v3-sonet",
+        id="anthropic.claude-3-sonnet-20240229-v1:0",
+        max_token_sample=750,
+        max_context_tokens=200000,
+        input_price_per_1k_tokens=0.003,
+        output_price_per_1k_tokens=0.015,
+        build_body=build_claude_messages_body,
+        decode_chunk=__decode_claude_messages_chunk,
+        context_token_budget=32000,
+    ),
+    "meta.llama2-13b-chat-v1": ModelDescriptor(
+        name="llama2",
+        id="meta.llama2-13b-chat-v1",
+        max_token_sample=750,
+        max_context_tokens=4096,
+        input_price_per_1k_tokens=0.00075,
+        output_price_per_1k_tokens=0.001,
+        build_body=build_llama2_body,
+        decode_chunk=__decode_llama2_chunk,
+        selectable=False,
+        backend=BEDROCK_CONVERSE_BACKEND,
+    ),
+}
+
+# Registry entries by the Bedrock model id of their requests
+MODELS_BY_BEDROCK_ID = {model.id: model for model in MODELS.values()}
+
+# Model ids users can choose with the settings command
+AVAILABLE_MODELS = [model_id for model_id, model in MODELS.items() if model.selectable]
+
+
 def get_model(model_name):
     """
     Retrieve model information based on the provided model name.
 
     :param model_name: The name of the language model.
-    :return: A dictionary containing information about the specified model.
+    :return: the ModelDescriptor of the specified model, None if it is unknown.
+    """
+    return MODELS.get(model_name)
+
+
+def get_model_by_bedrock_id(model_id):
+    """
+    :param model_id: Bedrock model id of a request, e.g. the model_id of a payload
+    :return: the ModelDescriptor of the model, None if it is unknown.
     """
-    model_info = {
-        "amazon.titan-text-express-v1": {
-            "name": "titan",
-            "id": "amazon.titan-tg1-large",
-            "accept": "*/*",
-            "content_type": "application/json",
-            "max_token_sample": 750,
-        },
-        "anthropic.claude-v2:1": {
-            "name": "claude-v2",
-            "id": "anthropic.claude-v2:1",
-            "accept": "application/json",
-            "content_type": "application/json",
-            "max_token_sample": 750,
-        },
-        "anthropic.claude-instant-v1": {
-            "name": "claude-instant",
-            "id": "anthropic.claude-instant-v1",
-            "accept": "application/json",
-            "content_type": "application/json",
-            "max_token_sample": 750,
-        },
-        "anthropic.claude-3-sonnet-20240229-v1:0": {
-            "name": "claude-v3-sonet",
-            "id": "anthropic.claude-3-sonnet-20240229-v1:0",
-            "accept": "application/json",
-            "content_type": "application/json",
-            "max_token_sample": 750,
-            "temperature": 0.5
-        },
-        "meta.llama2-13b-chat-v1": {
-            "name": "llama2",
-            "id": "meta.llama2-13b-chat-v1",
-            "accept": "application/json",
-            "content_type": "application/json",
-            "max_token_sample": 750,
-        },
-    }
-
-    return model_info.get(model_name, None)
+    return MODELS_BY_BEDROCK_ID.get(model_id)
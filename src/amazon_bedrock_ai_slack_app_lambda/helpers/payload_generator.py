@@ -1,11 +1,7 @@
 import json
 
-from amazon_bedrock_ai_slack_app_lambda.helpers.constants import (
-    DEFAULT_ASSISTANT_PROMPT,
-    DISCLAIMER_TAG,
-    PII_SYSTEM_MESSAGE_TAG,
-    SYSTEM_MESSAGES,
-)
+from amazon_bedrock_ai_slack_app_lambda.helpers.constants import BEDROCK_CONVERSE_BACKEND, DEFAULT_ASSISTANT_PROMPT
+from amazon_bedrock_ai_slack_app_lambda.helpers.context_builder import build_context
 from amazon_bedrock_ai_slack_app_lambda.helpers.logging import LOGGER
 
 
@@ -63,13 +59,13 @@ Assistant:
     return prompt_format.get(model_name, "").format(history=history, user_input=user_input)
 
 
-def __generate_claude_prompt(messages, bot_user_id, mode):
+def __generate_claude_prompt(messages, bot_user_id, mode, summary=None):
     """
     Generate a conversation prompt for a Anthropic Claude models based on a list of messages and the bot's user ID.
 
-    :param messages: A list of messages, each represented as a dictionary.
-                     Each message dictionary should contain 'user' and 'msg' keys.
+    :param messages: A list of SlackMessage records.
     :param bot_user_id: The user ID of the bot.
+    :param summary: summary of the conversation before the messages, or None
     :return: A formatted string representing the conversation prompt.
     """
     model_name = 'claude'
@@ -78,23 +74,21 @@ def __generate_claude_prompt(messages, bot_user_id, mode):
     last_message = ""
     #  find the last non bot message and replace bot mention with 'Bot'
     for message in reversed(messages):
-        if message['user'] != bot_user_id:
-            last_message = message['msg'].replace(bot_user_id_msg, 'Bot')
+        if message.user != bot_user_id:
+            last_message = message.msg.replace(bot_user_id_msg, 'Bot')
             break
 
-    LOGGER.debug("Messages: {}".format(messages))
-    history = ""
-    for idx, msg in enumerate(messages):
-        if idx < len(messages) - 1:
-            # Check if command or system message
-            stripped_message: str = msg["msg"].strip()
-            is_system_message = (stripped_message.startswith(SYSTEM_MESSAGES)
-                                 or PII_SYSTEM_MESSAGE_TAG in stripped_message
-                                 or DISCLAIMER_TAG in stripped_message)
-
-            if not is_system_message:
-                speaker = "Assistant" if msg["user"] == bot_user_id else "Human"
-                history += f"\n\n{speaker}: {msg['msg'].replace(bot_user_id_msg, 'Bot')}"
+    # formatted only when debug logging is enabled, the thread can be long
+    LOGGER.debug("Messages: %s", messages)
+    history_parts = []
+    if summary:
+        history_parts.append(f"\n\n<conversation_summary>\n{summary}\n</conversation_summary>")
+    for msg in messages[:-1]:
+        # skip commands and system messages
+        if not msg.is_system_message:
+            speaker = "Assistant" if msg.user == bot_user_id else "Human"
+            history_parts.append(f"\n\n{speaker}: {msg.msg.replace(bot_user_id_msg, 'Bot')}")
+    history = "".join(history_parts)
 
     if mode == 'assistant':
         return __get_assistant_prompt(model_name, history, last_message)
@@ -106,73 +100,156 @@ def __generate_claude_v3_prompt(messages, bot_user_id, mode):
     """
     Generate a conversation prompt for a Anthropic Claude v3 Sonet models based on a list of messages and the bot's user ID.
 
-    :param messages: A list of messages, each represented as a dictionary.
-                     Each message dictionary should contain 'user' and 'msg' keys.
+    :param messages: A list of SlackMessage records.
     :param bot_user_id: The user ID of the bot.
     :return: A formatted list of dict(role: str, content: str) representing the conversation prompt.
     """
     bot_user_id_msg = f"<@{bot_user_id}>"
 
-    LOGGER.debug("Messages: {}".format(messages))
+    # formatted only when debug logging is enabled, the thread can be long
+    LOGGER.debug("Messages: %s", messages)
     history = []
     speakers = ["user", "assistant"]
     current_speaker = None
     for msg in messages:
-        # Check if command or system message
-        stripped_message: str = msg["msg"].strip()
-        is_system_message = (
-            stripped_message.startswith(SYSTEM_MESSAGES)
-            or PII_SYSTEM_MESSAGE_TAG in stripped_message
-            or DISCLAIMER_TAG in stripped_message
-        )
-
-        if not is_system_message:
-            speaker = "assistant" if msg["user"] == bot_user_id else "user"
+        # skip commands and system messages
+        if not msg.is_system_message:
+            speaker = "assistant" if msg.user == bot_user_id else "user"
 
             if current_speaker == speaker:
                 history.append(
                     {"role": speakers[1 - speakers.index(speaker)], "content": "-"}
                 )
 
-            content = stripped_message.replace(bot_user_id_msg, 'Bot')
+            content = msg.msg.strip().replace(bot_user_id_msg, 'Bot')
             history.append({'role': speaker, 'content': content})
             current_speaker = speaker
 
     return history
 
 
-def generate_payload(messages, bot_user_id, model, mode):
+def __generate_transcript_prompt(messages, bot_user_id, summary, user_label, assistant_label):
     """
-    Generate payload for making a request to a language model.
+    Generate a plain conversation transcript for models without a chat format, ending with the last user turn.
 
-    :param messages: A list of messages, each represented as a dictionary.
-                     Each message dictionary should contain 'user' and 'msg' keys.
+    :param messages: A list of SlackMessage records.
     :param bot_user_id: The user ID of the bot.
-    :param model: A dictionary containing information about the language model,
-                  including its name, max_token_sample, model_id, accept, and content_type.
-    :return: A dictionary containing the payload for the language model request.
+    :param summary: summary of the conversation before the messages, or None
+    :param user_label: speaker label of the user turns
+    :param assistant_label: speaker label of the bot turns
+    :return: the transcript, one turn per line
     """
+    bot_user_id_msg = f"<@{bot_user_id}>"
+    lines = []
+    if summary:
+        lines.append(f"Summary of the earlier conversation: {summary}")
+    for msg in messages:
+        # skip commands and system messages
+        if not msg.is_system_message:
+            speaker = assistant_label if msg.user == bot_user_id else user_label
+            lines.append(f"{speaker}: {msg.msg.strip().replace(bot_user_id_msg, 'Bot')}")
+    return "\n".join(lines)
+
 
-    LOGGER.info("Generating payload using settings: model:={}".format(model))
+def build_claude_text_body(messages, bot_user_id, model, mode, summary=None):
+    """
+    :return: request body of the Claude v2 and Claude Instant text completion API
+    """
+    return {
+        "prompt": __generate_claude_prompt(messages, bot_user_id, mode, summary),
+        "max_tokens_to_sample": model.max_token_sample,
+        "temperature": model.temperature,
+    }
 
-    body = {}
 
-    if model.get("name") in ["claude-v2", "claude-instant"]:
-        body["prompt"] = __generate_claude_prompt(messages, bot_user_id, mode)
-        body["max_tokens_to_sample"] = model.get("max_token_sample")
-        body["temperature"] = 0.5
+def build_claude_messages_body(messages, bot_user_id, model, mode, summary=None):
+    """
+    :return: request body of the Claude 3 messages API
+    """
+    system = DEFAULT_ASSISTANT_PROMPT if mode == 'assistant' else ""
+    if summary:
+        system += "\n\nSummary of the earlier conversation:\n{}".format(summary)
+    return {
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": model.max_token_sample,
+        "system": system,
+        "messages": __generate_claude_v3_prompt(messages, bot_user_id, mode),
+        "temperature": model.temperature,
+    }
 
-    if model.get('name') == 'claude-v3-sonet':
-        body["anthropic_version"] = "bedrock-2023-05-31"
-        body["max_tokens"] = model.get("max_token_sample")
-        body["system"] = DEFAULT_ASSISTANT_PROMPT if mode == 'assistant' else ""
-        body["messages"] = __generate_claude_v3_prompt(messages, bot_user_id, mode)
-        body["temperature"] = model.get("temperature")
 
+def build_titan_body(messages, bot_user_id, model, mode, summary=None):
+    """
+    :return: request body of the Amazon Titan text API
+    """
+    prompt = __generate_transcript_prompt(messages, bot_user_id, summary, "User", "Bot") + "\nBot:"
+    if mode == 'assistant':
+        prompt = "{}\n\n{}".format(DEFAULT_ASSISTANT_PROMPT, prompt)
     return {
-        "body": json.dumps(body),
-        "model_name": model.get("name"),
-        "model_id": model.get("id"),
-        "accept": model.get("accept"),
-        "content_type": model.get("content_type"),
+        "inputText": prompt,
+        "textGenerationConfig": {"maxTokenCount": model.max_token_sample, "temperature": model.temperature},
+    }
+
+
+def build_llama2_body(messages, bot_user_id, model, mode, summary=None):
+    """
+    :return: request body of the Meta Llama 2 chat API
+    """
+    transcript = __generate_transcript_prompt(messages, bot_user_id, summary, "User", "Assistant")
+    if mode == 'assistant':
+        prompt = "[INST] <<SYS>>\n{}\n<</SYS>>\n\n{} [/INST]".format(DEFAULT_ASSISTANT_PROMPT, transcript)
+    else:
+        prompt = "[INST] {} [/INST]".format(transcript)
+    return {"prompt": prompt, "max_gen_len": model.max_token_sample, "temperature": model.temperature}
+
+
+def build_converse_request(messages, bot_user_id, model, mode, summary=None):
+    """
+    :return: dict of the messages, system and inferenceConfig arguments of the Converse API, the same for every model
+    """
+    system = DEFAULT_ASSISTANT_PROMPT if mode == 'assistant' else ""
+    if summary:
+        system += "\n\nSummary of the earlier conversation:\n{}".format(summary)
+    turns = __generate_claude_v3_prompt(messages, bot_user_id, mode)
+    if system and not model.converse_system_prompt and turns:
+        turns[0] = {"role": turns[0]["role"], "content": "{}\n\n{}".format(system.strip(), turns[0]["content"])}
+
+    request = {
+        "messages": [{"role": turn["role"], "content": [{"text": turn["content"]}]} for turn in turns],
+        "inferenceConfig": {"maxTokens": model.max_token_sample, "temperature": model.temperature},
+    }
+    if system and model.converse_system_prompt:
+        request["system"] = [{"text": system.strip()}]
+    return request
+
+
+def generate_payload(messages, bot_user_id, model, mode, summary=None):
+    """
+    Generate payload for making a request to a language model. Older messages that do not fit into the input token
+    budget of the model are dropped.
+
+    :param messages: A list of SlackMessage records.
+    :param bot_user_id: The user ID of the bot.
+    :param model: ModelDescriptor of the language model from model_helper.get_model
+    :param summary: summary of the thread before the messages, or None
+    :return: A dictionary containing the payload for the language model request: the InvokeModel body, accept and
+    content_type, or the Converse messages, system and inferenceConfig, depending on the backend of the model.
+    """
+
+    LOGGER.info("Generating payload using settings: model:={}".format(model.name))
+    messages = build_context(messages, bot_user_id, model, mode, summary)
+
+    payload = {
+        "backend": model.backend,
+        "model_name": model.name,
+        "model_id": model.id,
     }
+    if model.backend == BEDROCK_CONVERSE_BACKEND:
+        payload.update(build_converse_request(messages, bot_user_id, model, mode, summary))
+    else:
+        payload.update({
+            "body": json.dumps(model.build_body(messages, bot_user_id, model, mode, summary)),
+            "accept": model.accept,
+            "content_type": model.content_type,
+        })
+    return payload
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from amazon_bedrock_ai_slack_app_lambda.helpers.aws_clients import get_client
+from amazon_bedrock_ai_slack_app_lambda.helpers.logging import LOGGER
+from amazon_bedrock_ai_slack_app_lambda.helpers.ttl_cache import TtlLruCache
+
+# Environment variables configuring the PII scan cache. Without a table name only the in-memory cache is used.
+PII_CACHE_TABLE_NAME = "PII_CACHE_TABLE_NAME"
+PII_CACHE_TTL_SECONDS = "PII_CACHE_TTL_SECONDS"
+PII_CACHE_MAX_SIZE = "PII_CACHE_MAX_SIZE"
+
+DEFAULT_PII_CACHE_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_PII_CACHE_MAX_SIZE = 2048
+
+# BatchGetItem and BatchWriteItem limits
+MAX_BATCH_GET_KEYS = 100
+MAX_BATCH_WRITE_ITEMS = 25
+
+# Partition key, and the DynamoDB TTL attribute (epoch seconds) the table must be configured with
+MESSAGE_HASH_ATTRIBUTE = "message_hash"
+EXPIRES_AT_ATTRIBUTE = "expires_at"
+ENTITIES_ATTRIBUTE = "entities"
+
+
+def message_hash(message):
+    """
+    :param message: text scanned for PII
+    :return: hex sha256 digest of the UTF-8 text, the cache key of the message
+    """
+    return hashlib.sha256(message.encode('utf-8')).hexdigest()
+
+
+class PiiScanCache:
+    """
+    Content addressed cache of Comprehend PII entities, keyed by the hash of the scanned text.
+
+    An in-memory LRU serves repeated lookups within a warm container; a DynamoDB table with a TTL attribute shares
+    results between containers. Only the hash, the entity offsets/types and the expiry are stored, never the text:
+    callers rebuild the redacted text from the message they already hold.
+
+    Cache failures are logged and treated as misses, they never fail the request.
+    """
+    def __init__(self, table_name=None, ttl_seconds=DEFAULT_PII_CACHE_TTL_SECONDS,
+                 max_size=DEFAULT_PII_CACHE_MAX_SIZE, dynamodb_client_provider=lambda: get_client("dynamodb"),
+                 write_executor=None):
+        """
+        :param table_name: DynamoDB table, None to only cache in memory
+        :param ttl_seconds: lifetime of cached results, in memory and in the table
+        :param max_size: maximum entries of the in-memory cache
+        :param dynamodb_client_provider: function returning the DynamoDB client
+        :param write_executor: executor the table writes are submitted to, None writes synchronously
+        """
+        self.table_name = table_name
+        self.ttl_seconds = ttl_seconds
+        self.__memory_cache = TtlLruCache(max_size=max_size, ttl_seconds=ttl_seconds)
+        self.__dynamodb_client_provider = dynamodb_client_provider
+        self.__write_executor = write_executor
+
+    def get_many(self, messages):
+        """
+        :param messages: texts to look up
+        :return: dict of message to its cached entity list, for the messages that are cached
+        """
+        found = {}
+        missing = {}
+        for message in messages:
+            key = message_hash(message)
+            entities = self.__memory_cache.get(key)
+            if entities is not None:
+                found[message] = entities
+            else:
+                missing[key] = message
+
+        if missing and self.table_name:
+            try:
+                for key, entities in self.__batch_get(list(missing)).items():
+                    self.__memory_cache.put(key, entities)
+                    found[missing[key]] = entities
+            except Exception as e:
+                LOGGER.error("Reading the PII scan cache failed: {}".format(e))
+        return found
+
+    def put_many(self, entities_by_message):
+        """
+        :param entities_by_message: dict of message to the entity list Comprehend detected in it
+        :return: None
+        """
+        items = []
+        expires_at = int(time.time()) + self.ttl_seconds
+        for message, entities in entities_by_message.items():
+            key = message_hash(message)
+            self.__memory_cache.put(key, entities)
+            items.append({
+                MESSAGE_HASH_ATTRIBUTE: {'S': key},
+                ENTITIES_ATTRIBUTE: {'S': json.dumps([{
+                    'Type': entity['Type'],
+                    'BeginOffset': entity['BeginOffset'],
+                    'EndOffset': entity['EndOffset'],
+                } for entity in entities])},
+                EXPIRES_AT_ATTRIBUTE: {'N': str(expires_at)},
+            })
+
+        if items and self.table_name:
+            if self.__write_executor is not None:
+                self.__write_executor.submit(self.__batch_write, items)
+            else:
+                self.__batch_write(items)
+
+    def stats(self):
+        """
+        :return: hit/miss counters of the in-memory cache
+        """
+        return self.__memory_cache.stats()
+
+    def invalidate(self):
+        """
+        Drops the in-memory entries, the table entries expire through the DynamoDB TTL.
+        :return: None
+        """
+        self.__memory_cache.invalidate()
+
+    def __batch_get(self, keys):
+        now = int(time.time())
+        entities_by_key = {}
+        for start in range(0, len(keys), MAX_BATCH_GET_KEYS):
+            response = self.__dynamodb_client_provider().batch_get_item(RequestItems={
+                self.table_name: {
+                    'Keys': [{MESSAGE_HASH_ATTRIBUTE: {'S': key}} for key in keys[start:start + MAX_BATCH_GET_KEYS]],
+                    'ProjectionExpression': '{}, {}, {}'.format(
+                        MESSAGE_HASH_ATTRIBUTE, ENTITIES_ATTRIBUTE, EXPIRES_AT_ATTRIBUTE),
+                }
+            })
+            # unprocessed keys are treated as misses and scanned again
+            for item in response.get('Responses', {}).get(self.table_name, []):
+                # DynamoDB deletes expired items lazily
+                if int(item[EXPIRES_AT_ATTRIBUTE]['N']) > now:
+                    entities_by_key[item[MESSAGE_HASH_ATTRIBUTE]['S']] = json.loads(item[ENTITIES_ATTRIBUTE]['S'])
+        return entities_by_key
+
+    def __batch_write(self, items):
+        try:
+            for start in range(0, len(items), MAX_BATCH_WRITE_ITEMS):
+                response = self.__dynamodb_client_provider().batch_write_item(RequestItems={
+                    self.table_name: [{'PutRequest': {'Item': item}}
+                                      for item in items[start:start + MAX_BATCH_WRITE_ITEMS]]
+                })
+                if response.get('UnprocessedItems'):
+                    LOGGER.debug("PII scan cache items not written: {}".format(response['UnprocessedItems']))
+        except Exception as e:
+            LOGGER.error("Writing the PII scan cache failed: {}".format(e))
+
+
+PII_SCAN_CACHE = PiiScanCache(
+    table_name=os.getenv(PII_CACHE_TABLE_NAME),
+    ttl_seconds=int(os.getenv(PII_CACHE_TTL_SECONDS, DEFAULT_PII_CACHE_TTL_SECONDS)),
+    max_size=int(os.getenv(PII_CACHE_MAX_SIZE, DEFAULT_PII_CACHE_MAX_SIZE)),
+    # the table write is off the request path, the results are already in memory
+    write_executor=ThreadPoolExecutor(max_workers=1, thread_name_prefix="pii-cache"),
+)
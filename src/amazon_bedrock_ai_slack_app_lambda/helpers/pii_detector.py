@@ -0,0 +1,252 @@
+import ipaddress
+import os
+import re
+from abc import ABC, abstractmethod
+from typing import List, Tuple
+
+from amazon_bedrock_ai_slack_app_lambda.helpers.aws_clients import get_client
+from amazon_bedrock_ai_slack_app_lambda.helpers.constants import COMPREHEND_MAX_DOCUMENT_BYTES
+from amazon_bedrock_ai_slack_app_lambda.helpers.logging import LOGGER
+from amazon_bedrock_ai_slack_app_lambda.helpers.pii_prefilter import PII_PREFILTER, luhn_valid
+
+# Environment variable selecting the PII detection backend: "comprehend" (default) or "local"
+PII_DETECTOR_BACKEND = "PII_DETECTOR_BACKEND"
+PII_DETECTOR_BACKEND_COMPREHEND = "comprehend"
+PII_DETECTOR_BACKEND_LOCAL = "local"
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+class PiiDetector(ABC):
+    """
+    Detects PII entities in text. Entities have the shape of Comprehend DetectPiiEntities results (Type, BeginOffset,
+    EndOffset, Score) with character offsets, sorted by BeginOffset.
+    """
+    # True if detect() calls a remote service, i.e. caching the results is worthwhile
+    remote = True
+
+    @abstractmethod
+    def detect(self, message):
+        """
+        :param message: The text message to inspect.
+        :return: The list of entities
+        """
+
+
+class ComprehendPiiDetector(PiiDetector):
+    """
+    Amazon Comprehend backend. Messages the local pre-filter proves clean are not sent; messages larger than
+    Comprehend's document size limit are scanned in chunks cut at whitespace and the entity offsets are mapped back
+    to the whole message.
+    """
+    remote = True
+
+    def __init__(self, max_document_bytes=COMPREHEND_MAX_DOCUMENT_BYTES, prefilter=PII_PREFILTER):
+        """
+        :param max_document_bytes: maximum UTF-8 size of one Comprehend document
+        :param prefilter: PiiPrefilter deciding which texts skip Comprehend, None to send every text
+        """
+        self.max_document_bytes = max_document_bytes
+        self.prefilter = prefilter
+
+    def detect(self, message):
+        if self.prefilter is not None and self.prefilter.is_clean(message):
+            LOGGER.debug("comprehend.detect_pii_entities skipped, message is clean")
+            return []
+
+        comprehend_client = get_client("comprehend")
+        entities = []
+        for offset, document in split_document(message, self.max_document_bytes):
+            LOGGER.debug("comprehend.detect_pii_entities message = {}".format(document))
+            response = comprehend_client.detect_pii_entities(
+                Text=document, LanguageCode='en'
+            )
+            LOGGER.debug("comprehend.detect_pii_entities response = {}".format(response))
+            for entity in response['Entities']:
+                if offset:
+                    entity = dict(entity, BeginOffset=entity["BeginOffset"] + offset,
+                                  EndOffset=entity["EndOffset"] + offset)
+                entities.append(entity)
+        return entities
+
+
+def split_document(message, max_document_bytes=COMPREHEND_MAX_DOCUMENT_BYTES):
+    """
+    Splits a message into documents of at most max_document_bytes UTF-8 bytes, cut after the last whitespace that
+    fits (or at the byte limit if a chunk has no whitespace).
+
+    :param message: The text message to split.
+    :param max_document_bytes: maximum UTF-8 size of one document
+    :return: list of tuples (character offset in message, document)
+    """
+    documents = []
+    offset = 0
+    remaining_bytes = len(message.encode('utf-8'))
+    while remaining_bytes > max_document_bytes:
+        # decoding the truncated bytes drops a trailing partial character
+        document = message[offset:].encode('utf-8')[:max_document_bytes].decode('utf-8', errors='ignore')
+        cut = len(document)
+        for match in WHITESPACE_PATTERN.finditer(document):
+            cut = match.end()
+        documents.append((offset, document[:cut]))
+        offset += cut
+        remaining_bytes -= len(document[:cut].encode('utf-8'))
+    documents.append((offset, message[offset:]))
+    return documents
+
+
+def iban_valid(iban):
+    """
+    :param iban: IBAN, spaces are ignored
+    :return: True if the ISO 13616 mod 97 check passes
+    """
+    iban = iban.replace(" ", "").upper()
+    rearranged = iban[4:] + iban[:4]
+    return int("".join(str(int(character, 36)) for character in rearranged)) % 97 == 1
+
+
+def aba_routing_valid(number):
+    """
+    :param number: 9 digit ABA routing number
+    :return: True if the ABA checksum passes
+    """
+    digits = [int(digit) for digit in number]
+    return sum(weight * digit for weight, digit in zip([3, 7, 1] * 3, digits)) % 10 == 0
+
+
+def ip_address_valid(address):
+    try:
+        ipaddress.ip_address(address)
+        return True
+    except ValueError:
+        return False
+
+
+def has_letter_and_digit(text):
+    return any(character.isdigit() for character in text) and any(character.isalpha() for character in text)
+
+
+def always_valid(_):
+    return True
+
+
+# Keyword, optional "number"/"is"/":" connector and the value that is the entity
+CONTEXT_CONNECTOR = r"(?:\s+(?:number|num|no\.?|code|#))?(?:\s+(?:is|was|are))?\s*[:=#]?\s*"
+# Numeric values may follow a few words after the keyword ("the pin for the door is 4921")
+NUMERIC_CONTEXT_CONNECTOR = r"[^\d\n]{0,30}?\b"
+# Free form values (passwords) need an explicit "is"/":"/"=", otherwise any word after the keyword would match
+STRICT_CONTEXT_CONNECTOR = r"(?:\s+(?:is|was)\s+|\s*[:=]\s*)"
+
+
+def context_pattern(keywords, value, connector=CONTEXT_CONNECTOR):
+    return r"(?i:\b(?:" + keywords + r")\b" + connector + r")(?P<value>" + value + r")"
+
+
+# (Type, pattern, validator) in priority order: when spans overlap the earlier rule wins. Patterns with a named
+# group "value" only report that group as the entity.
+LOCAL_PII_RULES = (
+    ("URL", r"\bhttps?://[^\s<>|]+", always_valid),
+    ("EMAIL", r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+", always_valid),
+    ("AWS_ACCESS_KEY", r"\b(?:AKIA|ASIA|AGPA|AIDA|AROA|ANPA|ANVA|AIPA)[A-Z0-9]{16}\b", always_valid),
+    ("AWS_SECRET_KEY", r"(?<![A-Za-z0-9/+=])[A-Za-z0-9/+=]{40}(?![A-Za-z0-9/+=])", has_letter_and_digit),
+    ("PASSWORD", context_pattern(r"passwords?|passwd|pwd|passcodes?|api[\s_-]?keys?|secrets?|tokens?",
+                                 r"[^\s,;]+", STRICT_CONTEXT_CONNECTOR), always_valid),
+    ("CREDIT_DEBIT_CVV", context_pattern(r"cvv|cvc|cvv2|security\s+code", r"\d{3,4}\b", NUMERIC_CONTEXT_CONNECTOR),
+     always_valid),
+    ("CREDIT_DEBIT_EXPIRY", context_pattern(r"exp|expiry|expiration|expires|valid\s+thru",
+                                            r"(?:0?[1-9]|1[0-2])/(?:\d{4}|\d{2})\b"), always_valid),
+    ("PIN", context_pattern(r"pins?", r"\d{4,8}\b", NUMERIC_CONTEXT_CONNECTOR), always_valid),
+    ("BANK_ROUTING", context_pattern(r"routing|aba", r"\d{9}\b", NUMERIC_CONTEXT_CONNECTOR), aba_routing_valid),
+    ("BANK_ACCOUNT_NUMBER", context_pattern(r"(?:bank\s+)?account|acct", r"\d{6,17}\b", NUMERIC_CONTEXT_CONNECTOR),
+     always_valid),
+    ("PASSPORT_NUMBER", context_pattern(r"passports?", r"[A-Z0-9]{6,9}\b"), has_letter_and_digit),
+    ("DRIVER_ID", context_pattern(r"driver'?s?\s+licen[cs]es?|dl", r"[A-Z0-9-]{5,15}\b"), has_letter_and_digit),
+    ("SWIFT_CODE", context_pattern(r"swift|bic", r"[A-Z]{6}[A-Z0-9]{2}(?:[A-Z0-9]{3})?\b"), always_valid),
+    ("LICENSE_PLATE", context_pattern(r"(?:license\s+)?plates?", r"[A-Z0-9-]{2,8}\b"), has_letter_and_digit),
+    ("INTERNATIONAL_BANK_ACCOUNT_NUMBER", r"\b[A-Z]{2}\d{2}(?: ?[A-Z0-9]{4}){2,7}(?: ?[A-Z0-9]{1,3})?\b",
+     iban_valid),
+    ("VEHICLE_IDENTIFICATION_NUMBER", r"\b[A-HJ-NPR-Z0-9]{17}\b", has_letter_and_digit),
+    ("MAC_ADDRESS", r"\b[0-9A-Fa-f]{2}(?:[:-][0-9A-Fa-f]{2}){5}\b", always_valid),
+    ("IP_ADDRESS", r"(?<![\w:.])(?:\d{1,3}(?:\.\d{1,3}){3}|[0-9A-Fa-f]{0,4}(?::[0-9A-Fa-f]{0,4}){2,7})(?![\w:.])",
+     ip_address_valid),
+    ("SSN", r"\b(?!000|666|9\d\d)\d{3}-(?!00)\d{2}-(?!0000)\d{4}\b", always_valid),
+    ("CREDIT_DEBIT_NUMBER", r"\b(?:\d[ -]?){12,18}\d\b", luhn_valid),
+    ("PHONE", r"(?:\+\d{1,3}(?:[ .-]?\d{1,4}){2,5}|(?:\(\d{3}\)|\b\d{3})[ .-]?\d{3}[ .-]?\d{4})\b", always_valid),
+    ("AGE", r"\b\d{1,3}(?=\s*(?:-\s*)?(?:years?|yrs?)(?:\s*-\s*|\s+)old\b)", always_valid),
+    ("ADDRESS", r"\b\d{1,6}\s+(?:[A-Z][a-z]+\s+){1,3}(?:St|Street|Ave|Avenue|Rd|Road|Blvd|Boulevard|Dr|Drive|Ln|Lane|"
+                r"Way|Ct|Court|Pl|Place)\b\.?(?:\s+[NSEW]{1,2}\b)?", always_valid),
+    ("DATE_TIME", r"(?i:\b(?:today|tonight|tomorrow|yesterday|(?:next|last|this)\s+(?:week|month|year)|"
+                  r"monday|tuesday|wednesday|thursday|friday|saturday|sunday|"
+                  r"january|february|march|april|june|july|august|september|october|november|december)\b)|"
+                  r"\b\d{1,2}/\d{1,2}/\d{2,4}\b|\b\d{4}-\d{2}-\d{2}\b|\b\d{1,2}:\d{2}\s*(?:[ap]\.?m\.?)?(?![\w:])",
+     always_valid),
+)
+
+# Small dictionary for the NAME entity: capitalized first names
+FIRST_NAMES = frozenset((
+    "Aaron", "Adam", "Alex", "Alice", "Amanda", "Amy", "Andrew", "Angela", "Anna", "Anthony", "Ashley", "Barbara",
+    "Ben", "Betty", "Bob", "Brian", "Carol", "Charles", "Chris", "Christopher", "Daniel", "David", "Deborah",
+    "Dennis", "Donald", "Donna", "Dorothy", "Edward", "Elizabeth", "Emily", "Emma", "Eric", "Frank", "Gary",
+    "George", "Hannah", "Helen", "Jack", "James", "Jane", "Jason", "Jennifer", "Jessica", "John", "Jonathan",
+    "Joseph", "Joshua", "Karen", "Kevin", "Kimberly", "Laura", "Linda", "Lisa", "Margaret", "Maria", "Mark", "Mary",
+    "Matthew", "Melissa", "Michael", "Michelle", "Nancy", "Nicholas", "Olivia", "Patricia", "Paul", "Peter",
+    "Priya", "Rachel", "Raj", "Rebecca", "Richard", "Robert", "Ronald", "Ryan", "Sandra", "Sarah", "Scott",
+    "Sharon", "Stephanie", "Steven", "Susan", "Thomas", "Timothy", "William", "Wei",
+))
+NAME_CANDIDATE_PATTERN = re.compile(r"\b[A-Z][a-z]+\b")
+
+
+class LocalPiiDetector(PiiDetector):
+    """
+    Offline backend without network calls: pattern rules with checksum validators (Luhn, IBAN mod 97, ABA routing,
+    IP address parsing), keyword context rules for values such as passwords, PINs and account numbers, and a
+    small dictionary based NER for first names.
+
+    It is less thorough than Comprehend, e.g. names outside the dictionary are not found, and is meant for load
+    tests, air-gapped environments and deployments that accept that trade-off.
+    """
+    remote = False
+
+    def __init__(self, rules=LOCAL_PII_RULES, first_names=FIRST_NAMES):
+        """
+        :param rules: (Type, pattern, validator) tuples in priority order
+        :param first_names: dictionary of first names reported as NAME
+        """
+        self.__rules = [(entity_type, re.compile(pattern), validator) for entity_type, pattern, validator in rules]
+        self.__first_names = first_names
+
+    def detect(self, message):
+        candidates = []
+        for priority, (entity_type, pattern, validator) in enumerate(self.__rules):
+            for match in pattern.finditer(message):
+                group = "value" if "value" in pattern.groupindex else 0
+                if match.start(group) < match.end(group) and validator(match.group(group)):
+                    candidates.append((priority, match.start(group), match.end(group), entity_type))
+        for match in NAME_CANDIDATE_PATTERN.finditer(message):
+            if match.group() in self.__first_names:
+                candidates.append((len(self.__rules), match.start(), match.end(), "NAME"))
+
+        # the highest priority wins overlapping spans
+        accepted: List[Tuple[str, int, int]] = []
+        for priority, begin, end, entity_type in sorted(candidates):
+            if all(end <= other_begin or begin >= other_end for _, other_begin, other_end in accepted):
+                accepted.append((entity_type, begin, end))
+
+        return [{"Score": 1.0, "Type": entity_type, "BeginOffset": begin, "EndOffset": end}
+                for entity_type, begin, end in sorted(accepted, key=lambda entity: entity[1])]
+
+
+def create_pii_detector(backend=None):
+    """
+    :param backend: "comprehend" or "local", defaults to the PII_DETECTOR_BACKEND environment variable
+    :return: the PiiDetector for the backend
+    """
+    backend = (backend or os.getenv(PII_DETECTOR_BACKEND, PII_DETECTOR_BACKEND_COMPREHEND)).lower()
+    if backend == PII_DETECTOR_BACKEND_LOCAL:
+        return LocalPiiDetector()
+    if backend != PII_DETECTOR_BACKEND_COMPREHEND:
+        LOGGER.error("Unknown PII detector backend {}, using {}".format(backend, PII_DETECTOR_BACKEND_COMPREHEND))
+    return ComprehendPiiDetector()
+
+
+PII_DETECTOR = create_pii_detector()
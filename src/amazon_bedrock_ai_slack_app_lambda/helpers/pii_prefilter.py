@@ -0,0 +1,129 @@
+import os
+import re
+import threading
+
+# Environment variables configuring the local PII pre-filter
+PII_PREFILTER_ENABLED = "PII_PREFILTER_ENABLED"
+PII_PREFILTER_MIN_DIGIT_RUN = "PII_PREFILTER_MIN_DIGIT_RUN"
+PII_PREFILTER_MAX_CHARS = "PII_PREFILTER_MAX_CHARS"
+
+# Runs of this many digits (separators allowed) could be an account number, PIN, phone number, etc.
+DEFAULT_MIN_DIGIT_RUN = 3
+# Longer texts always go to Comprehend
+DEFAULT_MAX_CHARS = 2000
+
+DIGIT_RUN = "DIGIT_RUN"
+KEYWORD = "KEYWORD"
+CREDIT_DEBIT_NUMBER = "CREDIT_DEBIT_NUMBER"
+
+# Words that announce PII Comprehend detects from context (passwords, PINs, account or document numbers, ...)
+PII_KEYWORDS = (
+    r"passwords?|passwd|pwd|passcodes?|pins?|ssn|social\s+security|accounts?|acct|routing|iban|swift|bic|"
+    r"passports?|driver'?s?\s+licen[cs]es?|licen[cs]e\s+plates?|vin|secrets?|api[\s_-]?keys?|access[\s_-]?keys?|"
+    r"tokens?|credentials?|cvv|cvc|expiry|expiration"
+)
+
+# One named group per entity class, combined into a single pattern so the text is scanned once
+PII_PATTERNS = (
+    ("EMAIL", r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+"),
+    ("AWS_ACCESS_KEY", r"\b(?:AKIA|ASIA|AGPA|AIDA|AROA|ANPA|ANVA|AIPA)[A-Z0-9]{16}\b"),
+    ("AWS_SECRET_KEY", r"(?<![A-Za-z0-9/+=])[A-Za-z0-9/+=]{40}(?![A-Za-z0-9/+=])"),
+    ("MAC_ADDRESS", r"\b[0-9A-Fa-f]{2}(?:[:-][0-9A-Fa-f]{2}){5}\b"),
+    ("IP_ADDRESS", r"\b(?:[0-9A-Fa-f]{1,4}:){2,7}[0-9A-Fa-f]{0,4}\b"),
+    ("SSN", r"\b\d{3}-\d{2}-\d{4}\b"),
+    (CREDIT_DEBIT_NUMBER, r"\b(?:\d[ -]?){12,18}\d\b"),
+    ("PHONE", r"(?:\+\d{1,3}[ .-]?)?\(?\b\d{3}\)?[ .-]?\d{3}[ .-]?\d{4}\b"),
+    # IPv4 addresses, PINs, bank account numbers and others are caught by the digit run
+    (DIGIT_RUN, r"\d(?:[ .,/-]?\d){{{min_digit_run_minus_one},}}"),
+    (KEYWORD, r"(?i:\b(?:" + PII_KEYWORDS + r")\b)"),
+)
+
+SLACK_MENTION_PATTERN = re.compile(r"<[@#!][A-Z0-9]+(?:\|[^>]*)?>")
+
+
+def luhn_valid(number):
+    """
+    :param number: digits, separators are ignored
+    :return: True if the number passes the Luhn checksum used by payment card numbers
+    """
+    digits = [int(digit) for digit in number if digit.isdigit()]
+    checksum = 0
+    for index, digit in enumerate(reversed(digits)):
+        if index % 2 == 1:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        checksum += digit
+    return checksum % 10 == 0
+
+
+class PiiPrefilter:
+    """
+    Local pre-classifier deciding whether a text can skip Comprehend.
+
+    The text is matched against one compiled pattern covering the entity classes the app does not allow (emails,
+    phone numbers, SSNs, payment cards, AWS keys, network addresses, digit runs and keywords that announce passwords,
+    PINs, account or document numbers). Only text without any match is considered clean; everything else, and
+    every text longer than max_chars, still goes to Comprehend. The classes are a superset check, not a replacement:
+    a match does not mean the text contains PII.
+    """
+    def __init__(self, enabled=True, min_digit_run=DEFAULT_MIN_DIGIT_RUN, max_chars=DEFAULT_MAX_CHARS):
+        """
+        :param enabled: False sends every text to Comprehend
+        :param min_digit_run: digit runs of at least this length make the text suspicious
+        :param max_chars: texts longer than this are always sent to Comprehend
+        """
+        self.enabled = enabled
+        self.min_digit_run = min_digit_run
+        self.max_chars = max_chars
+        self.__pattern = re.compile("|".join(
+            "(?P<{}>{})".format(name, pattern.format(min_digit_run_minus_one=max(0, min_digit_run - 1))
+                                if name == DIGIT_RUN else pattern)
+            for name, pattern in PII_PATTERNS))
+        self.__lock = threading.Lock()
+        self.__checked = 0
+        self.__skipped = 0
+
+    def classify(self, text):
+        """
+        :param text: text to check
+        :return: set of suspected entity classes, empty if the text is clean
+        """
+        return set(self.__suspects(text))
+
+    def is_clean(self, text):
+        """
+        :param text: text to check
+        :return: True if the text can skip Comprehend
+        """
+        clean = self.enabled and len(text) <= self.max_chars and next(self.__suspects(text), None) is None
+        with self.__lock:
+            self.__checked += 1
+            if clean:
+                self.__skipped += 1
+        return clean
+
+    def __suspects(self, text):
+        # Slack user/channel mentions are ids, not PII, but contain digits
+        for match in self.__pattern.finditer(SLACK_MENTION_PATTERN.sub(" ", text)):
+            name = match.lastgroup
+            if name == CREDIT_DEBIT_NUMBER and not luhn_valid(match.group()):
+                # not a card number, but still a long number
+                if sum(character.isdigit() for character in match.group()) < self.min_digit_run:
+                    continue
+                name = DIGIT_RUN
+            yield name
+
+    def stats(self):
+        """
+        :return: dict with the number of checked texts and of texts that skipped Comprehend
+        """
+        with self.__lock:
+            return {"checked": self.__checked, "skipped": self.__skipped}
+
+
+PII_PREFILTER = PiiPrefilter(
+    enabled=os.getenv(PII_PREFILTER_ENABLED, "true").lower() == "true",
+    min_digit_run=int(os.getenv(PII_PREFILTER_MIN_DIGIT_RUN, DEFAULT_MIN_DIGIT_RUN)),
+    max_chars=int(os.getenv(PII_PREFILTER_MAX_CHARS, DEFAULT_MAX_CHARS)),
+)
@@ -1,8 +1,9 @@
 import json
 import os
+import threading
+import time
 
-import boto3
-
+from amazon_bedrock_ai_slack_app_lambda.helpers.aws_clients import get_client
 from amazon_bedrock_ai_slack_app_lambda.helpers.logging import LOGGER
 
 BOT_USER_TOKEN_SECRET_ARN = "BOT_USER_TOKEN_SECRET_ARN"
@@ -11,39 +12,146 @@ BOT_USER_TOKEN = "BOT_USER_TOKEN"
 USER_TOKEN_SECRET_ARN = "USER_TOKEN_SECRET_ARN"
 USER_TOKEN = 'USER_TOKEN'
 
+# Environment variables controlling the warm container token cache
+SECRET_CACHE_TTL_SECONDS = "SECRET_CACHE_TTL_SECONDS"
+SECRET_CACHE_REFRESH_AHEAD_SECONDS = "SECRET_CACHE_REFRESH_AHEAD_SECONDS"
+SECRET_CACHE_BACKGROUND_REFRESH = "SECRET_CACHE_BACKGROUND_REFRESH"
+
+DEFAULT_SECRET_CACHE_TTL_SECONDS = 300
+DEFAULT_SECRET_CACHE_REFRESH_AHEAD_SECONDS = 30
+
+
+class CachedSecret:
+    def __init__(self, value, expires_at):
+        """
+        A secret value held in the token cache.
+        :param value: the token extracted from the secret string
+        :param expires_at: monotonic time after which the value has to be fetched again
+        """
+        self.value = value
+        self.expires_at = expires_at
+        self.refreshing = False
+
+
+class SecretCache:
+    """
+    Module level cache for the Slack tokens stored in Secrets Manager. The cache lives as long as the Lambda
+    container, so warm invocations do not call GetSecretValue for every Slack API call.
+
+    Entries expire after ttl_seconds. When background refresh is enabled, an entry that is within
+    refresh_ahead_seconds of expiring is refreshed on a daemon thread while the current value keeps being served.
+    Callers invalidate an entry when Slack rejects the token (e.g. after a rotation).
+    """
+    def __init__(self, ttl_seconds, refresh_ahead_seconds, background_refresh):
+        self.ttl_seconds = ttl_seconds
+        self.refresh_ahead_seconds = refresh_ahead_seconds
+        self.background_refresh = background_refresh
+        self.__entries = {}
+        self.__lock = threading.Lock()
+
+    def get(self, secret_arn_env, secret_key):
+        """
+        Returns the cached token, fetching it from Secrets Manager on a miss or after expiry.
+        :param secret_arn_env: name of the environment variable holding the secret arn
+        :param secret_key: key of the token in the secret string
+        :return: the token
+        """
+        now = time.monotonic()
+        with self.__lock:
+            entry = self.__entries.get(secret_arn_env)
+            if entry and now < entry.expires_at:
+                if (self.background_refresh and not entry.refreshing
+                        and entry.expires_at - now <= self.refresh_ahead_seconds):
+                    entry.refreshing = True
+                    threading.Thread(target=self.__refresh, args=(secret_arn_env, secret_key), daemon=True).start()
+                return entry.value
+
+            # hold the lock while fetching so concurrent callers do not fetch the same secret twice
+            value = self.__fetch(secret_arn_env, secret_key)
+            self.__entries[secret_arn_env] = CachedSecret(value, time.monotonic() + self.ttl_seconds)
+            return value
+
+    def invalidate(self, secret_arn_env=None):
+        """
+        Drops a cached token so the next get() fetches it again.
+        :param secret_arn_env: name of the environment variable holding the secret arn; None drops every entry
+        :return: None
+        """
+        with self.__lock:
+            if secret_arn_env is None:
+                self.__entries.clear()
+            else:
+                self.__entries.pop(secret_arn_env, None)
+        LOGGER.info("Secret cache invalidated for {}".format(secret_arn_env or "all secrets"))
+
+    def __refresh(self, secret_arn_env, secret_key):
+        try:
+            value = self.__fetch(secret_arn_env, secret_key)
+        except Exception as e:
+            LOGGER.error("Background refresh of secret {} failed: {}".format(secret_arn_env, e))
+            with self.__lock:
+                entry = self.__entries.get(secret_arn_env)
+                if entry:
+                    entry.refreshing = False
+            return
+
+        with self.__lock:
+            self.__entries[secret_arn_env] = CachedSecret(value, time.monotonic() + self.ttl_seconds)
+        LOGGER.debug("Secret {} refreshed in background".format(secret_arn_env))
+
+    @staticmethod
+    def __fetch(secret_arn_env, secret_key):
+        """
+        Calls Secrets Manager for the secret referenced by the given environment variable.
+        :param secret_arn_env: name of the environment variable holding the secret arn
+        :param secret_key: key of the token in the secret string
+        :return: the token, empty string if the key is missing
+        """
+        client = get_client("secretsmanager")
+
+        secret_response = client.get_secret_value(SecretId=os.environ[secret_arn_env])
+        LOGGER.debug("Secrets fetched for arn {}".format(os.environ[secret_arn_env]))
+
+        return json.loads(secret_response["SecretString"]).get(secret_key, "")
+
+
+SECRET_CACHE = SecretCache(
+    ttl_seconds=int(os.getenv(SECRET_CACHE_TTL_SECONDS, DEFAULT_SECRET_CACHE_TTL_SECONDS)),
+    refresh_ahead_seconds=int(os.getenv(SECRET_CACHE_REFRESH_AHEAD_SECONDS,
+                                        DEFAULT_SECRET_CACHE_REFRESH_AHEAD_SECONDS)),
+    background_refresh=os.getenv(SECRET_CACHE_BACKGROUND_REFRESH, "false").lower() == "true",
+)
+
 
 def get_bot_user_token():
     """
     Returns the slack bot user oauth token. Requires the secret manager arn for the bot user oauth token
-    to be set as an environment variable.
+    to be set as an environment variable. The token is cached across warm invocations.
     :return:
     """
-    client = boto3.client(service_name="secretsmanager", region_name=os.getenv('AWS_REGION', default='us-west-2'))
-
-    secret_response = client.get_secret_value(SecretId=os.environ[BOT_USER_TOKEN_SECRET_ARN])
-    LOGGER.debug(
-        "Secrets response for arn {} = {}".format(
-            os.environ[BOT_USER_TOKEN_SECRET_ARN], secret_response
-        )
-    )
-
-    return json.loads(secret_response["SecretString"]).get(BOT_USER_TOKEN, "")
+    return SECRET_CACHE.get(BOT_USER_TOKEN_SECRET_ARN, BOT_USER_TOKEN)
 
 
 def get_user_token():
     """
     Returns the slack user oauth token. Requires the secret manager arn for the bot user oauth token
-    to be set as an environment variable.
+    to be set as an environment variable. The token is cached across warm invocations.
     :return:
     """
-    client = boto3.client(service_name="secretsmanager",
-                          region_name=os.getenv('AWS_REGION', default='us-west-2'))
+    return SECRET_CACHE.get(USER_TOKEN_SECRET_ARN, USER_TOKEN)
+
 
-    secret_response = client.get_secret_value(SecretId=os.environ[USER_TOKEN_SECRET_ARN])
-    LOGGER.debug(
-        "Secrets response for arn {} = {}".format(
-            os.environ[USER_TOKEN_SECRET_ARN], secret_response
-        )
-    )
+def invalidate_bot_user_token():
+    """
+    Drops the cached bot user token, e.g. after Slack rejected it as revoked or invalid.
+    :return: None
+    """
+    SECRET_CACHE.invalidate(BOT_USER_TOKEN_SECRET_ARN)
 
-    return json.loads(secret_response["SecretString"]).get(USER_TOKEN, "")
+
+def invalidate_user_token():
+    """
+    Drops the cached user token, e.g. after Slack rejected it as revoked or invalid.
+    :return: None
+    """
+    SECRET_CACHE.invalidate(USER_TOKEN_SECRET_ARN)
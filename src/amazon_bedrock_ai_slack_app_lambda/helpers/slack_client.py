@@ -0,0 +1,190 @@
+import http.client
+import json
+import os
+import queue
+import ssl
+import urllib.parse
+
+from amazon_bedrock_ai_slack_app_lambda.helpers.logging import LOGGER
+from amazon_bedrock_ai_slack_app_lambda.helpers.secrets_helper import (
+    get_bot_user_token,
+    invalidate_bot_user_token,
+)
+from amazon_bedrock_ai_slack_app_lambda.helpers.slack_rate_limiter import SLACK_RATE_LIMITED_ERROR, SlackRateLimiter
+
+SLACK_API_BASE_URL = "https://slack.com/api"
+
+# Environment variables to tune the Slack HTTP transport
+SLACK_HTTP_POOL_SIZE = "SLACK_HTTP_POOL_SIZE"
+SLACK_HTTP_CONNECT_TIMEOUT_SECONDS = "SLACK_HTTP_CONNECT_TIMEOUT_SECONDS"
+SLACK_HTTP_READ_TIMEOUT_SECONDS = "SLACK_HTTP_READ_TIMEOUT_SECONDS"
+
+DEFAULT_SLACK_HTTP_POOL_SIZE = 10
+DEFAULT_SLACK_HTTP_CONNECT_TIMEOUT_SECONDS = 3.0
+DEFAULT_SLACK_HTTP_READ_TIMEOUT_SECONDS = 10.0
+
+# Slack errors returned when the token was rotated or revoked; the cached token is refreshed once on these
+SLACK_TOKEN_ERRORS = ("invalid_auth", "token_revoked")
+
+HTTP_TOO_MANY_REQUESTS = 429
+
+# Errors raised when a pooled keep-alive connection was closed by the server while idle
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+
+class SlackClient:
+    """
+    Thread safe Slack Web API client keeping a pool of keep-alive HTTPS connections to slack.com.
+
+    The client is created once per Lambda container, so warm invocations and every streaming update reuse the
+    already established TCP/TLS connections. At most pool_size idle connections are kept; concurrent calls beyond
+    that open extra connections which are closed after use. Calls are scheduled by the rate limiter, which retries
+    rate limited calls after their Retry-After.
+    """
+    def __init__(self, base_url=SLACK_API_BASE_URL, pool_size=DEFAULT_SLACK_HTTP_POOL_SIZE,
+                 connect_timeout=DEFAULT_SLACK_HTTP_CONNECT_TIMEOUT_SECONDS,
+                 read_timeout=DEFAULT_SLACK_HTTP_READ_TIMEOUT_SECONDS,
+                 token_provider=get_bot_user_token, token_invalidator=invalidate_bot_user_token,
+                 rate_limiter=None):
+        """
+        :param base_url: Slack Web API base url, http urls are supported for testing against a local server
+        :param pool_size: maximum number of idle connections kept for reuse
+        :param connect_timeout: timeout in seconds for establishing a connection
+        :param read_timeout: timeout in seconds for reading a response
+        :param token_provider: function returning the bearer token
+        :param token_invalidator: function dropping a cached token that Slack rejected
+        :param rate_limiter: SlackRateLimiter scheduling the calls, a new one by default
+        """
+        url = urllib.parse.urlsplit(base_url)
+        self.__secure = url.scheme == "https"
+        self.__host = url.hostname
+        self.__port = url.port
+        self.__base_path = url.path.rstrip("/")
+        self.__connect_timeout = connect_timeout
+        self.__read_timeout = read_timeout
+        self.__token_provider = token_provider
+        self.__token_invalidator = token_invalidator
+        self.__ssl_context = ssl.create_default_context() if self.__secure else None
+        self.__pool: "queue.LifoQueue[http.client.HTTPConnection]" = queue.LifoQueue(maxsize=pool_size)
+        self.rate_limiter = rate_limiter if rate_limiter is not None else SlackRateLimiter()
+
+    def api_call(self, api_method, params=None, http_method="POST"):
+        """
+        Calls a Slack Web API method with the bot token. If Slack rejects the token the cached token is
+        invalidated and the call is retried once with a freshly fetched token.
+        :param api_method: Slack Web API method, e.g. chat.postMessage
+        :param params: dict of arguments, form encoded for POST and sent as query string for GET
+        :param http_method: POST or GET
+        :return: the parsed slack api response
+        """
+        return self.rate_limiter.call(api_method, params,
+                                      lambda call_params: self.__call_with_token(api_method, call_params, http_method))
+
+    def close(self):
+        """
+        Closes every pooled connection.
+        :return: None
+        """
+        while True:
+            try:
+                self.__pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def __call_with_token(self, api_method, params, http_method):
+        """
+        :return: tuple (parsed slack api response, Retry-After seconds or None)
+        """
+        response_json, retry_after = self.__call(api_method, params, http_method)
+        if response_json.get("error") in SLACK_TOKEN_ERRORS:
+            LOGGER.info("Slack rejected the cached bot token, refreshing it")
+            self.__token_invalidator()
+            response_json, retry_after = self.__call(api_method, params, http_method)
+        return response_json, retry_after
+
+    def __call(self, api_method, params, http_method):
+        encoded_params = urllib.parse.urlencode(params or {})
+        path = "{}/{}".format(self.__base_path, api_method)
+        headers = {"Authorization": "Bearer " + self.__token_provider()}
+        if http_method == "GET":
+            body = None
+            if encoded_params:
+                path = "{}?{}".format(path, encoded_params)
+        else:
+            body = encoded_params.encode("ascii")
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+
+        status, response, retry_after = self.__send(http_method, path, body, headers)
+        LOGGER.debug("Slack {} responded with status {}".format(api_method, status))
+        if status == HTTP_TOO_MANY_REQUESTS:
+            return {"ok": False, "error": SLACK_RATE_LIMITED_ERROR}, retry_after
+        return json.loads(response.decode("utf-8")), retry_after
+
+    def __send(self, http_method, path, body, headers):
+        """
+        Sends the request on a pooled connection. A request failing on a reused connection that the server
+        closed while idle is retried once on a new connection.
+        :return: tuple (http status, response body, Retry-After seconds or None)
+        """
+        connection, reused = self.__acquire()
+        try:
+            return self.__send_on(connection, http_method, path, body, headers)
+        except STALE_CONNECTION_ERRORS:
+            connection.close()
+            if not reused:
+                raise
+            LOGGER.debug("Pooled Slack connection was closed by the server, reconnecting")
+            connection = self.__connect()
+            try:
+                return self.__send_on(connection, http_method, path, body, headers)
+            except Exception:
+                connection.close()
+                raise
+        except Exception:
+            connection.close()
+            raise
+
+    def __send_on(self, connection, http_method, path, body, headers):
+        connection.request(http_method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        # the body has to be fully read before the connection can be reused
+        response_body = response.read()
+        retry_after = response.getheader("Retry-After")
+        if response.will_close:
+            connection.close()
+        else:
+            self.__release(connection)
+        return response.status, response_body, int(retry_after) if retry_after and retry_after.isdigit() else None
+
+    def __acquire(self):
+        """
+        :return: tuple (connection, True if the connection was taken from the pool)
+        """
+        try:
+            return self.__pool.get_nowait(), True
+        except queue.Empty:
+            return self.__connect(), False
+
+    def __release(self, connection):
+        try:
+            self.__pool.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def __connect(self):
+        connection: http.client.HTTPConnection
+        if self.__secure:
+            connection = http.client.HTTPSConnection(self.__host, self.__port, timeout=self.__connect_timeout,
+                                                     context=self.__ssl_context)
+        else:
+            connection = http.client.HTTPConnection(self.__host, self.__port, timeout=self.__connect_timeout)
+        connection.connect()
+        connection.sock.settimeout(self.__read_timeout)
+        return connection
+
+
+SLACK_CLIENT = SlackClient(
+    pool_size=int(os.getenv(SLACK_HTTP_POOL_SIZE, DEFAULT_SLACK_HTTP_POOL_SIZE)),
+    connect_timeout=float(os.getenv(SLACK_HTTP_CONNECT_TIMEOUT_SECONDS, DEFAULT_SLACK_HTTP_CONNECT_TIMEOUT_SECONDS)),
+    read_timeout=float(os.getenv(SLACK_HTTP_READ_TIMEOUT_SECONDS, DEFAULT_SLACK_HTTP_READ_TIMEOUT_SECONDS)),
+)
@@ -1,45 +1,79 @@
-import json
-import urllib.parse
-import urllib.request
-
+from typing import List
+
+from amazon_bedrock_ai_slack_app_lambda.helpers.constants import (
+    BOT_IDENTITY_CACHE_TTL_SECONDS,
+    CHANNEL_INFO_CACHE_MAX_SIZE,
+    CHANNEL_INFO_CACHE_TTL_SECONDS,
+    SLACK_HISTORY_MAX_PAGES,
+    SLACK_HISTORY_PAGE_SIZE,
+    USER_INFO_CACHE_MAX_SIZE,
+    USER_INFO_CACHE_TTL_SECONDS,
+)
 from amazon_bedrock_ai_slack_app_lambda.helpers.logging import LOGGER
-from amazon_bedrock_ai_slack_app_lambda.helpers.secrets_helper import get_bot_user_token
+from amazon_bedrock_ai_slack_app_lambda.helpers.slack_client import SLACK_CLIENT
+from amazon_bedrock_ai_slack_app_lambda.helpers.thread_cache import THREAD_MESSAGE_CACHE, merge_messages
+from amazon_bedrock_ai_slack_app_lambda.helpers.ttl_cache import TtlLruCache
 from amazon_bedrock_ai_slack_app_lambda.helpers.utils import get_sorted_messages
 from amazon_bedrock_ai_slack_app_lambda.validation.slack_params_validator import (
     SLACK_PARAMETER_VALIDATOR,
 )
 
-SLACK_POST_MESSAGE_URL = "https://slack.com/api/chat.postMessage"
-SLACK_USER_INFO_URL = "https://slack.com/api/users.info?user="
-SLACK_UPDATE_CHAT_URL = "https://slack.com/api/chat.update"
-SLACK_CONVERSATION_HISTORY = "https://slack.com/api/conversations.history"
-SLACK_CONVERSATION_REPLIES = "https://slack.com/api/conversations.replies"
-SLACK_CONVERSATION_INFO = "https://slack.com/api/conversations.info"
-SLACK_AUTH_TEST = "https://slack.com/api/auth.test"
+SLACK_POST_MESSAGE = "chat.postMessage"
+SLACK_USER_INFO = "users.info"
+SLACK_UPDATE_CHAT = "chat.update"
+SLACK_CONVERSATION_HISTORY = "conversations.history"
+SLACK_CONVERSATION_REPLIES = "conversations.replies"
+SLACK_CONVERSATION_INFO = "conversations.info"
+SLACK_AUTH_TEST = "auth.test"
 
+# Caches shared across warm invocations: bot identity (auth.test), conversations.info and users.info results
+BOT_IDENTITY_CACHE = TtlLruCache(max_size=1, ttl_seconds=BOT_IDENTITY_CACHE_TTL_SECONDS)
+CHANNEL_INFO_CACHE = TtlLruCache(max_size=CHANNEL_INFO_CACHE_MAX_SIZE, ttl_seconds=CHANNEL_INFO_CACHE_TTL_SECONDS)
+USER_INFO_CACHE = TtlLruCache(max_size=USER_INFO_CACHE_MAX_SIZE, ttl_seconds=USER_INFO_CACHE_TTL_SECONDS)
 
-def get_channel_type(channel_id):
+
+def get_slack_cache_stats():
     """
-    Retrieve the conversation info , like IM/Private/Chat/etc based on channel id.
-    :param channel_id:
-    :return: slack api response
+    Hit/miss counters of the Slack metadata caches.
+    :return: dict of cache name to the cache stats
     """
-    SLACK_PARAMETER_VALIDATOR.validate_channel_id(channel_id)
-    data = {
-        "channel": channel_id,
+    return {
+        "bot_identity": BOT_IDENTITY_CACHE.stats(),
+        "channel_info": CHANNEL_INFO_CACHE.stats(),
+        "user_info": USER_INFO_CACHE.stats(),
+        "thread_messages": THREAD_MESSAGE_CACHE.stats(),
     }
 
-    data_content = urllib.parse.urlencode(data).encode("ascii")
 
-    headers = {"Authorization": "Bearer " + get_bot_user_token()}
+def get_slack_rate_limiter_stats(reset=False):
+    """
+    Queue and throttle counters of the Slack calls.
+    :param reset: True starts new counters
+    :return: dict of method family to the counters
+    """
+    return SLACK_CLIENT.rate_limiter.stats(reset)
 
-    request = urllib.request.Request(SLACK_CONVERSATION_INFO, data=data_content, headers=headers)
-    request.add_header("Content-Type", "application/x-www-form-urlencoded")
 
-    response = urllib.request.urlopen(request).read()
-    response_json = json.loads(response.decode("utf-8"))
-    LOGGER.debug("slack_conversation_info = {}".format(response_json))
-    if response_json.get('channel').get('is_im'):
+def get_channel_type(channel_id):
+    """
+    Retrieve the conversation info , like IM/Private/Chat/etc based on channel id.
+    :param channel_id:
+    :return: slack api response
+    """
+    SLACK_PARAMETER_VALIDATOR.validate_channel_id(channel_id)
+    channel = CHANNEL_INFO_CACHE.get(channel_id)
+    if channel is None:
+        data = {
+            "channel": channel_id,
+        }
+
+        response_json = SLACK_CLIENT.api_call(SLACK_CONVERSATION_INFO, data)
+        LOGGER.debug("slack_conversation_info = {}".format(response_json))
+        channel = response_json.get('channel')
+        if response_json.get('ok'):
+            CHANNEL_INFO_CACHE.put(channel_id, channel)
+
+    if channel.get('is_im'):
         return 'im'
 
     return 'channel'
@@ -50,22 +84,23 @@ def get_bot_user_id():
     This method checks authentication and tells "you" who you are, even if you might be a bot.
     :return: slack api response
     """
+    bot_user_id = BOT_IDENTITY_CACHE.get(SLACK_AUTH_TEST)
+    if bot_user_id is not None:
+        return bot_user_id
 
-    headers = {"Authorization": "Bearer " + get_bot_user_token()}
-
-    request = urllib.request.Request(SLACK_AUTH_TEST, headers=headers)
-    request.add_header("Content-Type", "application/x-www-form-urlencoded")
-
-    response = urllib.request.urlopen(request).read()
-    response_json = json.loads(response.decode("utf-8"))
+    response_json = SLACK_CLIENT.api_call(SLACK_AUTH_TEST, http_method="GET")
 
     LOGGER.debug("get_bot_user_id = {}".format(response_json))
-    return response_json.get("user_id")
+    bot_user_id = response_json.get("user_id")
+    if bot_user_id:
+        BOT_IDENTITY_CACHE.put(SLACK_AUTH_TEST, bot_user_id)
+    return bot_user_id
 
 
 def get_thread_replies(channel_id, parent_ts):
     """
     Retrieve the conversation replies the conversation conversations.replies API.
+    Only the replies after the newest cached message of the thread are fetched, page by page.
     :param channel_id:
     :param parent_ts: parent message ts
     :return: slack api response
@@ -75,45 +110,67 @@ def get_thread_replies(channel_id, parent_ts):
         "channel": channel_id,
         "ts": parent_ts,
     }
+    cached_messages = THREAD_MESSAGE_CACHE.get(channel_id, parent_ts)
+    if cached_messages:
+        data["oldest"] = cached_messages[-1]["ts"]
 
-    data_content = urllib.parse.urlencode(data).encode("ascii")
-
-    headers = {"Authorization": "Bearer " + get_bot_user_token()}
+    new_messages, complete = __fetch_messages(SLACK_CONVERSATION_REPLIES, data)
+    LOGGER.debug("get_thread_replies cached={} fetched={}".format(len(cached_messages or []), len(new_messages)))
 
-    request = urllib.request.Request(SLACK_CONVERSATION_REPLIES, data=data_content, headers=headers)
-    request.add_header("Content-Type", "application/x-www-form-urlencoded")
-
-    response = urllib.request.urlopen(request).read()
-    response_json = json.loads(response.decode("utf-8"))
-
-    LOGGER.debug("get_conversation_history = {}".format(response_json))
-    return get_sorted_messages(response_json.get("messages"))
+    messages = merge_messages(cached_messages or [], new_messages)
+    if complete:
+        THREAD_MESSAGE_CACHE.put(channel_id, parent_ts, messages)
+    return get_sorted_messages(messages)
 
 
 def get_conversation_history(channel_id, limit):
     """
     Retrieve the conversation history for a Slack channel using the conversations.history API.
     :param channel_id:
+    :param limit: maximum number of messages
     :return: slack api response
     """
     SLACK_PARAMETER_VALIDATOR.validate_channel_id(channel_id)
     data = {
         "channel": channel_id,
-        "limit": limit,
     }
 
-    data_content = urllib.parse.urlencode(data).encode("ascii")
-
-    headers = {"Authorization": "Bearer " + get_bot_user_token()}
-
-    request = urllib.request.Request(SLACK_CONVERSATION_HISTORY, data=data_content, headers=headers)
-    request.add_header("Content-Type", "application/x-www-form-urlencoded")
+    messages, _ = __fetch_messages(SLACK_CONVERSATION_HISTORY, data, limit)
+    LOGGER.debug("get_conversation_history fetched={}".format(len(messages)))
+    return get_sorted_messages(messages, newest_first=True)
 
-    response = urllib.request.urlopen(request).read()
-    response_json = json.loads(response.decode("utf-8"))
 
-    LOGGER.debug("get_conversation_history = {}".format(response_json))
-    return get_sorted_messages(response_json.get("messages"))
+def __fetch_messages(api_method, data, limit=None):
+    """
+    Fetches the messages of a conversations.replies/history request, following the response_metadata.next_cursor
+    of every page.
+    :param api_method: conversations.replies or conversations.history
+    :param data: arguments of the request, without the paging arguments
+    :param limit: maximum number of messages, None for all
+    :return: tuple (list of messages in the order Slack returned them, True if every page was fetched)
+    """
+    messages: List[dict] = []
+    cursor = None
+    for _ in range(SLACK_HISTORY_MAX_PAGES):
+        page_size = SLACK_HISTORY_PAGE_SIZE if limit is None else min(limit - len(messages), SLACK_HISTORY_PAGE_SIZE)
+        page_data = dict(data, limit=page_size)
+        if cursor:
+            page_data["cursor"] = cursor
+
+        response_json = SLACK_CLIENT.api_call(api_method, page_data)
+        if not response_json.get("ok"):
+            LOGGER.error("{} failed: {}".format(api_method, response_json.get("error")))
+            return messages, False
+
+        messages.extend(response_json.get("messages", []))
+        cursor = response_json.get("response_metadata", {}).get("next_cursor")
+        if not cursor:
+            return messages, True
+        if limit is not None and len(messages) >= limit:
+            return messages[:limit], True
+
+    LOGGER.info("{} returned more than {} pages".format(api_method, SLACK_HISTORY_MAX_PAGES))
+    return messages, False
 
 
 def send_chat(channel_id, response_message, parent_ts=None):
@@ -125,7 +182,6 @@ def send_chat(channel_id, response_message, parent_ts=None):
     """
     SLACK_PARAMETER_VALIDATOR.validate_channel_id(channel_id)
     data = {
-        "token": get_bot_user_token(),
         "channel": channel_id,
         "text": response_message,
     }
@@ -133,14 +189,9 @@ def send_chat(channel_id, response_message, parent_ts=None):
         data['thread_ts'] = parent_ts
 
     LOGGER.info("Sending message at {}".format(channel_id))
-    data_content = urllib.parse.urlencode(data).encode("ascii")
-
-    request = urllib.request.Request(SLACK_POST_MESSAGE_URL, data=data_content, method="POST")
-    request.add_header("Content-Type", "application/x-www-form-urlencoded")
-
-    response = urllib.request.urlopen(request).read()
-    LOGGER.debug("send_chat = {}".format(json.loads(response.decode("utf-8"))))
-    return response
+    response_json = SLACK_CLIENT.api_call(SLACK_POST_MESSAGE, data)
+    LOGGER.debug("send_chat = {}".format(response_json))
+    return response_json
 
 
 def update_chat(bedrock_invoker_metadata, response_message, parent_ts):
@@ -154,20 +205,14 @@ def update_chat(bedrock_invoker_metadata, response_message, parent_ts):
     SLACK_PARAMETER_VALIDATOR.validate_channel_id(bedrock_invoker_metadata.channel_id)
     SLACK_PARAMETER_VALIDATOR.validate_disclaimer_ts(parent_ts)
     data = {
-        "token": get_bot_user_token(),
         "channel": bedrock_invoker_metadata.channel_id,
         "text": response_message,
         "ts": parent_ts,
     }
     LOGGER.info("Updating message at {}/{}".format(bedrock_invoker_metadata.channel_id, parent_ts))
-    data_content = urllib.parse.urlencode(data).encode("ascii")
-
-    request = urllib.request.Request(SLACK_UPDATE_CHAT_URL, data=data_content, method="POST")
-    request.add_header("Content-Type", "application/x-www-form-urlencoded")
-
-    response = urllib.request.urlopen(request).read()
-    LOGGER.debug("update_chat = {}".format(json.loads(response.decode("utf-8"))))
-    return response
+    response_json = SLACK_CLIENT.api_call(SLACK_UPDATE_CHAT, data)
+    LOGGER.debug("update_chat = {}".format(response_json))
+    return response_json
 
 
 def get_user_from_userid(user):
@@ -176,12 +221,12 @@ def get_user_from_userid(user):
     :param user:
     :return: slack api response
     """
-    url = SLACK_USER_INFO_URL + user
-    headers = {"Authorization": "Bearer " + get_bot_user_token()}
-
-    request = urllib.request.Request(url, headers=headers)
-    request.add_header("Content-Type", "application/x-www-form-urlencoded")
-
-    response = urllib.request.urlopen(request).read()
-    LOGGER.debug("get_user_from_userid = {}".format(json.loads(response.decode("utf-8"))))
-    return json.loads(response.decode("utf-8"))
+    response_json = USER_INFO_CACHE.get(user)
+    if response_json is not None:
+        return response_json
+
+    response_json = SLACK_CLIENT.api_call(SLACK_USER_INFO, {"user": user}, http_method="GET")
+    LOGGER.debug("get_user_from_userid = {}".format(response_json))
+    if response_json.get('ok'):
+        USER_INFO_CACHE.put(user, response_json)
+    return response_json
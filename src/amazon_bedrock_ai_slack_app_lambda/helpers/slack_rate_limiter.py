@@ -0,0 +1,187 @@
+import threading
+import time
+from collections import OrderedDict
+
+from amazon_bedrock_ai_slack_app_lambda.helpers.logging import LOGGER
+
+SLACK_RATE_LIMITED_ERROR = "ratelimited"
+
+# Token buckets per Slack method (prefix match, first match wins): (method prefix, requests per second, burst).
+# chat.update and conversations.* are Tier 3 (50+ per minute), chat.postMessage allows about one message per second
+# per channel. Methods without a bucket (users.info, auth.test) are cached and not limited locally.
+SLACK_METHOD_RATE_LIMITS = (
+    ("chat.update", 50 / 60, 10),
+    ("chat.postMessage", 1, 5),
+    ("conversations.", 50 / 60, 20),
+)
+
+# Calls waiting longer than this for a token fail locally with the ratelimited error
+DEFAULT_MAX_WAIT_SECONDS = 10
+# Requests Slack rate limited are retried after Retry-After up to this many times
+DEFAULT_MAX_RETRIES = 2
+# Retry-After used when a ratelimited response does not carry the header
+DEFAULT_RETRY_AFTER_SECONDS = 1
+
+# Method prefixes Slack rate limits per channel, they get one bucket per channel
+PER_CHANNEL_METHOD_PREFIXES = {"chat.postMessage"}
+# Per channel buckets kept, the least recently used one is dropped beyond this
+MAX_CHANNEL_BUCKETS = 1024
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at rate tokens per second up to burst tokens. Not thread safe, SlackRateLimiter guards it.
+    """
+    def __init__(self, rate, burst, clock=time.monotonic):
+        """
+        :param rate: tokens added per second
+        :param burst: maximum number of tokens
+        :param clock: monotonic clock in seconds
+        """
+        self.rate = rate
+        self.burst = burst
+        self.__clock = clock
+        self.__tokens = burst
+        self.__updated = clock()
+        self.__blocked_until = 0
+
+    def try_acquire(self):
+        """
+        :return: 0 if a token was taken, otherwise the seconds to wait before the next attempt
+        """
+        now = self.__clock()
+        if now < self.__blocked_until:
+            return self.__blocked_until - now
+        self.__tokens = min(self.burst, self.__tokens + (now - self.__updated) * self.rate)
+        self.__updated = now
+        if self.__tokens >= 1:
+            self.__tokens -= 1
+            return 0
+        return (1 - self.__tokens) / self.rate
+
+    def block(self, seconds):
+        """
+        Hands out no tokens for the given time, e.g. the Retry-After of a rate limited response.
+        :param seconds: seconds to block
+        :return: None
+        """
+        self.__blocked_until = max(self.__blocked_until, self.__clock() + seconds)
+        self.__tokens = 0
+
+
+class SlackRateLimiter:
+    """
+    Schedules Slack Web API calls of the container through one token bucket per method family, and per channel for
+    the families Slack limits per channel, so concurrent streams share the rate limits instead of running into them.
+
+    Rate limited responses block the bucket for their Retry-After and are retried. Queue depth, waits and throttles
+    are counted per method family.
+    """
+    def __init__(self, limits=SLACK_METHOD_RATE_LIMITS, max_wait_seconds=DEFAULT_MAX_WAIT_SECONDS,
+                 max_retries=DEFAULT_MAX_RETRIES, per_channel=PER_CHANNEL_METHOD_PREFIXES, clock=time.monotonic):
+        """
+        :param limits: tuples (method prefix, requests per second, burst)
+        :param max_wait_seconds: maximum seconds a call waits for a token
+        :param max_retries: retries of calls Slack rate limited
+        :param per_channel: method prefixes with one bucket per channel
+        :param clock: monotonic clock in seconds
+        """
+        self.max_wait_seconds = max_wait_seconds
+        self.max_retries = max_retries
+        self.__clock = clock
+        self.__condition = threading.Condition()
+        self.__limits = {prefix: (rate, burst) for prefix, rate, burst in limits}
+        self.__per_channel = set(per_channel)
+        self.__buckets = {prefix: TokenBucket(rate, burst, clock) for prefix, (rate, burst) in self.__limits.items()
+                          if prefix not in self.__per_channel}
+        self.__channel_buckets: "OrderedDict[tuple, TokenBucket]" = OrderedDict()
+        self.__stats = {prefix: self.__new_stats() for prefix in self.__limits}
+
+    def call(self, api_method, params, send):
+        """
+        :param api_method: Slack Web API method, e.g. chat.update
+        :param params: dict of arguments
+        :param send: function sending params, returning tuple (response json, Retry-After seconds or None)
+        :return: the Slack response, {"ok": False, "error": "ratelimited"} if no token was available in time
+        """
+        prefix = self.__bucket_prefix(api_method)
+        if prefix is None:
+            return send(params)[0]
+
+        channel_id = (params or {}).get("channel") if prefix in self.__per_channel else None
+        bucket_key = (prefix, channel_id)
+        response_json = None
+        for attempt in range(self.max_retries + 1):
+            if not self.__acquire(prefix, bucket_key):
+                LOGGER.info("No Slack {} token within {} seconds".format(prefix, self.max_wait_seconds))
+                return {"ok": False, "error": SLACK_RATE_LIMITED_ERROR}
+
+            response_json, retry_after = send(params)
+            if response_json.get("error") != SLACK_RATE_LIMITED_ERROR:
+                return response_json
+
+            retry_after = DEFAULT_RETRY_AFTER_SECONDS if retry_after is None else retry_after
+            LOGGER.info("Slack rate limited {}, retrying after {} seconds".format(api_method, retry_after))
+            with self.__condition:
+                self.__get_bucket(bucket_key).block(retry_after)
+                self.__stats[prefix]["throttled"] += 1
+        return response_json
+
+    def stats(self, reset=False):
+        """
+        :param reset: True starts new counters, e.g. once they were published for an invocation
+        :return: dict of method prefix to the counters queue_depth, max_queue_depth, waited_seconds and throttled
+        """
+        with self.__condition:
+            stats = {prefix: dict(counters) for prefix, counters in self.__stats.items()}
+            if reset:
+                for counters in self.__stats.values():
+                    counters.update(self.__new_stats(), queue_depth=counters["queue_depth"],
+                                    max_queue_depth=counters["queue_depth"])
+            return stats
+
+    def __bucket_prefix(self, api_method):
+        for prefix in self.__limits:
+            if api_method.startswith(prefix):
+                return prefix
+        return None
+
+    def __get_bucket(self, bucket_key):
+        # callers hold the condition
+        prefix = bucket_key[0]
+        if prefix not in self.__per_channel:
+            return self.__buckets[prefix]
+        bucket = self.__channel_buckets.get(bucket_key)
+        if bucket is None:
+            bucket = TokenBucket(*self.__limits[prefix], clock=self.__clock)
+            self.__channel_buckets[bucket_key] = bucket
+            if len(self.__channel_buckets) > MAX_CHANNEL_BUCKETS:
+                # a dropped bucket is recreated full, the channel has been idle for a while
+                self.__channel_buckets.popitem(last=False)
+        else:
+            self.__channel_buckets.move_to_end(bucket_key)
+        return bucket
+
+    def __acquire(self, prefix, bucket_key):
+        stats = self.__stats[prefix]
+        start = self.__clock()
+        deadline = start + self.max_wait_seconds
+        with self.__condition:
+            bucket = self.__get_bucket(bucket_key)
+            stats["queue_depth"] += 1
+            stats["max_queue_depth"] = max(stats["max_queue_depth"], stats["queue_depth"])
+            try:
+                while True:
+                    wait = bucket.try_acquire()
+                    if wait == 0:
+                        return True
+                    if self.__clock() + wait > deadline:
+                        return False
+                    self.__condition.wait(wait)
+            finally:
+                stats["queue_depth"] -= 1
+                stats["waited_seconds"] += self.__clock() - start
+
+    @staticmethod
+    def __new_stats():
+        return {"queue_depth": 0, "max_queue_depth": 0, "waited_seconds": 0.0, "throttled": 0}
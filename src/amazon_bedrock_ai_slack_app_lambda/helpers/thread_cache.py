@@ -0,0 +1,178 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from amazon_bedrock_ai_slack_app_lambda.helpers.aws_clients import get_client
+from amazon_bedrock_ai_slack_app_lambda.helpers.constants import STREAMING_UPDATE_TIMEOUT_SECONDS
+from amazon_bedrock_ai_slack_app_lambda.helpers.logging import LOGGER
+from amazon_bedrock_ai_slack_app_lambda.helpers.ttl_cache import TtlLruCache
+
+# Environment variables configuring the thread message cache. Without a table name threads are only cached in memory.
+THREAD_CACHE_TABLE_NAME = "THREAD_CACHE_TABLE_NAME"
+THREAD_CACHE_TTL_SECONDS = "THREAD_CACHE_TTL_SECONDS"
+THREAD_CACHE_MAX_SIZE = "THREAD_CACHE_MAX_SIZE"
+
+DEFAULT_THREAD_CACHE_TTL_SECONDS = 24 * 3600
+DEFAULT_THREAD_CACHE_MAX_SIZE = 128
+
+# DynamoDB items are limited to 400 KB; longer threads are only cached in memory
+MAX_PERSISTED_MESSAGES_BYTES = 350000
+
+# Partition key, and the DynamoDB TTL attribute (epoch seconds) the table must be configured with
+THREAD_KEY_ATTRIBUTE = "thread_key"
+MESSAGES_ATTRIBUTE = "messages"
+EXPIRES_AT_ATTRIBUTE = "expires_at"
+
+# Fields of the Slack messages the prompt is built from
+CACHED_MESSAGE_FIELDS = ("ts", "user", "text", "subtype", "bot_id")
+
+
+class ThreadMessageCache:
+    """
+    Incremental cache of the messages of Slack threads, keyed by channel id and thread timestamp.
+
+    Only settled messages are cached, in timestamp order: the cache stops before the first bot message that may still
+    be updated by a streaming response. The newest cached timestamp is the high-water mark, later fetches only ask
+    Slack for the messages after it. Edits and deletions of cached messages are picked up once the entry expires.
+
+    Entries are kept in memory and optionally in a DynamoDB table with a TTL attribute. Cache failures are logged and
+    treated as misses, they never fail the request.
+    """
+    def __init__(self, table_name=None, ttl_seconds=DEFAULT_THREAD_CACHE_TTL_SECONDS,
+                 max_size=DEFAULT_THREAD_CACHE_MAX_SIZE, dynamodb_client_provider=lambda: get_client("dynamodb"),
+                 write_executor=None):
+        """
+        :param table_name: DynamoDB table, None to only cache in memory
+        :param ttl_seconds: lifetime of a cached thread after its last update
+        :param max_size: maximum threads of the in-memory cache
+        :param dynamodb_client_provider: function returning the DynamoDB client
+        :param write_executor: executor the table writes are submitted to, None writes synchronously
+        """
+        self.table_name = table_name
+        self.ttl_seconds = ttl_seconds
+        self.__memory_cache = TtlLruCache(max_size=max_size, ttl_seconds=ttl_seconds)
+        self.__dynamodb_client_provider = dynamodb_client_provider
+        self.__write_executor = write_executor
+
+    def get(self, channel_id, thread_ts):
+        """
+        :param channel_id: channel of the thread
+        :param thread_ts: timestamp of the parent message
+        :return: list of the cached Slack messages in timestamp order, None if the thread is not cached
+        """
+        key = thread_key(channel_id, thread_ts)
+        messages = self.__memory_cache.get(key)
+        if messages is not None or not self.table_name:
+            return messages
+
+        try:
+            item = self.__dynamodb_client_provider().get_item(
+                TableName=self.table_name,
+                Key={THREAD_KEY_ATTRIBUTE: {'S': key}},
+                ProjectionExpression='{}, {}'.format(MESSAGES_ATTRIBUTE, EXPIRES_AT_ATTRIBUTE),
+            ).get("Item")
+        except Exception as e:
+            LOGGER.error("Reading the thread cache failed: {}".format(e))
+            return None
+
+        # DynamoDB deletes expired items lazily
+        if not item or int(item[EXPIRES_AT_ATTRIBUTE]['N']) <= int(time.time()):
+            return None
+        messages = json.loads(item[MESSAGES_ATTRIBUTE]['S'])
+        self.__memory_cache.put(key, messages)
+        return messages
+
+    def put(self, channel_id, thread_ts, messages):
+        """
+        Caches the settled messages of a thread.
+        :param channel_id: channel of the thread
+        :param thread_ts: timestamp of the parent message
+        :param messages: every known Slack message of the thread in timestamp order
+        :return: the cached messages
+        """
+        key = thread_key(channel_id, thread_ts)
+        settled_messages = get_settled_messages(messages)
+        self.__memory_cache.put(key, settled_messages)
+
+        if self.table_name:
+            if self.__write_executor is not None:
+                self.__write_executor.submit(self.__write, key, settled_messages)
+            else:
+                self.__write(key, settled_messages)
+        return settled_messages
+
+    def stats(self):
+        """
+        :return: hit/miss counters of the in-memory cache
+        """
+        return self.__memory_cache.stats()
+
+    def invalidate(self):
+        """
+        Drops the in-memory entries, the table entries expire through the DynamoDB TTL.
+        :return: None
+        """
+        self.__memory_cache.invalidate()
+
+    def __write(self, key, messages):
+        serialized_messages = json.dumps(messages)
+        if len(serialized_messages.encode('utf-8')) > MAX_PERSISTED_MESSAGES_BYTES:
+            LOGGER.info("Thread {} is too long to be persisted in the thread cache".format(key))
+            return
+        try:
+            self.__dynamodb_client_provider().put_item(
+                TableName=self.table_name,
+                Item={
+                    THREAD_KEY_ATTRIBUTE: {'S': key},
+                    MESSAGES_ATTRIBUTE: {'S': serialized_messages},
+                    EXPIRES_AT_ATTRIBUTE: {'N': str(int(time.time()) + self.ttl_seconds)},
+                },
+            )
+        except Exception as e:
+            LOGGER.error("Writing the thread cache failed: {}".format(e))
+
+
+def thread_key(channel_id, thread_ts):
+    """
+    :param channel_id: channel of the thread
+    :param thread_ts: timestamp of the parent message
+    :return: key of the cached thread
+    """
+    return "{}/{}".format(channel_id, thread_ts)
+
+
+def get_settled_messages(messages, now=None):
+    """
+    :param messages: Slack messages in timestamp order
+    :param now: current epoch seconds, defaults to time.time()
+    :return: the messages before the first bot message posted less than STREAMING_UPDATE_TIMEOUT_SECONDS ago,
+    reduced to the fields the prompt is built from
+    """
+    unsettled_after = (time.time() if now is None else now) - STREAMING_UPDATE_TIMEOUT_SECONDS
+    settled_messages = []
+    for message in messages:
+        if "bot_id" in message and float(message["ts"]) > unsettled_after:
+            break
+        settled_messages.append({field: message[field] for field in CACHED_MESSAGE_FIELDS if field in message})
+    return settled_messages
+
+
+def merge_messages(cached_messages, new_messages):
+    """
+    :param cached_messages: cached Slack messages in timestamp order
+    :param new_messages: Slack messages fetched after the high-water mark, in timestamp order
+    :return: the messages of both lists in timestamp order, without duplicates
+    """
+    high_water_ts = float(cached_messages[-1]["ts"]) if cached_messages else None
+    return cached_messages + [message for message in new_messages
+                              if high_water_ts is None or float(message["ts"]) > high_water_ts]
+
+
+THREAD_MESSAGE_CACHE = ThreadMessageCache(
+    table_name=os.getenv(THREAD_CACHE_TABLE_NAME),
+    ttl_seconds=int(os.getenv(THREAD_CACHE_TTL_SECONDS, DEFAULT_THREAD_CACHE_TTL_SECONDS)),
+    max_size=int(os.getenv(THREAD_CACHE_MAX_SIZE, DEFAULT_THREAD_CACHE_MAX_SIZE)),
+    # the table write is off the request path, the messages are already in memory
+    write_executor=ThreadPoolExecutor(max_workers=1, thread_name_prefix="thread-cache"),
+)
@@ -0,0 +1,246 @@
+import json
+import os
+import time
+
+from botocore.exceptions import ClientError
+
+from amazon_bedrock_ai_slack_app_lambda.helpers.aws_clients import get_client
+from amazon_bedrock_ai_slack_app_lambda.helpers.comprehend_helper import detect_and_redact_pii_concurrently
+from amazon_bedrock_ai_slack_app_lambda.helpers.constants import (
+    SUMMARY_KEEP_RECENT_TURNS,
+    SUMMARY_MAX_TOKENS,
+    SUMMARY_MODEL,
+    SUMMARY_PROMPT,
+    SUMMARY_TRIGGER_TURNS,
+)
+from amazon_bedrock_ai_slack_app_lambda.helpers.logging import LOGGER
+from amazon_bedrock_ai_slack_app_lambda.helpers.ttl_cache import TtlLruCache
+
+# Environment variables configuring the thread summary store. Without a table name summaries are only kept in memory.
+THREAD_SUMMARY_TABLE_NAME = "THREAD_SUMMARY_TABLE_NAME"
+THREAD_SUMMARY_TTL_SECONDS = "THREAD_SUMMARY_TTL_SECONDS"
+THREAD_SUMMARY_CACHE_MAX_SIZE = "THREAD_SUMMARY_CACHE_MAX_SIZE"
+
+DEFAULT_THREAD_SUMMARY_TTL_SECONDS = 30 * 24 * 3600
+DEFAULT_THREAD_SUMMARY_CACHE_MAX_SIZE = 256
+# Other containers may fold the same thread; the in-memory copy is only trusted for a short time
+THREAD_SUMMARY_MEMORY_TTL_SECONDS = 300
+
+# Partition key, and the DynamoDB TTL attribute (epoch seconds) the table must be configured with
+THREAD_KEY_ATTRIBUTE = "thread_key"
+SUMMARY_ATTRIBUTE = "summary"
+WATERMARK_TS_ATTRIBUTE = "watermark_ts"
+EXPIRES_AT_ATTRIBUTE = "expires_at"
+
+
+class ThreadSummary:
+    """
+    Summary of the turns of a thread up to and including the watermark timestamp.
+    """
+    __slots__ = ("summary", "watermark_ts")
+
+    def __init__(self, summary, watermark_ts):
+        """
+        :param summary: summary text
+        :param watermark_ts: Slack timestamp of the newest message folded into the summary
+        """
+        self.summary = summary
+        self.watermark_ts = watermark_ts
+
+    def __eq__(self, other):
+        return (isinstance(other, ThreadSummary)
+                and (self.summary, self.watermark_ts) == (other.summary, other.watermark_ts))
+
+    def __repr__(self):
+        return "ThreadSummary(summary={!r}, watermark_ts={!r})".format(self.summary, self.watermark_ts)
+
+
+class ThreadSummaryStore:
+    """
+    Per thread summaries, keyed by channel id and thread timestamp.
+
+    Summaries are stored in a DynamoDB table with a TTL attribute and cached in memory for a short time. Writes only
+    move the watermark forward, so concurrent summarizations of a thread cannot replace a newer summary with an
+    older one. Store failures are logged and treated as a missing summary, they never fail the request.
+    """
+    def __init__(self, table_name=None, ttl_seconds=DEFAULT_THREAD_SUMMARY_TTL_SECONDS,
+                 max_size=DEFAULT_THREAD_SUMMARY_CACHE_MAX_SIZE,
+                 dynamodb_client_provider=lambda: get_client("dynamodb")):
+        """
+        :param table_name: DynamoDB table, None to only keep summaries in memory
+        :param ttl_seconds: lifetime of a summary after its last update
+        :param max_size: maximum entries of the in-memory cache
+        :param dynamodb_client_provider: function returning the DynamoDB client
+        """
+        self.table_name = table_name
+        self.ttl_seconds = ttl_seconds
+        self.__memory_cache = TtlLruCache(
+            max_size=max_size,
+            ttl_seconds=ttl_seconds if table_name is None else min(ttl_seconds, THREAD_SUMMARY_MEMORY_TTL_SECONDS))
+        self.__dynamodb_client_provider = dynamodb_client_provider
+
+    def get(self, channel_id, thread_ts):
+        """
+        :param channel_id: channel of the thread
+        :param thread_ts: timestamp of the parent message
+        :return: the ThreadSummary of the thread, None if the thread was not summarized
+        """
+        key = thread_key(channel_id, thread_ts)
+        thread_summary = self.__memory_cache.get(key)
+        if thread_summary is not None or not self.table_name:
+            return thread_summary
+
+        try:
+            item = self.__dynamodb_client_provider().get_item(
+                TableName=self.table_name,
+                Key={THREAD_KEY_ATTRIBUTE: {'S': key}},
+                ProjectionExpression='{}, {}, {}'.format(SUMMARY_ATTRIBUTE, WATERMARK_TS_ATTRIBUTE,
+                                                         EXPIRES_AT_ATTRIBUTE),
+            ).get("Item")
+        except Exception as e:
+            LOGGER.error("Reading the thread summary failed: {}".format(e))
+            return None
+
+        # DynamoDB deletes expired items lazily
+        if not item or int(item[EXPIRES_AT_ATTRIBUTE]['N']) <= int(time.time()):
+            return None
+        thread_summary = ThreadSummary(item[SUMMARY_ATTRIBUTE]['S'], item[WATERMARK_TS_ATTRIBUTE]['N'])
+        self.__memory_cache.put(key, thread_summary)
+        return thread_summary
+
+    def put(self, channel_id, thread_ts, thread_summary):
+        """
+        :param channel_id: channel of the thread
+        :param thread_ts: timestamp of the parent message
+        :param thread_summary: the new ThreadSummary
+        :return: True if the summary was stored, False if a newer summary exists or the write failed
+        """
+        key = thread_key(channel_id, thread_ts)
+        if self.table_name:
+            try:
+                self.__dynamodb_client_provider().put_item(
+                    TableName=self.table_name,
+                    Item={
+                        THREAD_KEY_ATTRIBUTE: {'S': key},
+                        SUMMARY_ATTRIBUTE: {'S': thread_summary.summary},
+                        WATERMARK_TS_ATTRIBUTE: {'N': thread_summary.watermark_ts},
+                        EXPIRES_AT_ATTRIBUTE: {'N': str(int(time.time()) + self.ttl_seconds)},
+                    },
+                    ConditionExpression='attribute_not_exists({0}) OR {1} < :watermark_ts'.format(
+                        THREAD_KEY_ATTRIBUTE, WATERMARK_TS_ATTRIBUTE),
+                    ExpressionAttributeValues={':watermark_ts': {'N': thread_summary.watermark_ts}},
+                )
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                    LOGGER.info("A newer summary of thread {} exists".format(key))
+                    self.__memory_cache.invalidate(key)
+                else:
+                    LOGGER.error("Writing the thread summary failed: {}".format(e))
+                return False
+            except Exception as e:
+                LOGGER.error("Writing the thread summary failed: {}".format(e))
+                return False
+        self.__memory_cache.put(key, thread_summary)
+        return True
+
+    def invalidate(self):
+        """
+        Drops the in-memory entries, the table entries expire through the DynamoDB TTL.
+        :return: None
+        """
+        self.__memory_cache.invalidate()
+
+
+def thread_key(channel_id, thread_ts):
+    """
+    :param channel_id: channel of the thread
+    :param thread_ts: timestamp of the parent message
+    :return: key of the thread summary
+    """
+    return "{}/{}".format(channel_id, thread_ts)
+
+
+def get_recent_messages(messages, thread_summary):
+    """
+    :param messages: SlackMessage records of the thread sorted by timestamp
+    :param thread_summary: ThreadSummary of the thread or None
+    :return: the messages newer than the summary watermark
+    """
+    if thread_summary is None:
+        return messages
+    watermark = float(thread_summary.watermark_ts)
+    return [message for message in messages if float(message.ts) > watermark]
+
+
+def __get_recent_turns(messages, thread_summary):
+    return [message for message in get_recent_messages(messages, thread_summary) if not message.is_system_message]
+
+
+def needs_summary(messages, thread_summary):
+    """
+    :param messages: SlackMessage records of the thread sorted by timestamp
+    :param thread_summary: ThreadSummary of the thread or None
+    :return: True if the turns after the watermark outgrow SUMMARY_TRIGGER_TURNS
+    """
+    return len(__get_recent_turns(messages, thread_summary)) > SUMMARY_TRIGGER_TURNS
+
+
+def summarize_thread(channel_id, thread_ts, messages, thread_summary, bot_user_id):
+    """
+    Folds the older turns of a thread into its summary once the turns after the watermark outgrow
+    SUMMARY_TRIGGER_TURNS. Meant to run beside the response generation, which does not depend on it; failures are
+    logged and the thread is summarized again with the next message.
+
+    :param channel_id: channel of the thread
+    :param thread_ts: timestamp of the parent message
+    :param messages: SlackMessage records of the thread sorted by timestamp
+    :param thread_summary: current ThreadSummary of the thread or None
+    :param bot_user_id: The user ID of the bot.
+    :return: the new ThreadSummary, None if the thread was not summarized
+    """
+    turns = __get_recent_turns(messages, thread_summary)
+    if len(turns) <= SUMMARY_TRIGGER_TURNS:
+        return None
+
+    # the recent turns start with a user turn, Claude 3 requires the first message to be a user message
+    split = len(turns) - SUMMARY_KEEP_RECENT_TURNS
+    while split > 0 and turns[split].user == bot_user_id:
+        split -= 1
+    if split == 0:
+        return None
+    folded_turns = turns[:split]
+    try:
+        # summaries are stored, so only redacted text goes into them
+        redacted_messages = detect_and_redact_pii_concurrently([message.msg for message in folded_turns])
+        conversation = "".join(
+            "\n\n{}: {}".format("Assistant" if message.user == bot_user_id else "User",
+                                redacted_message.replace("<@{}>".format(bot_user_id), "Bot"))
+            for message, (redacted_message, _) in zip(folded_turns, redacted_messages))
+        summary = __invoke_summary_model(SUMMARY_PROMPT.format(
+            summary=thread_summary.summary if thread_summary is not None else "", messages=conversation))
+    except Exception as e:
+        LOGGER.error("Summarizing thread {} failed: {}".format(thread_key(channel_id, thread_ts), e))
+        return None
+
+    new_summary = ThreadSummary(summary, folded_turns[-1].ts)
+    LOGGER.info("Folded {} turns of thread {} into its summary".format(
+        len(folded_turns), thread_key(channel_id, thread_ts)))
+    THREAD_SUMMARY_STORE.put(channel_id, thread_ts, new_summary)
+    return new_summary
+
+
+def __invoke_summary_model(prompt):
+    response = get_client("bedrock-runtime").invoke_model(
+        body=json.dumps({"prompt": prompt, "max_tokens_to_sample": SUMMARY_MAX_TOKENS, "temperature": 0}),
+        modelId=SUMMARY_MODEL,
+        accept="application/json",
+        contentType="application/json",
+    )
+    return json.loads(response["body"].read())["completion"].strip()
+
+
+THREAD_SUMMARY_STORE = ThreadSummaryStore(
+    table_name=os.getenv(THREAD_SUMMARY_TABLE_NAME),
+    ttl_seconds=int(os.getenv(THREAD_SUMMARY_TTL_SECONDS, DEFAULT_THREAD_SUMMARY_TTL_SECONDS)),
+    max_size=int(os.getenv(THREAD_SUMMARY_CACHE_MAX_SIZE, DEFAULT_THREAD_SUMMARY_CACHE_MAX_SIZE)),
+)
@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TtlLruCache:
+    """
+    Thread safe in-memory cache with a time to live per entry and least recently used eviction.
+
+    Instances are meant to be created at module level so the cached values survive across warm Lambda
+    invocations. Hit, miss and eviction counters are kept for observability.
+    """
+    def __init__(self, max_size, ttl_seconds):
+        """
+        :param max_size: maximum number of entries, the least recently used entry is evicted beyond that
+        :param ttl_seconds: seconds after which an entry is treated as missing
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+
+    def get(self, key, default=None):
+        """
+        :param key: cache key
+        :param default: value returned on a miss
+        :return: the cached value or default if missing or expired
+        """
+        now = time.monotonic()
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self.__entries[key]
+                self.__misses += 1
+                return default
+            self.__entries.move_to_end(key)
+            self.__hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """
+        Stores the value, evicting the least recently used entries if the cache is full.
+        :param key: cache key
+        :param value: value to cache
+        :return: None
+        """
+        with self.__lock:
+            self.__entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+                self.__evictions += 1
+
+    def put_if_absent(self, key, value):
+        """
+        Stores the value unless the key has an entry that did not expire, atomically.
+        :param key: cache key
+        :param value: value to cache
+        :return: True if the value was stored, False if the key was present
+        """
+        now = time.monotonic()
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and entry[1] > now:
+                self.__hits += 1
+                return False
+            self.__misses += 1
+            self.__entries[key] = (value, now + self.ttl_seconds)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+                self.__evictions += 1
+            return True
+
+    def invalidate(self, key=None):
+        """
+        :param key: cache key to drop; None drops every entry
+        :return: None
+        """
+        with self.__lock:
+            if key is None:
+                self.__entries.clear()
+            else:
+                self.__entries.pop(key, None)
+
+    def stats(self):
+        """
+        :return: dict with the hit, miss and eviction counters and the current size
+        """
+        with self.__lock:
+            return {
+                "hits": self.__hits,
+                "misses": self.__misses,
+                "evictions": self.__evictions,
+                "size": len(self.__entries),
+            }
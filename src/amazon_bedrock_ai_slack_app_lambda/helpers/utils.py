@@ -1,35 +1,81 @@
-def get_sorted_messages(messages: list):
+from amazon_bedrock_ai_slack_app_lambda.helpers.constants import (
+    DISCLAIMER_TAG,
+    PII_SYSTEM_MESSAGE_TAG,
+    SYSTEM_MESSAGES,
+)
+
+NEW_CONVERSATION_COMMAND = "new-conversation"
+
+
+def is_system_message(text):
     """
-    Sort a list of messages by their timestamp in ascending order.
+    :param text: message text
+    :return: True for commands and app messages (at the start of the text), PII warnings and disclaimers
+    """
+    return (text.lstrip().startswith(SYSTEM_MESSAGES)
+            or PII_SYSTEM_MESSAGE_TAG in text
+            or DISCLAIMER_TAG in text)
 
-    :param messages: A list of messages, each represented as a dictionary.
-                     Each message dictionary should contain 'ts', 'user', and 'text' keys.
-    :return: A new list of messages sorted by timestamp.
+
+class SlackMessage:
+    """
+    Compact record of a Slack message used to build the model prompt.
     """
+    __slots__ = ("ts", "user", "msg", "is_system_message")
 
-    last_new_conversation_index = None
-    for i in range(len(messages) - 1):
-        if messages[i].get("text") == 'new-conversation':
-            last_new_conversation_index = i
-            break
+    def __init__(self, ts, user, msg):
+        """
+        :param ts: Slack message timestamp
+        :param user: user id of the author
+        :param msg: message text
+        """
+        self.ts = ts
+        self.user = user
+        self.msg = msg
+        self.is_system_message = is_system_message(msg)
 
-    if last_new_conversation_index is not None:
-        filtered_messages = [
-            {"ts": msg["ts"], "user": msg["user"], "msg": msg["text"]}
-            for msg in messages[:last_new_conversation_index]
-            if "subtype" not in msg
-        ]
+    def __eq__(self, other):
+        return isinstance(other, SlackMessage) and (self.ts, self.user, self.msg) == (other.ts, other.user, other.msg)
 
-        return sorted(filtered_messages, key=lambda x: float(x["ts"]))
-    else:
-        return sorted(
-            [
-                {"ts": msg["ts"], "user": msg["user"], "msg": msg["text"]}
-                for msg in messages
-                if "subtype" not in msg
-            ],
-            key=lambda x: float(x["ts"]),
-        )
+    def __repr__(self):
+        return "SlackMessage(ts={!r}, user={!r}, msg={!r})".format(self.ts, self.user, self.msg)
+
+
+def get_sorted_messages(messages: list, newest_first=False):
+    """
+    Normalize the messages of a Slack API response in a single pass into SlackMessage records in ascending
+    timestamp order. Messages with a subtype are dropped and the list is cut at the first new-conversation command
+    (the last message is not checked).
+
+    Slack already returns sorted messages (conversations.history newest first, conversations.replies oldest
+    first), so the records are only reversed; they are sorted by timestamp only if the order turns out not to hold.
+
+    :param messages: A list of messages, each represented as a dictionary.
+                     Each message dictionary should contain 'ts', 'user', and 'text' keys.
+    :param newest_first: True if the messages are in descending timestamp order
+    :return: A new list of SlackMessage records sorted by timestamp.
+    """
+    records = []
+    last_index = len(messages) - 1
+    previous_ts = None
+    in_order = True
+    for index, message in enumerate(messages):
+        if index < last_index and message.get("text") == NEW_CONVERSATION_COMMAND:
+            break
+        if "subtype" in message:
+            continue
+
+        ts = float(message["ts"])
+        if previous_ts is not None and (ts > previous_ts if newest_first else ts < previous_ts):
+            in_order = False
+        previous_ts = ts
+        records.append(SlackMessage(message["ts"], message.get("user"), message["text"]))
+
+    if not in_order:
+        records.sort(key=lambda record: float(record.ts))
+    elif newest_first:
+        records.reverse()
+    return records
 
 
 def validate_and_set(value, available_values, default_value, existing_value):
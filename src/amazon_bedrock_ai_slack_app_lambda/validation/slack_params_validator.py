@@ -1,3 +1,5 @@
+import contextvars
+from typing import Any, Dict, Optional
 
 
 class SlackParameterValidator:
@@ -7,26 +9,39 @@ class SlackParameterValidator:
 
     This happens in parallel to the main code path invoking the Slack post message api and is in place as a
     secondary check to ensure we do not update to a different channel inadvertently.
+
+    The expected channel id and message ts are kept per context: every SQS record is handled in its own context,
+    and work submitted to other threads for the record has to run in a copy of it (contextvars.copy_context).
     """
     def __init__(self):
-        self.__channel_id = None
-        self.__disclaimer_ts = -1
+        self.__state: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar(
+            "slack_parameter_validator_state", default=None)
 
     def set_channel_id(self, ts):
-        self.__channel_id = ts
+        self.__get_state()["channel_id"] = ts
 
     def set_disclaimer_ts(self, ts):
-        self.__disclaimer_ts = ts
+        self.__get_state()["disclaimer_ts"] = ts
 
     def validate_disclaimer_ts(self, ts):
-        assert self.__disclaimer_ts == ts, ("SlackParameterValidator failed in disclaimer_ts validation. "
-                                            "Please make sure you are updating the right slack message. "
-                                            "This is a code bug.")
+        assert self.__get_state()["disclaimer_ts"] == ts, (
+            "SlackParameterValidator failed in disclaimer_ts validation. "
+            "Please make sure you are updating the right slack message. "
+            "This is a code bug.")
 
     def validate_channel_id(self, channel_id):
-        assert self.__channel_id == channel_id, ("SlackParameterValidator failed in channel_id validation. "
-                                                 "Please make sure you are updating the right slack message. "
-                                                 "This is a code bug.")
+        assert self.__get_state()["channel_id"] == channel_id, (
+            "SlackParameterValidator failed in channel_id validation. "
+            "Please make sure you are updating the right slack message. "
+            "This is a code bug.")
+
+    def __get_state(self):
+        # mutable, so copies of the context taken before a later set see the update
+        state = self.__state.get()
+        if state is None:
+            state = {"channel_id": None, "disclaimer_ts": -1}
+            self.__state.set(state)
+        return state
 
 
 SLACK_PARAMETER_VALIDATOR = SlackParameterValidator()
@@ -0,0 +1,54 @@
+"""
+Benchmark for the boto3 client registry.
+
+Measures the cold import time of the helper modules and the cost of getting a client per call, with a new
+boto3 client on every call (the old behaviour) and with the cached client from get_client.
+
+    $ PYTHONPATH=src python test/benchmark/bench_aws_clients.py
+"""
+import os
+import subprocess
+import sys
+import timeit
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import amazon_bedrock_ai_slack_app_lambda.helpers.ddb_helper
+import amazon_bedrock_ai_slack_app_lambda.helpers.metrics_publisher
+print(time.perf_counter() - start)
+"""
+ITERATIONS = 50
+
+
+def cold_import_seconds(runs=5):
+    timings = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, "-c", IMPORT_SNIPPET], env=dict(os.environ))
+        timings.append(float(output.decode().strip().splitlines()[-1]))
+    return min(timings)
+
+
+def main():
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+    os.environ.setdefault("AWS_REGION", "us-west-2")
+
+    import boto3
+
+    from amazon_bedrock_ai_slack_app_lambda.helpers.aws_clients import clear_clients, get_client
+
+    print("cold import of ddb_helper and metrics_publisher: {:.1f} ms".format(cold_import_seconds() * 1000))
+
+    uncached = timeit.timeit(lambda: boto3.client("comprehend", region_name="us-west-2"), number=ITERATIONS)
+    print("boto3.client per call:  {:.3f} ms".format(uncached / ITERATIONS * 1000))
+
+    clear_clients()
+    first = timeit.timeit(lambda: get_client("comprehend"), number=1)
+    cached = timeit.timeit(lambda: get_client("comprehend"), number=ITERATIONS)
+    print("get_client first call:  {:.3f} ms".format(first * 1000))
+    print("get_client per call:    {:.6f} ms".format(cached / ITERATIONS * 1000))
+
+
+if __name__ == '__main__':
+    main()
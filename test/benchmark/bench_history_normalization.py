@@ -0,0 +1,85 @@
+"""
+Microbenchmark for the history normalization and prompt building.
+
+Compares the previous implementation (dict records, sort by float(ts), system message checks while building the
+prompt and string +=) with get_sorted_messages + the Claude prompt builder on synthetic threads of 1k to 10k
+messages, and checks that both produce the same prompt.
+
+    $ PYTHONPATH=src python test/benchmark/bench_history_normalization.py
+"""
+import timeit
+
+from amazon_bedrock_ai_slack_app_lambda.helpers.constants import (
+    DISCLAIMER_TAG,
+    PII_SYSTEM_MESSAGE_TAG,
+    SYSTEM_MESSAGES,
+)
+from amazon_bedrock_ai_slack_app_lambda.helpers import payload_generator
+from amazon_bedrock_ai_slack_app_lambda.helpers.logging import LOGGER
+from amazon_bedrock_ai_slack_app_lambda.helpers.utils import get_sorted_messages
+
+BOT = "UBOT"
+generate_claude_prompt = getattr(payload_generator, "__generate_claude_prompt")
+THREAD_SIZES = (1000, 5000, 10000)
+REPEAT = 20
+
+
+def legacy_sorted_messages(messages):
+    last_new_conversation_index = None
+    for i in range(len(messages) - 1):
+        if messages[i].get("text") == 'new-conversation':
+            last_new_conversation_index = i
+            break
+    if last_new_conversation_index is not None:
+        messages = messages[:last_new_conversation_index]
+    return sorted([{"ts": msg["ts"], "user": msg["user"], "msg": msg["text"]} for msg in messages
+                   if "subtype" not in msg], key=lambda x: float(x["ts"]))
+
+
+def legacy_history(messages, bot_user_id):
+    bot_user_id_msg = f"<@{bot_user_id}>"
+    LOGGER.debug("Messages: {}".format(messages))
+    history = ""
+    for idx, msg in enumerate(messages):
+        if idx < len(messages) - 1:
+            stripped_message = msg["msg"].strip()
+            is_system_message = (stripped_message.startswith(SYSTEM_MESSAGES)
+                                 or PII_SYSTEM_MESSAGE_TAG in stripped_message
+                                 or DISCLAIMER_TAG in stripped_message)
+            if not is_system_message:
+                speaker = "Assistant" if msg["user"] == bot_user_id else "Human"
+                history += f"\n\n{speaker}: {msg['msg'].replace(bot_user_id_msg, 'Bot')}"
+    return history
+
+
+def synthetic_history(size):
+    # conversations.history order: newest first
+    messages = []
+    for index in range(size, 0, -1):
+        user = BOT if index % 2 else "U{}".format(index % 7)
+        text = "[SYSTEM] Settings saved" if index % 50 == 0 else "<@UBOT> message number {} ".format(index) * 8
+        messages.append({"ts": "{}.{:06d}".format(1700000000 + index, index), "user": user, "text": text})
+    return messages
+
+
+def main():
+    for size in THREAD_SIZES:
+        messages = synthetic_history(size)
+
+        legacy_records = legacy_sorted_messages(messages)
+        records = get_sorted_messages(messages, newest_first=True)
+        expected_history = legacy_history(legacy_records, BOT)
+        prompt = generate_claude_prompt(records, BOT, "passthrough")
+        assert expected_history in prompt, "prompt differs from the legacy implementation"
+
+        legacy = min(timeit.repeat(lambda: legacy_history(legacy_sorted_messages(messages), BOT),
+                                   number=1, repeat=REPEAT))
+        current = min(timeit.repeat(
+            lambda: generate_claude_prompt(get_sorted_messages(messages, newest_first=True), BOT, "passthrough"),
+            number=1, repeat=REPEAT))
+        print("{:>6} messages: legacy {:7.2f} ms, single pass {:7.2f} ms ({:.1f}x)".format(
+            size, legacy * 1000, current * 1000, legacy / current))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""
+Benchmark for the local PII pre-filter.
+
+Runs the pre-filter over the labelled corpus in test/fixtures and reports the time per message, the share of
+messages that skip Comprehend and the false negative rate (messages with disallowed entities reported clean).
+
+    $ PYTHONPATH=src python test/benchmark/bench_pii_prefilter.py
+"""
+import json
+import os
+import timeit
+
+from amazon_bedrock_ai_slack_app_lambda.helpers.constants import ALLOWED_COMPREHEND_PII_ENTITIES
+from amazon_bedrock_ai_slack_app_lambda.helpers.pii_prefilter import PiiPrefilter
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), os.pardir, "fixtures", "pii_prefilter_corpus.json")
+ITERATIONS = 200
+
+
+def main():
+    with open(CORPUS_PATH) as corpus_file:
+        entries = json.load(corpus_file)["entries"]
+    test_unit = PiiPrefilter()
+
+    pii_entries = [entry for entry in entries
+                   if set(entry["entity_types"]).difference(ALLOWED_COMPREHEND_PII_ENTITIES)]
+    false_negatives = [entry["text"] for entry in pii_entries if test_unit.is_clean(entry["text"])]
+    skipped = [entry for entry in entries if test_unit.is_clean(entry["text"])]
+
+    seconds = timeit.timeit(lambda: [test_unit.is_clean(entry["text"]) for entry in entries], number=ITERATIONS)
+    print("messages:             {}".format(len(entries)))
+    print("time per message:     {:.2f} us".format(seconds / ITERATIONS / len(entries) * 1e6))
+    print("skip Comprehend:      {:.1%}".format(len(skipped) / len(entries)))
+    print("false negative rate:  {:.1%} ({} of {})".format(
+        len(false_negatives) / len(pii_entries), len(false_negatives), len(pii_entries)))
+    for text in false_negatives:
+        print("  missed: {}".format(text))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+import threading
+import unittest
+from unittest import mock
+
+from amazon_bedrock_ai_slack_app_lambda.helpers import aws_clients
+from amazon_bedrock_ai_slack_app_lambda.helpers.aws_clients import SERVICE_CONFIGS, clear_clients, get_client
+
+
+@mock.patch.object(aws_clients.boto3.session, "Session")
+class GetClientTests(unittest.TestCase):
+    def setUp(self):
+        clear_clients()
+
+    def tearDown(self):
+        clear_clients()
+
+    def test_client_is_created_once_per_service_and_region(self, session):
+        session.return_value.client.side_effect = lambda **kwargs: mock.Mock()
+
+        comprehend = get_client("comprehend", "us-west-2")
+
+        self.assertIs(comprehend, get_client("comprehend", "us-west-2"))
+        self.assertIsNot(comprehend, get_client("comprehend", "us-east-1"))
+        self.assertIsNot(comprehend, get_client("dynamodb", "us-west-2"))
+        self.assertEqual(3, session.return_value.client.call_count)
+        session.assert_called_once_with()
+
+    def test_client_uses_service_config(self, session):
+        get_client("bedrock-runtime", "us-west-2")
+
+        session.return_value.client.assert_called_once_with(service_name="bedrock-runtime", region_name="us-west-2",
+                                                            config=SERVICE_CONFIGS["bedrock-runtime"])
+
+    def test_concurrent_first_use_creates_one_client(self, session):
+        session.return_value.client.side_effect = lambda **kwargs: mock.Mock()
+        clients = []
+        threads = [threading.Thread(target=lambda: clients.append(get_client("comprehend", "us-west-2")))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, session.return_value.client.call_count)
+        self.assertEqual(1, len(set(id(client) for client in clients)))
+
+
+if __name__ == '__main__':
+    unittest.main()
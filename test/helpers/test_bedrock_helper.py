@@ -0,0 +1,215 @@
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+
+from amazon_bedrock_ai_slack_app_lambda.helpers import bedrock_helper, comprehend_helper
+from amazon_bedrock_ai_slack_app_lambda.helpers.bedroc_invoker_metadata import BedrockInvokerMetadata
+from amazon_bedrock_ai_slack_app_lambda.helpers.bedrock_helper import ResponseTracker
+from amazon_bedrock_ai_slack_app_lambda.helpers.model_helper import get_model
+from amazon_bedrock_ai_slack_app_lambda.helpers.payload_generator import generate_payload
+from amazon_bedrock_ai_slack_app_lambda.helpers.utils import SlackMessage
+
+update_message_until_completion = getattr(bedrock_helper, "__update_message_until_completion")
+generate_response = getattr(bedrock_helper, "__generate_response")
+
+TEST_CHANNEL_ID = "C123ABC456"
+TEST_TS = "1700000000.000100"
+TEST_METADATA = BedrockInvokerMetadata("anthropic.claude-v2:1", "assistant", TEST_CHANNEL_ID, "U123", "testUser")
+
+
+class FakeEventStream:
+    """
+    Stands in for botocore's EventStream, which yields the events of a streaming response parsed into dicts.
+    """
+    def __init__(self, events):
+        self.events = events
+
+    def __iter__(self):
+        return iter(self.events)
+
+
+def produce(response_tracker, chunks, delay_seconds):
+    for chunk in chunks:
+        time.sleep(delay_seconds)
+        response_tracker.append(chunk)
+    response_tracker.complete()
+
+
+class ResponseTrackerTests(unittest.TestCase):
+    def test_wait_for_update_returns_on_append(self):
+        test_unit = ResponseTracker("", "", False)
+        threading.Timer(0.05, test_unit.append, args=("hello",)).start()
+
+        version, message, status = test_unit.wait_for_update(0, timeout=2)
+
+        self.assertEqual((1, "hello", False), (version, message, status))
+
+    def test_wait_for_update_returns_on_completion(self):
+        test_unit = ResponseTracker("", "", False)
+        threading.Timer(0.05, test_unit.complete).start()
+
+        self.assertEqual((0, "", True), test_unit.wait_for_update(0, timeout=2))
+
+    def test_wait_for_completion_times_out(self):
+        test_unit = ResponseTracker("", "", False)
+        test_unit.append("partial")
+
+        self.assertEqual((1, "partial", False), test_unit.wait_for_completion(timeout=0.01))
+
+
+@mock.patch.object(bedrock_helper, "report_comprehend_pii_metrics")
+@mock.patch.object(bedrock_helper, "validate_response_from_bedrock", return_value=True)
+@mock.patch.object(comprehend_helper, "detect_pii_entities", return_value=[])
+@mock.patch.object(bedrock_helper, "update_chat", return_value={"ok": True})
+class UpdateMessageUntilCompletionTests(unittest.TestCase):
+    def test_final_text_is_flushed_without_waiting_for_the_interval(self, update_chat, *_):
+        response_tracker = ResponseTracker("", "", False)
+        threading.Thread(target=produce, args=(response_tracker, ["Hello", " world"], 0.3)).start()
+
+        start = time.monotonic()
+        self.assertTrue(update_message_until_completion(response_tracker, TEST_METADATA, TEST_TS))
+        elapsed = time.monotonic() - start
+
+        # chunks arrive after 0.3s and 0.6s; a fixed one second poll would finish after 1s
+        self.assertLess(elapsed, 0.9)
+        self.assertEqual("Hello world", update_chat.call_args_list[-1][0][1])
+
+    def test_deltas_are_coalesced_and_unchanged_text_is_not_sent(self, update_chat, *_):
+        response_tracker = ResponseTracker("", "", False)
+        threading.Thread(target=produce, args=(response_tracker, ["a"] * 50, 0.01)).start()
+
+        update_message_until_completion(response_tracker, TEST_METADATA, TEST_TS)
+
+        sent_messages = [call[0][1] for call in update_chat.call_args_list]
+        self.assertLess(len(sent_messages), 5)
+        self.assertEqual(len(sent_messages), len(set(sent_messages)))
+        self.assertEqual("a" * 50, sent_messages[-1])
+
+    def test_pii_metric_is_published_once_per_response(self, update_chat, detect_pii_entities, validate,
+                                                       report_comprehend_pii_metrics):
+        response_tracker = ResponseTracker("", "", False)
+        threading.Thread(target=produce, args=(response_tracker, ["word "] * 100, 0.005)).start()
+
+        update_message_until_completion(response_tracker, TEST_METADATA, TEST_TS)
+
+        report_comprehend_pii_metrics.assert_called_once_with(False, False)
+
+    def test_final_text_is_resent_when_rate_limited(self, update_chat, *_):
+        update_chat.side_effect = [{"ok": False, "error": "ratelimited"}, {"ok": True}]
+        response_tracker = ResponseTracker("", "", False)
+        response_tracker.append("done")
+        response_tracker.complete()
+
+        with mock.patch.object(bedrock_helper.time, "sleep"):
+            update_message_until_completion(response_tracker, TEST_METADATA, TEST_TS)
+
+        self.assertEqual(2, update_chat.call_count)
+        self.assertEqual("done", update_chat.call_args_list[-1][0][1])
+
+
+@mock.patch.object(bedrock_helper, "report_bedrock_token_usage")
+@mock.patch.object(bedrock_helper, "report_bedrock_invoke_model_response_size_bytes")
+@mock.patch.object(bedrock_helper, "report_bedrock_invoke_model_response_status")
+@mock.patch.object(bedrock_helper, "report_bedrock_invoke_model_latency")
+@mock.patch.object(bedrock_helper, "report_bedrock_invoke_model_latency_first_chunk")
+@mock.patch.object(bedrock_helper, "get_client")
+class GenerateResponseTests(unittest.TestCase):
+    def test_converse_stream_is_decoded_into_text_and_usage(self, get_client, latency_first_chunk, latency, status,
+                                                            size_bytes, report_bedrock_token_usage):
+        get_client.return_value.converse_stream.return_value = {
+            "ResponseMetadata": {"RequestId": "r1"},
+            "stream": FakeEventStream([
+                {"messageStart": {"role": "assistant"}},
+                {"contentBlockDelta": {"delta": {"text": "Hello"}, "contentBlockIndex": 0}},
+                {"contentBlockDelta": {"delta": {"text": " world"}, "contentBlockIndex": 0}},
+                {"contentBlockStop": {"contentBlockIndex": 0}},
+                {"messageStop": {"stopReason": "end_turn"}},
+                {"metadata": {"usage": {"inputTokens": 12, "outputTokens": 3, "totalTokens": 15},
+                              "metrics": {"latencyMs": 100}}},
+            ]),
+        }
+        payload = {"backend": "converse", "model_id": "meta.llama2-13b-chat-v1",
+                   "messages": [{"role": "user", "content": [{"text": "hi"}]}],
+                   "inferenceConfig": {"maxTokens": 750, "temperature": 0.5}}
+        response_tracker = ResponseTracker("", "", False)
+
+        generate_response(TEST_METADATA, payload, response_tracker)
+
+        self.assertEqual((2, "Hello world", True), response_tracker.wait_for_completion(timeout=0))
+        self.assertNotIn("system", get_client.return_value.converse_stream.call_args.kwargs)
+        latency_first_chunk.assert_called_once()
+        report_bedrock_token_usage.assert_called_once_with(TEST_METADATA, 12, 3)
+
+    def test_stream_errors_are_reported(self, get_client, latency_first_chunk, latency, status, size_bytes,
+                                        report_bedrock_token_usage):
+        def events():
+            yield {"contentBlockDelta": {"delta": {"text": "Hello"}, "contentBlockIndex": 0}}
+            raise RuntimeError("modelStreamErrorException")
+        get_client.return_value.converse_stream.return_value = {"ResponseMetadata": {"RequestId": "r1"},
+                                                                "stream": events()}
+        payload = {"backend": "converse", "model_id": "meta.llama2-13b-chat-v1",
+                   "messages": [{"role": "user", "content": [{"text": "hi"}]}]}
+        response_tracker = ResponseTracker("", "", False)
+
+        with mock.patch.object(bedrock_helper, "bedrock_streaming_api_call_error") as streaming_error:
+            generate_response(TEST_METADATA, payload, response_tracker, TEST_TS)
+
+        self.assertEqual((1, "Hello", True), response_tracker.wait_for_completion(timeout=0))
+        streaming_error.assert_called_once_with(TEST_CHANNEL_ID, mock.ANY, TEST_TS)
+        status.assert_called_once_with(bedrock_invoker_metadata=TEST_METADATA, response_status=False,
+                                       exception_name="RuntimeError")
+        latency.assert_not_called()
+
+    def test_invoke_model_stream_is_decoded_with_the_model_decoder(self, get_client, latency_first_chunk, latency,
+                                                                   status, size_bytes, report_bedrock_token_usage):
+        chunks = [{"type": "message_start"},
+                  {"type": "content_block_delta", "delta": {"text": "Hello"}},
+                  {"type": "message_stop",
+                   "amazon-bedrock-invocationMetrics": {"inputTokenCount": 12, "outputTokenCount": 1}}]
+        get_client.return_value.invoke_model_with_response_stream.return_value = {
+            "ResponseMetadata": {"RequestId": "r1"},
+            "body": FakeEventStream([{"chunk": {"bytes": json.dumps(chunk).encode()}} for chunk in chunks]),
+        }
+        payload = {"backend": "invoke_model", "model_id": "anthropic.claude-3-sonnet-20240229-v1:0", "body": "{}"}
+        response_tracker = ResponseTracker("", "", False)
+
+        generate_response(TEST_METADATA, payload, response_tracker)
+
+        self.assertEqual((1, "Hello", True), response_tracker.wait_for_completion(timeout=0))
+        report_bedrock_token_usage.assert_called_once_with(TEST_METADATA, 12, 1)
+
+
+@mock.patch.object(bedrock_helper, "report_comprehend_pii_metrics")
+@mock.patch.object(bedrock_helper, "get_client")
+@mock.patch.object(bedrock_helper, "detect_and_redact_pii_concurrently",
+                   side_effect=lambda messages: [(message.replace("555-0100", "[PHONE]"),
+                                                  {"PHONE"} if "555-0100" in message else set())
+                                                 for message in messages])
+class InvokeBedrockStreamingTests(unittest.TestCase):
+    def test_converse_requests_are_redacted(self, detect_and_redact_pii_concurrently, *_):
+        model = get_model("meta.llama2-13b-chat-v1")
+        payload = generate_payload([SlackMessage("1.0", "U123", "call me at 555-0100")], "UBOT", model, "assistant",
+                                   "the user asked for 555-0100")
+        generated = threading.Event()
+        with mock.patch.object(bedrock_helper, "__generate_response",
+                               side_effect=lambda **kwargs: generated.set()) as generate_response_mock, \
+                mock.patch.object(bedrock_helper, "__update_message_until_completion",
+                                  side_effect=lambda *args, **kwargs: generated.wait(1)), \
+                mock.patch.object(bedrock_helper, "comprehend_pii_error_message") as comprehend_pii_error_message:
+            bedrock_helper.invoke_bedrock_streaming(
+                BedrockInvokerMetadata(model.id, "assistant", TEST_CHANNEL_ID, "U123", "testUser"), payload,
+                processing_ts=TEST_TS)
+
+        sent_payload = generate_response_mock.call_args.kwargs["payload"]
+        self.assertNotIn("body", sent_payload)
+        self.assertEqual("call me at [PHONE]", sent_payload["messages"][0]["content"][0]["text"])
+        self.assertIn("the user asked for [PHONE]", sent_payload["system"][0]["text"])
+        self.assertNotIn("555-0100", json.dumps(sent_payload))
+        comprehend_pii_error_message.assert_called_once_with(TEST_CHANNEL_ID, {"PHONE"}, is_request=True,
+                                                             thread_ts=TEST_TS)
+
+
+if __name__ == '__main__':
+    unittest.main()
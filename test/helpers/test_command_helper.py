@@ -0,0 +1,19 @@
+import unittest
+
+from amazon_bedrock_ai_slack_app_lambda.helpers.command_helper import is_command
+
+TEST_BOT_USER_ID = "UBOT"
+
+
+class IsCommandTests(unittest.TestCase):
+    def test_commands_are_detected_with_and_without_mention(self):
+        for message in ("help", "list-settings", "settings --mode passthrough", "<@UBOT> new-conversation"):
+            self.assertTrue(is_command(message, TEST_BOT_USER_ID), message)
+
+    def test_other_messages_are_not_commands(self):
+        for message in ("hello", "<@UBOT> what is help?", "<@UBOT>", "<@UOTHER> help"):
+            self.assertFalse(is_command(message, TEST_BOT_USER_ID), message)
+
+
+if __name__ == '__main__':
+    unittest.main()
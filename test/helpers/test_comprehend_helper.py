@@ -0,0 +1,125 @@
+import re
+import threading
+import unittest
+from unittest import mock
+
+from amazon_bedrock_ai_slack_app_lambda.helpers import comprehend_helper
+from amazon_bedrock_ai_slack_app_lambda.helpers.comprehend_helper import (
+    IncrementalPiiRedactor,
+    detect_and_redact_pii,
+    detect_and_redact_pii_concurrently,
+    redact_pii_entities,
+)
+from amazon_bedrock_ai_slack_app_lambda.helpers.pii_cache import PiiScanCache
+
+EMAIL_PATTERN = re.compile(r"[\w.]+@[\w.]+\.com")
+NAME_PATTERN = re.compile(r"\bAlice\b")
+
+TEST_RESPONSE = (
+    "Sure, here is a summary of the account. The owner is Alice and she can be reached at "
+    "alice.example@example.com for follow ups. " * 6
+    + "Let me know if you need anything else! Another contact is bob.builder@example.com today."
+)
+
+
+def fake_detect_pii_entities(message):
+    """
+    Stand-in for Comprehend: emails are EMAIL entities, the name Alice is an (allowed) NAME entity.
+    """
+    entities = [{"Type": "EMAIL", "BeginOffset": match.start(), "EndOffset": match.end()}
+                for match in EMAIL_PATTERN.finditer(message)]
+    entities += [{"Type": "NAME", "BeginOffset": match.start(), "EndOffset": match.end()}
+                 for match in NAME_PATTERN.finditer(message)]
+    return sorted(entities, key=lambda entity: entity["BeginOffset"])
+
+
+def stream(text, chunk_size):
+    for end in range(chunk_size, len(text) + chunk_size, chunk_size):
+        yield text[:end]
+
+
+@mock.patch.object(comprehend_helper, "detect_pii_entities", side_effect=fake_detect_pii_entities)
+class IncrementalPiiRedactorTests(unittest.TestCase):
+    def test_redact_pii_entities_keeps_allowed_entities(self, _):
+        redacted, un_allowed = redact_pii_entities("Alice: a@b.com", fake_detect_pii_entities("Alice: a@b.com"))
+
+        self.assertEqual("Alice: <REDACTED>", redacted)
+        self.assertEqual({"EMAIL"}, un_allowed)
+
+    def test_streamed_output_never_leaks_and_matches_full_pass(self, _):
+        expected, _ = redact_pii_entities(TEST_RESPONSE, fake_detect_pii_entities(TEST_RESPONSE))
+        test_unit = IncrementalPiiRedactor(min_segment_chars=100, overlap_chars=40)
+
+        for partial in stream(TEST_RESPONSE, 7):
+            displayed = test_unit.update(partial)
+            self.assertNotIn("@example.com", displayed)
+            self.assertTrue(expected.startswith(displayed))
+
+        self.assertEqual((expected, {"EMAIL"}), test_unit.finalize(TEST_RESPONSE))
+
+    def test_entity_spanning_segment_boundary_is_redacted(self, _):
+        # the boundary right before the email is far from the overlap window, so the email crosses a cut
+        text = "x" * 150 + " contact carol.smith@example.com please. " + "y" * 150 + " end."
+        test_unit = IncrementalPiiRedactor(min_segment_chars=20, overlap_chars=10)
+
+        for partial in stream(text, 5):
+            self.assertNotIn("carol.smith", test_unit.update(partial))
+        self.assertIn("EMAIL", test_unit.un_allowed_entities)
+
+    def test_scanned_text_is_linear_in_response_length(self, detect_pii_entities):
+        test_unit = IncrementalPiiRedactor(min_segment_chars=100, overlap_chars=40)
+
+        for partial in stream(TEST_RESPONSE, 3):
+            test_unit.update(partial)
+
+        scanned_chars = sum(len(call[0][0]) for call in detect_pii_entities.call_args_list)
+        self.assertLess(scanned_chars, 2 * len(TEST_RESPONSE))
+
+    def test_finalize_calls_comprehend_once_per_message(self, detect_pii_entities):
+        test_unit = IncrementalPiiRedactor()
+
+        test_unit.finalize(TEST_RESPONSE)
+        test_unit.finalize(TEST_RESPONSE)
+
+        detect_pii_entities.assert_called_once()
+
+
+@mock.patch.object(comprehend_helper, "detect_pii_entities", side_effect=fake_detect_pii_entities)
+class DetectAndRedactPiiConcurrentlyTests(unittest.TestCase):
+    def setUp(self):
+        # a fresh cache per test, cache writes of earlier tests may still be pending
+        patcher = mock.patch.object(comprehend_helper, "PII_SCAN_CACHE", PiiScanCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_results_match_the_serial_path(self, _):
+        messages = [TEST_RESPONSE[start:start + 90] for start in range(0, len(TEST_RESPONSE), 90)] + ["-", ""]
+
+        self.assertEqual([detect_and_redact_pii(message) for message in messages],
+                         detect_and_redact_pii_concurrently(messages))
+
+    def test_messages_are_scanned_concurrently(self, detect_pii_entities):
+        barrier = threading.Barrier(4, timeout=2)
+
+        def detect_after_all_started(message):
+            barrier.wait()
+            return []
+        detect_pii_entities.side_effect = detect_after_all_started
+
+        messages = ["a", "b", "c", "d"]
+        self.assertEqual([(message, set()) for message in messages], detect_and_redact_pii_concurrently(messages))
+
+    def test_messages_seen_before_are_not_scanned_again(self, detect_pii_entities):
+        thread = [TEST_RESPONSE[start:start + 90] for start in range(0, len(TEST_RESPONSE), 90)]
+        expected = [detect_and_redact_pii(message) for message in thread]
+        detect_pii_entities.reset_mock()
+
+        for turn in range(1, len(thread) + 1):
+            self.assertEqual(expected[:turn], detect_and_redact_pii_concurrently(thread[:turn]))
+
+        # every distinct message of the growing thread is scanned once, in the turn it was added
+        self.assertEqual(len(set(thread)), detect_pii_entities.call_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
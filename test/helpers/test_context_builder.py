@@ -0,0 +1,77 @@
+import unittest
+
+from amazon_bedrock_ai_slack_app_lambda.helpers.context_builder import (
+    build_context,
+    estimate_tokens,
+    get_input_token_budget,
+)
+from amazon_bedrock_ai_slack_app_lambda.helpers.model_helper import get_model
+from amazon_bedrock_ai_slack_app_lambda.helpers.utils import SlackMessage
+
+BOT = "UBOT"
+# 1000 input tokens minus the prompt overhead, no output reservation
+SMALL_MODEL = get_model("anthropic.claude-v2:1")._replace(max_token_sample=0, max_context_tokens=1032)
+
+
+def turns(count, text):
+    return [SlackMessage(str(index), BOT if index % 2 else "U1", text) for index in range(count)]
+
+
+class EstimateTokensTests(unittest.TestCase):
+    def test_estimate_is_based_on_utf8_length(self):
+        self.assertEqual(0, estimate_tokens(""))
+        self.assertEqual(2, estimate_tokens("hello"))
+        self.assertEqual(estimate_tokens("é" * 7), estimate_tokens("a" * 14))
+
+
+class InputTokenBudgetTests(unittest.TestCase):
+    def test_budget_reserves_the_output_and_the_assistant_prompt(self):
+        model = get_model("anthropic.claude-3-sonnet-20240229-v1:0")
+
+        passthrough = get_input_token_budget(model, "passthrough")
+        assistant = get_input_token_budget(model, "assistant")
+
+        self.assertEqual(32000 - 750 - 32, passthrough)
+        self.assertLess(assistant, passthrough)
+
+    def test_budget_is_capped_by_the_model_context(self):
+        self.assertEqual(4096 - 750 - 32, get_input_token_budget(get_model("meta.llama2-13b-chat-v1"), "passthrough"))
+
+    def test_budget_is_set_per_model(self):
+        model = get_model("anthropic.claude-v2:1")
+
+        self.assertEqual(200000 - 750 - 32,
+                         get_input_token_budget(model._replace(context_token_budget=None), "passthrough"))
+        self.assertEqual(8000 - 750 - 32,
+                         get_input_token_budget(model._replace(context_token_budget=8000), "passthrough"))
+
+
+class BuildContextTests(unittest.TestCase):
+    def test_short_conversations_are_kept(self):
+        messages = turns(5, "hello")
+
+        self.assertIs(messages, build_context(messages, BOT, SMALL_MODEL, "passthrough"))
+
+    def test_oldest_turns_are_dropped(self):
+        # 100 tokens per turn with the role markers
+        messages = turns(21, "a" * 336)
+
+        context = build_context(messages, BOT, SMALL_MODEL, "passthrough")
+
+        self.assertEqual(messages[-9:], context)
+        self.assertEqual("U1", context[0].user)
+
+    def test_newest_message_is_always_kept(self):
+        messages = turns(3, "a" * 10000)
+
+        self.assertEqual(messages[-1:], build_context(messages, BOT, SMALL_MODEL, "passthrough"))
+
+    def test_system_messages_are_not_counted(self):
+        messages = turns(3, "a" * 1400) + [SlackMessage("9", BOT, "[SYSTEM] " + "a" * 10000),
+                                           SlackMessage("10", "U1", "question")]
+
+        self.assertEqual(messages[-3:], build_context(messages, BOT, SMALL_MODEL, "passthrough"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,215 @@
+import json
+import unittest
+from datetime import date
+from unittest import mock
+
+from botocore.exceptions import ClientError
+
+from amazon_bedrock_ai_slack_app_lambda.helpers import ddb_helper
+from amazon_bedrock_ai_slack_app_lambda.helpers.ddb_helper import (
+    get_user_settings,
+    get_users_settings,
+    save_last_disclaimer_date,
+    save_settings,
+)
+from amazon_bedrock_ai_slack_app_lambda.helpers.ttl_cache import TtlLruCache
+
+CHANNEL_ID = "C123"
+USER_ID = "U123"
+SETTINGS = {"model_id": "anthropic.claude-v2:1", "mode": "passthrough", "last_disclaimer_date": "2024-01-01"}
+CONDITIONAL_CHECK_FAILED = ClientError({"Error": {"Code": "ConditionalCheckFailedException"}}, "UpdateItem")
+
+
+def settings_item(settings):
+    item = {name: {"S": value} for name, value in settings.items()}
+    item["schema_version"] = {"N": "2"}
+    return item
+
+
+def legacy_settings_item(settings):
+    return {"settings": {"S": json.dumps(settings)}}
+
+
+def update_values(client, call_index=-1):
+    call = client.update_item.call_args_list[call_index].kwargs
+    return {call["ExpressionAttributeNames"]["#" + name[1:]]: value for name, value in
+            call["ExpressionAttributeValues"].items()}
+
+
+class DdbHelperTests(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(ddb_helper, "SETTINGS_CACHE", TtlLruCache(max_size=8, ttl_seconds=60))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(ddb_helper, "get_client")
+        self.client = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+
+    def test_cached_settings_are_not_read_again(self):
+        self.client.get_item.return_value = {"Item": settings_item(SETTINGS)}
+
+        self.assertEqual(SETTINGS, get_user_settings(CHANNEL_ID, USER_ID))
+        settings = get_user_settings(CHANNEL_ID, USER_ID)
+        settings["mode"] = "assistant"
+
+        self.assertEqual(SETTINGS, get_user_settings(CHANNEL_ID, USER_ID))
+        self.client.get_item.assert_called_once()
+        self.client.update_item.assert_not_called()
+        projection = self.client.get_item.call_args.kwargs["ExpressionAttributeNames"].values()
+        self.assertEqual({"model_id", "mode", "last_disclaimer_date", "schema_version", "settings"}, set(projection))
+
+    def test_legacy_settings_are_read(self):
+        self.client.get_item.return_value = {"Item": legacy_settings_item(SETTINGS)}
+
+        self.assertEqual(SETTINGS, get_user_settings(CHANNEL_ID, USER_ID))
+
+    def test_new_users_get_default_settings_with_a_single_write(self):
+        self.client.get_item.return_value = {}
+
+        settings = get_user_settings(CHANNEL_ID, USER_ID)
+
+        self.assertEqual("2020-01-01", settings["last_disclaimer_date"])
+        self.client.get_item.assert_called_once()
+        self.client.update_item.assert_called_once()
+        self.assertEqual("attribute_not_exists(qualified_user_id)",
+                         self.client.update_item.call_args.kwargs["ConditionExpression"])
+        self.assertEqual(settings_item(settings), update_values(self.client))
+
+    def test_settings_created_concurrently_are_read(self):
+        self.client.get_item.side_effect = [{}, {"Item": settings_item(SETTINGS)}]
+        self.client.update_item.side_effect = CONDITIONAL_CHECK_FAILED
+
+        self.assertEqual(SETTINGS, get_user_settings(CHANNEL_ID, USER_ID))
+
+    def test_defaults_are_returned_when_dynamodb_fails(self):
+        self.client.get_item.side_effect = Exception("throttled")
+
+        self.assertEqual("assistant", get_user_settings(CHANNEL_ID, USER_ID)["mode"])
+        self.assertEqual("assistant", get_user_settings(CHANNEL_ID, USER_ID)["mode"])
+        self.assertEqual(2, self.client.get_item.call_count)
+
+    def test_disclaimer_date_is_set_alone_without_a_read(self):
+        saved_item = settings_item(dict(SETTINGS, last_disclaimer_date="2024-02-01"))
+        self.client.update_item.return_value = {"Attributes": saved_item}
+
+        saved_settings = save_last_disclaimer_date(CHANNEL_ID, USER_ID, SETTINGS, date(2024, 2, 1))
+
+        self.assertEqual(dict(SETTINGS, last_disclaimer_date="2024-02-01"), saved_settings)
+        self.client.get_item.assert_not_called()
+        self.assertEqual("SET #last_disclaimer_date = :last_disclaimer_date",
+                         self.client.update_item.call_args.kwargs["UpdateExpression"])
+        self.assertEqual({"last_disclaimer_date": {"S": "2024-02-01"}, "schema_version": {"N": "2"}},
+                         update_values(self.client))
+        # the write went through the cache
+        self.assertEqual(saved_settings, get_user_settings(CHANNEL_ID, USER_ID))
+        self.client.get_item.assert_not_called()
+
+    def test_legacy_items_are_migrated_on_their_next_update(self):
+        self.client.update_item.side_effect = [CONDITIONAL_CHECK_FAILED, {}]
+
+        saved_settings = save_last_disclaimer_date(CHANNEL_ID, USER_ID, SETTINGS, date(2024, 2, 1))
+
+        self.assertEqual(dict(SETTINGS, last_disclaimer_date="2024-02-01"), saved_settings)
+        self.client.get_item.assert_not_called()
+        self.assertEqual(settings_item(saved_settings), update_values(self.client))
+        self.assertIn("REMOVE #settings", self.client.update_item.call_args.kwargs["UpdateExpression"])
+        self.assertEqual("attribute_not_exists(schema_version)",
+                         self.client.update_item.call_args.kwargs["ConditionExpression"])
+
+    def test_legacy_items_are_read_for_the_migration_if_not_cached(self):
+        concurrent_settings = dict(SETTINGS, model_id="anthropic.claude-instant-v1")
+        self.client.get_item.return_value = {"Item": legacy_settings_item(concurrent_settings)}
+        self.client.update_item.side_effect = [CONDITIONAL_CHECK_FAILED, {}]
+
+        saved_settings = save_settings(CHANNEL_ID, USER_ID, model_id="anthropic.claude-v2:1", mode="assistant",
+                                       last_disclaimer_date=date(2024, 3, 1))
+
+        self.assertEqual({"model_id": "anthropic.claude-v2:1", "mode": "assistant",
+                          "last_disclaimer_date": "2024-03-01"}, saved_settings)
+        self.assertEqual(settings_item(saved_settings), update_values(self.client))
+
+    def test_settings_are_saved_with_the_date_of_the_call(self):
+        self.client.update_item.side_effect = lambda **kwargs: {"Attributes": settings_item(
+            {name[1:]: value["S"] for name, value in kwargs["ExpressionAttributeValues"].items() if "S" in value})}
+
+        with mock.patch.object(ddb_helper, "date") as mock_date:
+            mock_date.today.return_value = date(2024, 3, 1)
+            saved_settings = save_settings(CHANNEL_ID, USER_ID, model_id="anthropic.claude-instant-v1",
+                                           mode="assistant")
+
+        self.assertEqual({"model_id": "anthropic.claude-instant-v1", "mode": "assistant",
+                          "last_disclaimer_date": "2024-03-01"}, saved_settings)
+
+    def test_updates_give_up_when_the_migration_keeps_racing(self):
+        self.client.get_item.return_value = {"Item": legacy_settings_item(SETTINGS)}
+        self.client.update_item.side_effect = CONDITIONAL_CHECK_FAILED
+
+        self.assertIsNone(save_settings(CHANNEL_ID, USER_ID, "anthropic.claude-instant-v1", "assistant"))
+        self.assertEqual(4, self.client.update_item.call_count)
+
+
+class BatchSettingsTests(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(ddb_helper, "SETTINGS_CACHE", TtlLruCache(max_size=8, ttl_seconds=60))
+        self.cache = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(ddb_helper, "get_client")
+        self.client = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(ddb_helper.time, "sleep")
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_settings_are_read_and_created_in_batches(self):
+        self.cache.put("C1/U1", SETTINGS)
+        self.client.batch_get_item.side_effect = [
+            {"Responses": {"BedrockAiAppMetaDataTable": [
+                dict(settings_item(SETTINGS), qualified_user_id={"S": "C1/U2"})]},
+             "UnprocessedKeys": {"BedrockAiAppMetaDataTable": {"Keys": [{"qualified_user_id": {"S": "C1/U3"}}]}}},
+            {"Responses": {"BedrockAiAppMetaDataTable": [
+                dict(legacy_settings_item(SETTINGS), qualified_user_id={"S": "C1/U3"})]}},
+        ]
+
+        settings = get_users_settings([("C1", "U1"), ("C1", "U2"), ("C1", "U3"), ("C1", "U4"), ("C1", "U2")])
+
+        self.assertEqual({"C1/U1", "C1/U2", "C1/U3", "C1/U4"}, set(settings))
+        self.assertEqual(SETTINGS, settings["C1/U3"])
+        self.assertEqual("2020-01-01", settings["C1/U4"]["last_disclaimer_date"])
+        request = self.client.batch_get_item.call_args_list[0].kwargs["RequestItems"]["BedrockAiAppMetaDataTable"]
+        self.assertEqual(["C1/U2", "C1/U3", "C1/U4"], [key["qualified_user_id"]["S"] for key in request["Keys"]])
+        self.assertTrue(request["ConsistentRead"])
+        self.sleep.assert_called_once()
+        # new users are created with the conditional write, settings written concurrently are not overwritten
+        self.client.batch_write_item.assert_not_called()
+        self.client.update_item.assert_called_once()
+        self.assertEqual({"qualified_user_id": {"S": "C1/U4"}}, self.client.update_item.call_args.kwargs["Key"])
+        self.assertEqual("attribute_not_exists(qualified_user_id)",
+                         self.client.update_item.call_args.kwargs["ConditionExpression"])
+        self.assertEqual(settings_item(settings["C1/U4"]), update_values(self.client))
+        # the per record reads are cache hits
+        self.assertEqual(SETTINGS, get_user_settings("C1", "U3"))
+        self.client.get_item.assert_not_called()
+
+    def test_settings_created_concurrently_are_read(self):
+        self.client.batch_get_item.return_value = {"Responses": {}}
+        self.client.update_item.side_effect = CONDITIONAL_CHECK_FAILED
+        self.client.get_item.return_value = {"Item": settings_item(SETTINGS)}
+
+        self.assertEqual({"C1/U1": SETTINGS}, get_users_settings([("C1", "U1")]))
+
+    def test_unprocessed_keys_are_left_to_the_records(self):
+        unprocessed_keys = {"BedrockAiAppMetaDataTable": {"Keys": [{"qualified_user_id": {"S": "C1/U1"}}]}}
+        self.client.batch_get_item.return_value = {"Responses": {}, "UnprocessedKeys": unprocessed_keys}
+
+        self.assertEqual({}, get_users_settings([("C1", "U1")]))
+        self.assertEqual(4, self.client.batch_get_item.call_count)
+        self.client.update_item.assert_not_called()
+
+    def test_failures_are_left_to_the_records(self):
+        self.client.batch_get_item.side_effect = Exception("throttled")
+
+        self.assertEqual({}, get_users_settings([("C1", "U1")]))
+
+
+if __name__ == '__main__':
+    unittest.main()
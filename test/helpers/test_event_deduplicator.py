@@ -0,0 +1,66 @@
+import time
+import unittest
+from unittest import mock
+
+from botocore.exceptions import ClientError
+
+from amazon_bedrock_ai_slack_app_lambda.helpers.event_deduplicator import EventDeduplicator
+
+TABLE_NAME = "SlackEvents"
+
+
+class EventDeduplicatorTests(unittest.TestCase):
+    def test_events_are_claimed_once(self):
+        test_unit = EventDeduplicator()
+
+        self.assertTrue(test_unit.claim("Ev1"))
+        self.assertFalse(test_unit.claim("Ev1"))
+        self.assertTrue(test_unit.claim("Ev2"))
+
+    def test_released_events_can_be_claimed_again(self):
+        test_unit = EventDeduplicator()
+        test_unit.claim("Ev1")
+
+        test_unit.release("Ev1")
+
+        self.assertTrue(test_unit.claim("Ev1"))
+
+    def test_events_claimed_by_another_container_are_skipped(self):
+        client = mock.Mock()
+        client.put_item.side_effect = ClientError({"Error": {"Code": "ConditionalCheckFailedException"}}, "PutItem")
+        test_unit = EventDeduplicator(TABLE_NAME, dynamodb_client_provider=lambda: client)
+
+        self.assertFalse(test_unit.claim("Ev1"))
+        self.assertEqual({"event_id": {"S": "Ev1"}, "expires_at": mock.ANY}, client.put_item.call_args.kwargs["Item"])
+
+    def test_events_are_leased_until_they_are_completed(self):
+        client = mock.Mock()
+        test_unit = EventDeduplicator(TABLE_NAME, ttl_seconds=3600, lease_seconds=900,
+                                      dynamodb_client_provider=lambda: client)
+
+        with mock.patch.object(time, "time", return_value=1000):
+            self.assertTrue(test_unit.claim("Ev1"))
+            self.assertEqual({"N": "1900"}, client.put_item.call_args.kwargs["Item"]["expires_at"])
+            self.assertTrue(test_unit.claim("Ev2", 30))
+            self.assertEqual({"N": "1030"}, client.put_item.call_args.kwargs["Item"]["expires_at"])
+
+            test_unit.complete("Ev1")
+
+        self.assertEqual({"event_id": {"S": "Ev1"}, "expires_at": {"N": "4600"}},
+                         client.put_item.call_args.kwargs["Item"])
+        self.assertNotIn("ConditionExpression", client.put_item.call_args.kwargs)
+        self.assertFalse(test_unit.claim("Ev1"))
+
+    def test_events_are_handled_when_the_table_fails(self):
+        client = mock.Mock()
+        client.put_item.side_effect = ClientError({"Error": {"Code": "ProvisionedThroughputExceededException"}},
+                                                  "PutItem")
+        test_unit = EventDeduplicator(TABLE_NAME, dynamodb_client_provider=lambda: client)
+
+        self.assertTrue(test_unit.claim("Ev1"))
+        test_unit.release("Ev1")
+        client.delete_item.assert_called_once_with(TableName=TABLE_NAME, Key={"event_id": {"S": "Ev1"}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import io
+import json
+import unittest
+from unittest import mock
+
+from amazon_bedrock_ai_slack_app_lambda.helpers import metrics_publisher, metrics_sink
+from amazon_bedrock_ai_slack_app_lambda.helpers.bedroc_invoker_metadata import BedrockInvokerMetadata
+from amazon_bedrock_ai_slack_app_lambda.helpers.metrics_sink import EmfMetricsSink
+
+TEST_NAMESPACE = "BedrockAiSlackApp"
+TEST_METADATA = BedrockInvokerMetadata("anthropic.claude-v2:1", "assistant", "C123ABC456", "U123", "testUser")
+
+
+def parse_emf_document(line):
+    """
+    Local EMF parser: validates a log line against the CloudWatch Embedded Metric Format specification and
+    returns the metrics it encodes.
+
+    :return: dict of (namespace, metric name, tuple of (dimension name, value)) to list of values
+    """
+    document = json.loads(line)
+    metadata = document["_aws"]
+    assert isinstance(metadata["Timestamp"], int)
+    assert len(metadata["CloudWatchMetrics"]) > 0
+
+    metrics = {}
+    for directive in metadata["CloudWatchMetrics"]:
+        assert isinstance(directive["Namespace"], str) and directive["Namespace"]
+        assert len(directive["Metrics"]) <= 100
+        for dimension_set in directive["Dimensions"]:
+            assert len(dimension_set) <= 30
+            for dimension_name in dimension_set:
+                assert isinstance(document[dimension_name], str), dimension_name
+        for metric in directive["Metrics"]:
+            value = document[metric["Name"]]
+            values = value if isinstance(value, list) else [value]
+            assert 0 < len(values) <= 100
+            assert all(isinstance(v, (int, float)) for v in values)
+            for dimension_set in directive["Dimensions"]:
+                dimensions = tuple((name, document[name]) for name in dimension_set)
+                metrics.setdefault((directive["Namespace"], metric["Name"], dimensions), []).extend(values)
+    return metrics
+
+
+class EmfMetricsSinkTests(unittest.TestCase):
+    def setUp(self):
+        self.lines = []
+        self.test_unit = EmfMetricsSink(TEST_NAMESPACE, writer=lambda document: self.lines.append(json.dumps(document)),
+                                        background_flush=False)
+
+    def parse_all(self):
+        metrics = {}
+        for line in self.lines:
+            for key, values in parse_emf_document(line).items():
+                metrics.setdefault(key, []).extend(values)
+        return metrics
+
+    def test_response_status_dimension_sets(self):
+        with mock.patch.object(metrics_publisher, "METRICS_SINK", self.test_unit):
+            metrics_publisher.report_bedrock_invoke_model_response_status(TEST_METADATA, True, "request-id")
+        self.test_unit.flush()
+
+        metrics = self.parse_all()
+        self.assertEqual(3, len(self.lines))
+        self.assertEqual([1], metrics[(TEST_NAMESPACE, "BedrockInvokeModelResponseStatus", (
+            ("ModelId", "anthropic.claude-v2:1"), ("Mode", "assistant"), ("UserId", "U123"), ("Login", "testUser"),
+            ("ChannelId", "C123ABC456"), ("ResponseStatusWithLogin", "True"), ("Exception", "None")))])
+        self.assertEqual([1], metrics[(TEST_NAMESPACE, "BedrockInvokeModelResponseStatus", (
+            ("ModelId", "anthropic.claude-v2:1"), ("Mode", "assistant"),
+            ("ResponseStatusAggregateWithModelIdAndMode", "True"), ("Exception", "None")))])
+        self.assertEqual([1], metrics[(TEST_NAMESPACE, "BedrockInvokeModelResponseStatus", (
+            ("ResponseStatusAggregate", "True"), ("Exception", "None")))])
+
+    def test_metrics_sharing_dimensions_are_written_in_one_document(self):
+        with mock.patch.object(metrics_publisher, "METRICS_SINK", self.test_unit):
+            metrics_publisher.report_bedrock_invoke_model_latency(TEST_METADATA, 1200.0)
+            metrics_publisher.report_bedrock_invoke_model_latency_first_chunk(TEST_METADATA, 300.0)
+            metrics_publisher.report_bedrock_invoke_model_latency(TEST_METADATA, 1200.0)
+        self.test_unit.flush()
+
+        self.assertEqual(1, len(self.lines))
+        dimensions = (("ModelId", "anthropic.claude-v2:1"), ("Mode", "assistant"))
+        metrics = self.parse_all()
+        self.assertEqual([1200.0, 1200.0], metrics[(TEST_NAMESPACE, "BedrockInvokeModelResponseLatencyMs", dimensions)])
+        self.assertEqual([300.0], metrics[(TEST_NAMESPACE, "BedrockInvokeModelResponseLatencyFirstChunkMs", dimensions)])
+
+    def test_metric_without_dimensions(self):
+        with mock.patch.object(metrics_publisher, "METRICS_SINK", self.test_unit):
+            metrics_publisher.report_comprehend_pii_metrics(True, False)
+        self.test_unit.flush()
+
+        self.assertEqual({(TEST_NAMESPACE, "ComprehendPIIDetectedInUserRequest", ()): [0]}, self.parse_all())
+
+    def test_value_arrays_are_split_at_the_emf_limit(self):
+        for value in range(250):
+            self.test_unit.put([{"MetricName": "Latency", "Value": value}])
+        self.test_unit.flush()
+
+        self.assertEqual(3, len(self.lines))
+        self.assertEqual(list(range(250)), self.parse_all()[(TEST_NAMESPACE, "Latency", ())])
+
+    def test_default_writer_writes_document_lines_to_stdout(self):
+        test_unit = EmfMetricsSink(TEST_NAMESPACE, background_flush=False)
+        test_unit.put([{"MetricName": "Latency", "Value": 1}])
+
+        # the application log level does not apply to metrics
+        with mock.patch.object(metrics_sink.sys, "stdout", new_callable=io.StringIO) as stdout, \
+                mock.patch.object(metrics_sink, "LOGGER") as logger:
+            test_unit.flush()
+
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual(1, len(lines))
+        self.assertEqual({(TEST_NAMESPACE, "Latency", ()): [1]}, parse_emf_document(lines[0]))
+        logger.info.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
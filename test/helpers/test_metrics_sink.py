@@ -0,0 +1,92 @@
+import threading
+import unittest
+
+from amazon_bedrock_ai_slack_app_lambda.helpers.metrics_sink import CloudWatchMetricsSink
+
+TEST_NAMESPACE = "TestNamespace"
+
+
+class FakeCloudWatch:
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+        self.calls = []
+        self.called = threading.Event()
+
+    def put_metric_data(self, Namespace, MetricData):
+        self.calls.append(MetricData)
+        self.called.set()
+        return {"ResponseMetadata": {"HTTPStatusCode": self.status_code}}
+
+
+def datum(name, value, model_id="anthropic.claude-v2:1"):
+    return {"MetricName": name, "Dimensions": [{"Name": "ModelId", "Value": model_id}], "Value": value}
+
+
+class CloudWatchMetricsSinkTests(unittest.TestCase):
+    def setUp(self):
+        self.cloudwatch = FakeCloudWatch()
+        self.test_unit = CloudWatchMetricsSink(TEST_NAMESPACE, lambda: self.cloudwatch, background_flush=False)
+
+    def test_repeated_datums_are_aggregated_into_values_and_counts(self):
+        for value in [1, 0, 1, 1]:
+            self.test_unit.put([datum("ComprehendPIIDetectedInLLMResponse", value)])
+        self.test_unit.put([datum("ComprehendPIIDetectedInLLMResponse", 1, model_id="other")])
+
+        self.assertTrue(self.test_unit.flush())
+
+        self.assertEqual(1, len(self.cloudwatch.calls))
+        metric_data = self.cloudwatch.calls[0]
+        self.assertEqual(2, len(metric_data))
+        self.assertEqual([1, 0], metric_data[0]["Values"])
+        self.assertEqual([3, 1], metric_data[0]["Counts"])
+        self.assertEqual([{"Name": "ModelId", "Value": "other"}], metric_data[1]["Dimensions"])
+
+    def test_flush_splits_requests_at_the_datum_limit(self):
+        for index in range(1500):
+            self.test_unit.put([datum("Metric{}".format(index), 1)])
+
+        self.test_unit.flush()
+
+        self.assertEqual([1000, 500], [len(metric_data) for metric_data in self.cloudwatch.calls])
+
+    def test_flush_splits_values_at_the_per_datum_limit(self):
+        for value in range(200):
+            self.test_unit.put([datum("BedrockInvokeModelResponseLatencyMs", value)])
+
+        self.test_unit.flush()
+
+        self.assertEqual([150, 50], [len(metric_datum["Values"]) for metric_datum in self.cloudwatch.calls[0]])
+
+    def test_buffer_is_bounded_and_drops_are_counted(self):
+        test_unit = CloudWatchMetricsSink(TEST_NAMESPACE, lambda: self.cloudwatch, max_buffered_values=2,
+                                          background_flush=False)
+
+        self.assertTrue(test_unit.put([datum("Latency", 1), datum("Latency", 2)]))
+        self.assertTrue(test_unit.put([datum("Latency", 2)]))
+        self.assertFalse(test_unit.put([datum("Latency", 3)]))
+
+        self.assertEqual(1, test_unit.stats()["dropped"])
+        self.assertEqual(3, test_unit.stats()["enqueued"])
+
+    def test_failed_publish_is_counted(self):
+        self.cloudwatch.status_code = 500
+        self.test_unit.put([datum("Latency", 1)])
+
+        self.assertFalse(self.test_unit.flush())
+        self.assertEqual(1, self.test_unit.stats()["failed"])
+
+    def test_background_flush_at_threshold(self):
+        test_unit = CloudWatchMetricsSink(TEST_NAMESPACE, lambda: self.cloudwatch, flush_threshold_values=3)
+
+        for value in range(3):
+            test_unit.put([datum("Latency", value)])
+
+        self.assertTrue(self.cloudwatch.called.wait(timeout=2))
+
+    def test_flush_without_data_does_not_call_cloudwatch(self):
+        self.assertTrue(self.test_unit.flush())
+        self.assertEqual([], self.cloudwatch.calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+
+from amazon_bedrock_ai_slack_app_lambda.helpers.model_helper import (
+    AVAILABLE_MODELS,
+    MODELS,
+    get_model,
+    get_model_by_bedrock_id,
+)
+
+
+class ModelHelperTests(unittest.TestCase):
+    def test_models_are_shared_and_immutable(self):
+        model = get_model("anthropic.claude-v2:1")
+
+        self.assertIs(model, get_model("anthropic.claude-v2:1"))
+        with self.assertRaises(AttributeError):
+            model.max_token_sample = 10
+        self.assertIsNone(get_model("unknown"))
+
+    def test_available_models_are_the_selectable_registry_entries(self):
+        self.assertEqual(["anthropic.claude-v2:1", "anthropic.claude-instant-v1",
+                          "anthropic.claude-3-sonnet-20240229-v1:0"], AVAILABLE_MODELS)
+
+    def test_models_are_found_by_their_bedrock_id(self):
+        self.assertIs(MODELS["amazon.titan-text-express-v1"], get_model_by_bedrock_id("amazon.titan-tg1-large"))
+
+    def test_chunks_are_decoded_per_model(self):
+        chunks = {
+            "anthropic.claude-instant-v1": {"completion": "hi"},
+            "anthropic.claude-3-sonnet-20240229-v1:0": {"type": "content_block_delta", "delta": {"text": "hi"}},
+            "amazon.titan-text-express-v1": {"outputText": "hi"},
+            "meta.llama2-13b-chat-v1": {"generation": "hi"},
+        }
+        for model_id, chunk in chunks.items():
+            self.assertEqual("hi", get_model(model_id).decode_chunk(chunk))
+        self.assertEqual('', get_model("anthropic.claude-3-sonnet-20240229-v1:0").decode_chunk(
+            {"type": "message_start"}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import json
+import unittest
+
+from amazon_bedrock_ai_slack_app_lambda.helpers.constants import BEDROCK_INVOKE_MODEL_BACKEND
+from amazon_bedrock_ai_slack_app_lambda.helpers.model_helper import get_model
+from amazon_bedrock_ai_slack_app_lambda.helpers.payload_generator import generate_payload
+from amazon_bedrock_ai_slack_app_lambda.helpers.utils import SlackMessage
+
+BOT = "UBOT"
+CLAUDE_V2 = get_model("anthropic.claude-v2:1")._replace(max_token_sample=100)
+CLAUDE_V3 = get_model("anthropic.claude-3-sonnet-20240229-v1:0")._replace(max_token_sample=100)
+TITAN = get_model("amazon.titan-text-express-v1")
+LLAMA2 = get_model("meta.llama2-13b-chat-v1")
+MESSAGES = [
+    SlackMessage("1.0", "U1", "<@UBOT> hi there "),
+    SlackMessage("2.0", BOT, "[SYSTEM] Settings saved successfully"),
+    SlackMessage("3.0", BOT, "Hello!"),
+    SlackMessage("4.0", "U1", " <@UBOT> tell me a joke"),
+]
+
+
+class GeneratePayloadTests(unittest.TestCase):
+    def test_claude_v2_prompt(self):
+        body = json.loads(generate_payload(MESSAGES, BOT, CLAUDE_V2, "passthrough")["body"])
+
+        self.assertEqual("Human:\n\n\nHuman: Bot hi there \n\nAssistant: Hello!\nHuman:  Bot tell me a joke\n"
+                         "Assistant:\n", body["prompt"])
+
+    def test_claude_v3_messages(self):
+        body = json.loads(generate_payload(MESSAGES, BOT, CLAUDE_V3, "passthrough")["body"])
+
+        self.assertEqual([{"role": "user", "content": "Bot hi there"},
+                          {"role": "assistant", "content": "Hello!"},
+                          {"role": "user", "content": "Bot tell me a joke"}], body["messages"])
+
+    def test_titan_and_llama2_transcripts(self):
+        titan = TITAN._replace(backend=BEDROCK_INVOKE_MODEL_BACKEND)
+        llama2 = LLAMA2._replace(backend=BEDROCK_INVOKE_MODEL_BACKEND)
+        titan_body = json.loads(generate_payload(MESSAGES, BOT, titan, "passthrough")["body"])
+        llama2_body = json.loads(generate_payload(MESSAGES, BOT, llama2, "passthrough")["body"])
+
+        self.assertEqual("User: Bot hi there\nBot: Hello!\nUser: Bot tell me a joke\nBot:", titan_body["inputText"])
+        self.assertEqual(750, titan_body["textGenerationConfig"]["maxTokenCount"])
+        self.assertEqual("[INST] User: Bot hi there\nAssistant: Hello!\nUser: Bot tell me a joke [/INST]",
+                         llama2_body["prompt"])
+
+    def test_converse_requests(self):
+        llama2_payload = generate_payload(MESSAGES, BOT, LLAMA2, "assistant", "earlier turns")
+        titan_payload = generate_payload(MESSAGES, BOT, TITAN, "passthrough", "earlier turns")
+
+        self.assertEqual("converse", llama2_payload["backend"])
+        self.assertNotIn("body", llama2_payload)
+        self.assertEqual([{"role": "user", "content": [{"text": "Bot hi there"}]},
+                          {"role": "assistant", "content": [{"text": "Hello!"}]},
+                          {"role": "user", "content": [{"text": "Bot tell me a joke"}]}], llama2_payload["messages"])
+        self.assertTrue(llama2_payload["system"][0]["text"].endswith(
+            "Summary of the earlier conversation:\nearlier turns"))
+        self.assertEqual({"maxTokens": 750, "temperature": 0.5}, llama2_payload["inferenceConfig"])
+        # Titan takes no system prompt, it is sent with the first turn
+        self.assertNotIn("system", titan_payload)
+        self.assertEqual("Summary of the earlier conversation:\nearlier turns\n\nBot hi there",
+                         titan_payload["messages"][0]["content"][0]["text"])
+        json.dumps(titan_payload)
+
+    def test_summary_is_sent_before_the_turns(self):
+        v2_body = json.loads(generate_payload(MESSAGES, BOT, CLAUDE_V2, "passthrough", "earlier turns")["body"])
+        v3_body = json.loads(generate_payload(MESSAGES, BOT, CLAUDE_V3, "passthrough", "earlier turns")["body"])
+
+        self.assertTrue(v2_body["prompt"].startswith(
+            "Human:\n\n\n<conversation_summary>\nearlier turns\n</conversation_summary>\n\nHuman: Bot hi there"))
+        self.assertEqual("\n\nSummary of the earlier conversation:\nearlier turns", v3_body["system"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import json
+import time
+import unittest
+from unittest import mock
+
+from amazon_bedrock_ai_slack_app_lambda.helpers.pii_cache import PiiScanCache, message_hash
+
+TEST_TABLE_NAME = "PiiScanCacheTable"
+TEST_MESSAGE = "reach me at alice@example.com"
+TEST_ENTITIES = [{"Type": "EMAIL", "BeginOffset": 12, "EndOffset": 29, "Score": 0.99}]
+
+
+def cached_item(message, entities, expires_at):
+    return {
+        "message_hash": {"S": message_hash(message)},
+        "entities": {"S": json.dumps(entities)},
+        "expires_at": {"N": str(expires_at)},
+    }
+
+
+class PiiScanCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.dynamodb = mock.Mock()
+        self.dynamodb.batch_get_item.return_value = {"Responses": {TEST_TABLE_NAME: []}}
+        self.dynamodb.batch_write_item.return_value = {}
+        self.test_unit = PiiScanCache(TEST_TABLE_NAME, ttl_seconds=60, max_size=10,
+                                      dynamodb_client_provider=lambda: self.dynamodb)
+
+    def test_put_stores_hash_and_entities_but_not_the_text(self):
+        self.test_unit.put_many({TEST_MESSAGE: TEST_ENTITIES})
+
+        items = self.dynamodb.batch_write_item.call_args[1]["RequestItems"][TEST_TABLE_NAME]
+        self.assertEqual(1, len(items))
+        self.assertNotIn("alice", json.dumps(items))
+        item = items[0]["PutRequest"]["Item"]
+        self.assertEqual(message_hash(TEST_MESSAGE), item["message_hash"]["S"])
+        self.assertEqual([{"Type": "EMAIL", "BeginOffset": 12, "EndOffset": 29}], json.loads(item["entities"]["S"]))
+
+    def test_memory_hits_do_not_call_dynamodb(self):
+        self.test_unit.put_many({TEST_MESSAGE: TEST_ENTITIES})
+
+        self.assertEqual({TEST_MESSAGE: TEST_ENTITIES}, self.test_unit.get_many([TEST_MESSAGE]))
+        self.dynamodb.batch_get_item.assert_not_called()
+
+    def test_table_hits_are_returned_and_expired_items_ignored(self):
+        expired = "an expired message"
+        self.dynamodb.batch_get_item.return_value = {"Responses": {TEST_TABLE_NAME: [
+            cached_item(TEST_MESSAGE, TEST_ENTITIES, int(time.time()) + 60),
+            cached_item(expired, [], int(time.time()) - 60),
+        ]}}
+
+        self.assertEqual({TEST_MESSAGE: TEST_ENTITIES}, self.test_unit.get_many([TEST_MESSAGE, expired, "new"]))
+        keys = self.dynamodb.batch_get_item.call_args[1]["RequestItems"][TEST_TABLE_NAME]["Keys"]
+        self.assertEqual(3, len(keys))
+
+    def test_dynamodb_failures_are_misses(self):
+        self.dynamodb.batch_get_item.side_effect = Exception("throttled")
+
+        self.assertEqual({}, self.test_unit.get_many([TEST_MESSAGE]))
+
+    def test_without_table_only_memory_is_used(self):
+        test_unit = PiiScanCache(None, dynamodb_client_provider=lambda: self.dynamodb)
+        test_unit.put_many({TEST_MESSAGE: TEST_ENTITIES})
+
+        self.assertEqual({TEST_MESSAGE: TEST_ENTITIES}, test_unit.get_many([TEST_MESSAGE, "new"]))
+        self.dynamodb.batch_get_item.assert_not_called()
+        self.dynamodb.batch_write_item.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import json
+import os
+import unittest
+from unittest import mock
+
+from amazon_bedrock_ai_slack_app_lambda.helpers import comprehend_helper, pii_detector
+from amazon_bedrock_ai_slack_app_lambda.helpers.constants import ALLOWED_COMPREHEND_PII_ENTITIES
+from amazon_bedrock_ai_slack_app_lambda.helpers.pii_detector import (
+    ComprehendPiiDetector,
+    LocalPiiDetector,
+    create_pii_detector,
+    iban_valid,
+    split_document,
+)
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), os.pardir, "fixtures", "pii_prefilter_corpus.json")
+
+TEST_TEXT = "Mail alice@example.com or call (206) 555-0142. " * 4
+
+
+def load_corpus():
+    with open(CORPUS_PATH) as corpus_file:
+        return json.load(corpus_file)["entries"]
+
+
+def disallowed(entity_types):
+    return set(entity_types).difference(ALLOWED_COMPREHEND_PII_ENTITIES)
+
+
+class SplitDocumentTests(unittest.TestCase):
+    def test_small_message_is_one_document(self):
+        self.assertEqual([(0, "hello world")], split_document("hello world", 100))
+
+    def test_documents_are_cut_at_whitespace_within_the_byte_limit(self):
+        message = "café " * 50
+        documents = split_document(message, 64)
+
+        self.assertEqual(message, "".join(document for _, document in documents))
+        for offset, document in documents:
+            self.assertLessEqual(len(document.encode('utf-8')), 64)
+            self.assertEqual(document, message[offset:offset + len(document)])
+            self.assertTrue(document.endswith(" ") or offset + len(document) == len(message))
+
+    def test_text_without_whitespace_is_cut_at_the_limit(self):
+        documents = split_document("é" * 10, 5)
+
+        self.assertEqual([(0, "éé"), (2, "éé"), (4, "éé"), (6, "éé"),
+                          (8, "éé")], documents)
+
+
+@mock.patch.object(pii_detector, "get_client")
+class ComprehendPiiDetectorTests(unittest.TestCase):
+    def test_entities_of_chunks_are_mapped_to_message_offsets(self, get_client):
+        local_detector = LocalPiiDetector()
+        get_client.return_value.detect_pii_entities.side_effect = (
+            lambda Text, LanguageCode: {"Entities": local_detector.detect(Text)})
+
+        entities = ComprehendPiiDetector(max_document_bytes=60).detect(TEST_TEXT)
+
+        self.assertGreater(get_client.return_value.detect_pii_entities.call_count, 1)
+        self.assertEqual(local_detector.detect(TEST_TEXT), entities)
+
+
+class LocalPiiDetectorTests(unittest.TestCase):
+    def test_disallowed_entities_of_recorded_corpus_are_found(self):
+        test_unit = LocalPiiDetector()
+
+        for entry in load_corpus():
+            detected = [entity["Type"] for entity in test_unit.detect(entry["text"])]
+            self.assertEqual(disallowed(entry["entity_types"]), disallowed(detected), entry["text"])
+
+    def test_entities_have_the_comprehend_shape(self):
+        entities = LocalPiiDetector().detect(TEST_TEXT[:47])
+
+        self.assertEqual([
+            {"Score": 1.0, "Type": "EMAIL", "BeginOffset": 5, "EndOffset": 22},
+            {"Score": 1.0, "Type": "PHONE", "BeginOffset": 31, "EndOffset": 45},
+        ], entities)
+
+    def test_checksums_reject_look_alikes(self):
+        test_unit = LocalPiiDetector()
+
+        self.assertTrue(iban_valid("GB82 WEST 1234 5698 7654 32"))
+        self.assertFalse(iban_valid("GB82 WEST 1234 5698 7654 33"))
+        self.assertEqual([], test_unit.detect("order 4111 1111 1111 1112 shipped"))
+        self.assertEqual([], test_unit.detect("version 999.1.1.1"))
+
+    def test_redaction_works_with_the_local_backend(self):
+        with mock.patch.object(comprehend_helper, "PII_DETECTOR", LocalPiiDetector()):
+            redacted, un_allowed = comprehend_helper.detect_and_redact_pii("Alice's email is alice@example.com")
+
+        self.assertEqual("Alice's email is <REDACTED>", redacted)
+        self.assertEqual({"EMAIL"}, un_allowed)
+
+
+class CreatePiiDetectorTests(unittest.TestCase):
+    def test_backend_is_selected_by_name(self):
+        self.assertIsInstance(create_pii_detector("local"), LocalPiiDetector)
+        self.assertIsInstance(create_pii_detector("comprehend"), ComprehendPiiDetector)
+
+    @mock.patch.dict(os.environ, {"PII_DETECTOR_BACKEND": "LOCAL"})
+    def test_backend_defaults_to_environment(self):
+        self.assertIsInstance(create_pii_detector(), LocalPiiDetector)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import json
+import os
+import unittest
+from unittest import mock
+
+from amazon_bedrock_ai_slack_app_lambda.helpers import comprehend_helper, pii_detector
+from amazon_bedrock_ai_slack_app_lambda.helpers.constants import ALLOWED_COMPREHEND_PII_ENTITIES
+from amazon_bedrock_ai_slack_app_lambda.helpers.pii_prefilter import PiiPrefilter, luhn_valid
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), os.pardir, "fixtures", "pii_prefilter_corpus.json")
+
+
+def load_corpus():
+    with open(CORPUS_PATH) as corpus_file:
+        return json.load(corpus_file)["entries"]
+
+
+def has_disallowed_entities(entry):
+    return bool(set(entry["entity_types"]).difference(ALLOWED_COMPREHEND_PII_ENTITIES))
+
+
+class PiiPrefilterTests(unittest.TestCase):
+    def test_no_false_negatives_on_recorded_corpus(self):
+        test_unit = PiiPrefilter()
+
+        false_negatives = [entry["text"] for entry in load_corpus()
+                           if has_disallowed_entities(entry) and test_unit.is_clean(entry["text"])]
+
+        self.assertEqual([], false_negatives)
+
+    def test_most_clean_messages_skip_comprehend(self):
+        test_unit = PiiPrefilter()
+        clean_entries = [entry for entry in load_corpus() if not has_disallowed_entities(entry)]
+
+        skipped = [entry for entry in clean_entries if test_unit.is_clean(entry["text"])]
+
+        self.assertGreater(len(skipped), 0.8 * len(clean_entries))
+        self.assertEqual({"checked": len(clean_entries), "skipped": len(skipped)}, test_unit.stats())
+
+    def test_luhn_check_tells_card_numbers_from_other_numbers(self):
+        self.assertTrue(luhn_valid("4111 1111 1111 1111"))
+        self.assertFalse(luhn_valid("4111 1111 1111 1112"))
+
+        test_unit = PiiPrefilter(min_digit_run=20)
+        self.assertEqual({"CREDIT_DEBIT_NUMBER"}, test_unit.classify("pay with 4111-1111-1111-1111"))
+        self.assertEqual(set(), test_unit.classify("order 4111-1111-1111-1112"))
+
+    def test_slack_mentions_are_not_suspicious(self):
+        self.assertTrue(PiiPrefilter().is_clean("<@U012ABCDEF> ping <#C0123ABC|general>"))
+
+    def test_thresholds_are_configurable(self):
+        self.assertTrue(PiiPrefilter().is_clean("room 42"))
+        self.assertFalse(PiiPrefilter(min_digit_run=2).is_clean("room 42"))
+        self.assertFalse(PiiPrefilter(max_chars=5).is_clean("thanks!"))
+        self.assertFalse(PiiPrefilter(enabled=False).is_clean("thanks!"))
+
+
+@mock.patch.object(pii_detector, "get_client")
+class DetectPiiEntitiesPrefilterTests(unittest.TestCase):
+    def test_clean_text_skips_comprehend(self, get_client):
+        self.assertEqual([], comprehend_helper.detect_pii_entities("thanks!"))
+        get_client.return_value.detect_pii_entities.assert_not_called()
+
+    def test_suspicious_text_is_sent_to_comprehend(self, get_client):
+        get_client.return_value.detect_pii_entities.return_value = {"Entities": []}
+
+        comprehend_helper.detect_pii_entities("my password is hunter2")
+
+        get_client.return_value.detect_pii_entities.assert_called_once_with(
+            Text="my password is hunter2", LanguageCode='en')
+
+
+if __name__ == '__main__':
+    unittest.main()
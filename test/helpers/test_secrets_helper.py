@@ -0,0 +1,65 @@
+import json
+import os
+import time
+import unittest
+from unittest import mock
+
+from amazon_bedrock_ai_slack_app_lambda.helpers import secrets_helper
+from amazon_bedrock_ai_slack_app_lambda.helpers.secrets_helper import SecretCache
+
+TEST_SECRET_ARN_ENV = "TEST_SECRET_ARN"
+TEST_SECRET_ARN = "arn:aws:secretsmanager:us-west-2:123456789012:secret:test"
+TEST_SECRET_KEY = "BOT_USER_TOKEN"
+
+
+def secret_response(token):
+    return {"SecretString": json.dumps({TEST_SECRET_KEY: token})}
+
+
+@mock.patch.dict(os.environ, {TEST_SECRET_ARN_ENV: TEST_SECRET_ARN})
+@mock.patch.object(secrets_helper, "get_client")
+class SecretCacheTests(unittest.TestCase):
+    def test_get_fetches_once_within_ttl(self, get_client):
+        get_client.return_value.get_secret_value.return_value = secret_response("xoxb-1")
+        test_unit = SecretCache(ttl_seconds=300, refresh_ahead_seconds=0, background_refresh=False)
+
+        for _ in range(5):
+            self.assertEqual("xoxb-1", test_unit.get(TEST_SECRET_ARN_ENV, TEST_SECRET_KEY))
+
+        get_client.return_value.get_secret_value.assert_called_once_with(SecretId=TEST_SECRET_ARN)
+
+    def test_get_fetches_again_after_expiry(self, get_client):
+        get_client.return_value.get_secret_value.side_effect = [secret_response("xoxb-1"),
+                                                                secret_response("xoxb-2")]
+        test_unit = SecretCache(ttl_seconds=0, refresh_ahead_seconds=0, background_refresh=False)
+
+        self.assertEqual("xoxb-1", test_unit.get(TEST_SECRET_ARN_ENV, TEST_SECRET_KEY))
+        self.assertEqual("xoxb-2", test_unit.get(TEST_SECRET_ARN_ENV, TEST_SECRET_KEY))
+
+    def test_invalidate_forces_fetch(self, get_client):
+        get_client.return_value.get_secret_value.side_effect = [secret_response("xoxb-1"),
+                                                                secret_response("xoxb-rotated")]
+        test_unit = SecretCache(ttl_seconds=300, refresh_ahead_seconds=0, background_refresh=False)
+
+        self.assertEqual("xoxb-1", test_unit.get(TEST_SECRET_ARN_ENV, TEST_SECRET_KEY))
+        test_unit.invalidate(TEST_SECRET_ARN_ENV)
+        self.assertEqual("xoxb-rotated", test_unit.get(TEST_SECRET_ARN_ENV, TEST_SECRET_KEY))
+
+    def test_background_refresh_serves_cached_value(self, get_client):
+        get_client.return_value.get_secret_value.side_effect = [secret_response("xoxb-1")] + [
+            secret_response("xoxb-2")] * 3
+        test_unit = SecretCache(ttl_seconds=60, refresh_ahead_seconds=60, background_refresh=True)
+
+        self.assertEqual("xoxb-1", test_unit.get(TEST_SECRET_ARN_ENV, TEST_SECRET_KEY))
+        # within the refresh window: the old value is served while the refresh runs in the background
+        self.assertEqual("xoxb-1", test_unit.get(TEST_SECRET_ARN_ENV, TEST_SECRET_KEY))
+
+        deadline = time.monotonic() + 2
+        while get_client.return_value.get_secret_value.call_count < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.05)
+        self.assertEqual("xoxb-2", test_unit.get(TEST_SECRET_ARN_ENV, TEST_SECRET_KEY))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import json
+import threading
+import unittest
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from amazon_bedrock_ai_slack_app_lambda.helpers.slack_client import SlackClient
+
+TEST_TOKEN = "xoxb-test"
+TEST_CHANNEL_ID = "C123ABC456"
+
+
+class SlackStandInHandler(BaseHTTPRequestHandler):
+    """
+    Minimal local stand-in for the Slack Web API. Records every request and answers with the next queued response.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.__handle(None)
+
+    def do_POST(self):
+        self.__handle(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("ascii"))
+
+    def __handle(self, body):
+        server = self.server
+        server.requests.append({
+            "client_port": self.client_address[1],
+            "method": self.command,
+            "path": self.path,
+            "authorization": self.headers.get("Authorization"),
+            "body": urllib.parse.parse_qs(body) if body else {},
+        })
+        response = server.responses.pop(0) if server.responses else {"ok": True}
+        # (status, headers, body) tuples answer with another status than 200
+        status, headers, response = response if isinstance(response, tuple) else (200, {}, response)
+        payload = json.dumps(response).encode("utf-8")
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+        # drop the keep-alive connection without announcing it, like an idle timeout on the server side
+        self.close_connection = server.drop_connections
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SlackClientTests(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), SlackStandInHandler)
+        self.server.requests = []
+        self.server.responses = []
+        self.server.drop_connections = False
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.tokens = [TEST_TOKEN]
+        self.invalidations = []
+        self.test_unit = SlackClient(base_url="http://127.0.0.1:{}/api".format(self.server.server_address[1]),
+                                     pool_size=2, token_provider=lambda: self.tokens[0],
+                                     token_invalidator=self.__invalidate)
+
+    def tearDown(self):
+        self.test_unit.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __invalidate(self):
+        self.invalidations.append(self.tokens.pop(0))
+
+    def test_rate_limited_calls_are_retried_after_retry_after(self):
+        self.server.responses.extend([(429, {"Retry-After": "0"}, {"ok": False, "error": "ratelimited"}),
+                                      {"ok": True, "ts": "123.456"}])
+
+        response = self.test_unit.api_call("chat.update", {"channel": TEST_CHANNEL_ID, "ts": "123.456", "text": "hi"})
+
+        self.assertEqual({"ok": True, "ts": "123.456"}, response)
+        self.assertEqual(2, len(self.server.requests))
+        self.assertEqual(1, self.test_unit.rate_limiter.stats()["chat.update"]["throttled"])
+
+    def test_post_sends_form_encoded_params_with_bearer_token(self):
+        self.server.responses.append({"ok": True, "ts": "123.456"})
+
+        response = self.test_unit.api_call("chat.postMessage", {"channel": TEST_CHANNEL_ID, "text": "hi there"})
+
+        self.assertEqual({"ok": True, "ts": "123.456"}, response)
+        request = self.server.requests[0]
+        self.assertEqual("POST", request["method"])
+        self.assertEqual("/api/chat.postMessage", request["path"])
+        self.assertEqual("Bearer " + TEST_TOKEN, request["authorization"])
+        self.assertEqual({"channel": [TEST_CHANNEL_ID], "text": ["hi there"]}, request["body"])
+
+    def test_get_sends_query_string(self):
+        self.test_unit.api_call("users.info", {"user": "U123"}, http_method="GET")
+
+        request = self.server.requests[0]
+        self.assertEqual("GET", request["method"])
+        self.assertEqual("/api/users.info?user=U123", request["path"])
+
+    def test_connection_is_kept_alive_across_calls(self):
+        for _ in range(5):
+            self.test_unit.api_call("chat.update", {"channel": TEST_CHANNEL_ID, "text": "x", "ts": "1.0"})
+
+        self.assertEqual(5, len(self.server.requests))
+        self.assertEqual(1, len({request["client_port"] for request in self.server.requests}))
+
+    def test_connection_closed_by_server_is_reopened(self):
+        self.server.drop_connections = True
+
+        for _ in range(3):
+            self.assertTrue(self.test_unit.api_call("auth.test", http_method="GET").get("ok"))
+
+        self.assertEqual(3, len(self.server.requests))
+
+    def test_token_is_refreshed_once_on_invalid_auth(self):
+        self.tokens.append("xoxb-rotated")
+        self.server.responses.append({"ok": False, "error": "invalid_auth"})
+        self.server.responses.append({"ok": True, "user_id": "U0BOT"})
+
+        response = self.test_unit.api_call("auth.test", http_method="GET")
+
+        self.assertEqual("U0BOT", response.get("user_id"))
+        self.assertEqual([TEST_TOKEN], self.invalidations)
+        self.assertEqual("Bearer xoxb-rotated", self.server.requests[1]["authorization"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import time
+import unittest
+from unittest import mock
+
+from amazon_bedrock_ai_slack_app_lambda.helpers import slack_helper
+from amazon_bedrock_ai_slack_app_lambda.helpers.thread_cache import ThreadMessageCache
+from amazon_bedrock_ai_slack_app_lambda.validation.slack_params_validator import (
+    SLACK_PARAMETER_VALIDATOR,
+)
+
+TEST_CHANNEL_ID = "C123ABC456"
+TEST_THREAD_TS = "100.000000"
+
+
+def slack_message(ts, text, **fields):
+    return dict({"ts": ts, "user": "U1", "text": text}, **fields)
+
+
+def replies_page(messages, next_cursor=""):
+    return {"ok": True, "messages": messages, "response_metadata": {"next_cursor": next_cursor}}
+
+
+@mock.patch.object(slack_helper, "SLACK_CLIENT")
+class SlackHelperCacheTests(unittest.TestCase):
+    def setUp(self):
+        slack_helper.BOT_IDENTITY_CACHE.invalidate()
+        slack_helper.CHANNEL_INFO_CACHE.invalidate()
+        slack_helper.USER_INFO_CACHE.invalidate()
+        SLACK_PARAMETER_VALIDATOR.set_channel_id(TEST_CHANNEL_ID)
+
+    def tearDown(self):
+        SLACK_PARAMETER_VALIDATOR.set_channel_id(None)
+
+    def test_bot_user_id_is_fetched_once(self, slack_client):
+        slack_client.api_call.return_value = {"ok": True, "user_id": "U0BOT"}
+
+        self.assertEqual("U0BOT", slack_helper.get_bot_user_id())
+        self.assertEqual("U0BOT", slack_helper.get_bot_user_id())
+
+        slack_client.api_call.assert_called_once()
+
+    def test_channel_type_is_fetched_once(self, slack_client):
+        slack_client.api_call.return_value = {"ok": True, "channel": {"id": TEST_CHANNEL_ID, "is_im": True}}
+
+        self.assertEqual("im", slack_helper.get_channel_type(TEST_CHANNEL_ID))
+        self.assertEqual("im", slack_helper.get_channel_type(TEST_CHANNEL_ID))
+
+        slack_client.api_call.assert_called_once()
+        self.assertEqual(1, slack_helper.get_slack_cache_stats()["channel_info"]["hits"])
+
+    def test_failed_user_lookup_is_not_cached(self, slack_client):
+        slack_client.api_call.side_effect = [{"ok": False, "error": "ratelimited"},
+                                             {"ok": True, "user": {"name": "testUser"}}]
+
+        self.assertFalse(slack_helper.get_user_from_userid("U123").get("ok"))
+        self.assertEqual("testUser", slack_helper.get_user_from_userid("U123").get("user").get("name"))
+        self.assertEqual("testUser", slack_helper.get_user_from_userid("U123").get("user").get("name"))
+
+        self.assertEqual(2, slack_client.api_call.call_count)
+
+
+@mock.patch.object(slack_helper, "SLACK_CLIENT")
+class SlackHelperHistoryTests(unittest.TestCase):
+    def setUp(self):
+        SLACK_PARAMETER_VALIDATOR.set_channel_id(TEST_CHANNEL_ID)
+        patcher = mock.patch.object(slack_helper, "THREAD_MESSAGE_CACHE", ThreadMessageCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        SLACK_PARAMETER_VALIDATOR.set_channel_id(None)
+
+    def test_thread_replies_are_paginated(self, slack_client):
+        slack_client.api_call.side_effect = [
+            replies_page([slack_message("100.000000", "parent"), slack_message("101.000000", "first")], "page2"),
+            replies_page([slack_message("102.000000", "second")]),
+        ]
+
+        messages = slack_helper.get_thread_replies(TEST_CHANNEL_ID, TEST_THREAD_TS)
+
+        self.assertEqual(["parent", "first", "second"], [message.msg for message in messages])
+        self.assertEqual("page2", slack_client.api_call.call_args_list[1][0][1]["cursor"])
+
+    def test_only_new_replies_are_fetched(self, slack_client):
+        slack_client.api_call.side_effect = [
+            replies_page([slack_message("100.000000", "parent"), slack_message("101.000000", "first")]),
+            replies_page([slack_message("100.000000", "parent"), slack_message("102.000000", "second")]),
+        ]
+
+        slack_helper.get_thread_replies(TEST_CHANNEL_ID, TEST_THREAD_TS)
+        messages = slack_helper.get_thread_replies(TEST_CHANNEL_ID, TEST_THREAD_TS)
+
+        self.assertEqual(["parent", "first", "second"], [message.msg for message in messages])
+        self.assertNotIn("oldest", slack_client.api_call.call_args_list[0][0][1])
+        self.assertEqual("101.000000", slack_client.api_call.call_args_list[1][0][1]["oldest"])
+
+    def test_streaming_bot_replies_are_fetched_again(self, slack_client):
+        now = "{:.6f}".format(time.time())
+        slack_client.api_call.side_effect = [
+            replies_page([slack_message("100.000000", "parent"), slack_message(now, ">:thinking_face:", bot_id="B1")]),
+            replies_page([slack_message(now, "the answer", bot_id="B1")]),
+        ]
+
+        slack_helper.get_thread_replies(TEST_CHANNEL_ID, TEST_THREAD_TS)
+        messages = slack_helper.get_thread_replies(TEST_CHANNEL_ID, TEST_THREAD_TS)
+
+        self.assertEqual(["parent", "the answer"], [message.msg for message in messages])
+        self.assertEqual("100.000000", slack_client.api_call.call_args_list[1][0][1]["oldest"])
+
+    def test_failed_pages_are_not_cached(self, slack_client):
+        slack_client.api_call.side_effect = [
+            replies_page([slack_message("100.000000", "parent")], "page2"),
+            {"ok": False, "error": "ratelimited"},
+            replies_page([slack_message("100.000000", "parent"), slack_message("101.000000", "first")]),
+        ]
+
+        self.assertEqual(1, len(slack_helper.get_thread_replies(TEST_CHANNEL_ID, TEST_THREAD_TS)))
+        self.assertEqual(2, len(slack_helper.get_thread_replies(TEST_CHANNEL_ID, TEST_THREAD_TS)))
+        self.assertNotIn("oldest", slack_client.api_call.call_args_list[2][0][1])
+
+    def test_conversation_history_stops_at_the_limit(self, slack_client):
+        slack_client.api_call.return_value = replies_page(
+            [slack_message("103.000000", "third"), slack_message("102.000000", "second")], "page2")
+
+        messages = slack_helper.get_conversation_history(TEST_CHANNEL_ID, 2)
+
+        self.assertEqual(["second", "third"], [message.msg for message in messages])
+        slack_client.api_call.assert_called_once()
+        self.assertEqual(2, slack_client.api_call.call_args[0][1]["limit"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+
+from amazon_bedrock_ai_slack_app_lambda.helpers.slack_rate_limiter import SlackRateLimiter, TokenBucket
+
+TEST_CHANNEL_ID = "C123ABC456"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class RecordingSender:
+    def __init__(self, responses=None):
+        self.sent = []
+        self.responses = list(responses or [])
+
+    def __call__(self, params):
+        self.sent.append(params)
+        return self.responses.pop(0) if self.responses else ({"ok": True}, None)
+
+
+def update(text):
+    return {"channel": TEST_CHANNEL_ID, "ts": "123.456", "text": text}
+
+
+class TokenBucketTests(unittest.TestCase):
+    def test_tokens_are_refilled_at_the_rate(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, burst=2, clock=clock)
+
+        self.assertEqual(0, bucket.try_acquire())
+        self.assertEqual(0, bucket.try_acquire())
+        self.assertAlmostEqual(0.5, bucket.try_acquire())
+        clock.now += 0.5
+        self.assertEqual(0, bucket.try_acquire())
+
+    def test_blocked_bucket_hands_out_no_tokens(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, burst=2, clock=clock)
+
+        bucket.block(3)
+
+        self.assertAlmostEqual(3, bucket.try_acquire())
+        clock.now += 3.5
+        self.assertEqual(0, bucket.try_acquire())
+
+
+class SlackRateLimiterTests(unittest.TestCase):
+    def test_rate_limited_calls_are_retried(self):
+        limiter = SlackRateLimiter(limits=(("chat.", 100, 10),))
+        send = RecordingSender([({"ok": False, "error": "ratelimited"}, 0), ({"ok": True, "ts": "1.0"}, None)])
+
+        self.assertEqual({"ok": True, "ts": "1.0"}, limiter.call("chat.postMessage", {"text": "hi"}, send))
+        self.assertEqual(2, len(send.sent))
+        self.assertEqual(1, limiter.stats()["chat."]["throttled"])
+
+    def test_calls_fail_locally_without_a_token_in_time(self):
+        limiter = SlackRateLimiter(limits=(("chat.", 0.1, 1),), max_wait_seconds=0.5)
+        send = RecordingSender()
+
+        self.assertEqual({"ok": True}, limiter.call("chat.postMessage", {"text": "first"}, send))
+        self.assertEqual({"ok": False, "error": "ratelimited"}, limiter.call("chat.postMessage", {"text": "second"},
+                                                                             send))
+        self.assertEqual(1, len(send.sent))
+
+    def test_methods_without_a_bucket_are_not_limited(self):
+        limiter = SlackRateLimiter(limits=(("chat.", 0.1, 1),), max_wait_seconds=0)
+        send = RecordingSender()
+
+        for _ in range(3):
+            self.assertEqual({"ok": True}, limiter.call("users.info", {"user": "U1"}, send))
+        self.assertEqual({}, {prefix: stats for prefix, stats in limiter.stats().items() if stats["max_queue_depth"]})
+
+    def test_waits_and_queue_depth_are_counted(self):
+        limiter = SlackRateLimiter(limits=(("chat.update", 4, 1),))
+        send = RecordingSender()
+        limiter.call("chat.update", update("first"), send)
+
+        # waits about 0.25 seconds for the next token
+        self.assertEqual({"ok": True}, limiter.call("chat.update", update("second"), send))
+
+        self.assertEqual(["first", "second"], [params["text"] for params in send.sent])
+        stats = limiter.stats(reset=True)["chat.update"]
+        self.assertEqual(1, stats["max_queue_depth"])
+        self.assertGreater(stats["waited_seconds"], 0)
+        self.assertEqual(0, limiter.stats()["chat.update"]["waited_seconds"])
+
+    def test_messages_are_limited_per_channel(self):
+        limiter = SlackRateLimiter(limits=(("chat.postMessage", 0.1, 1),), max_wait_seconds=0)
+        send = RecordingSender()
+
+        self.assertEqual({"ok": True}, limiter.call("chat.postMessage", {"channel": "C1", "text": "hi"}, send))
+        self.assertEqual({"ok": True}, limiter.call("chat.postMessage", {"channel": "C2", "text": "hi"}, send))
+        self.assertEqual({"ok": False, "error": "ratelimited"},
+                         limiter.call("chat.postMessage", {"channel": "C1", "text": "again"}, send))
+        self.assertEqual(2, len(send.sent))
+
+    def test_updates_share_one_bucket(self):
+        limiter = SlackRateLimiter(limits=(("chat.update", 0.1, 1),), max_wait_seconds=0)
+        send = RecordingSender()
+
+        self.assertEqual({"ok": True}, limiter.call("chat.update", {"channel": "C1", "ts": "1.0"}, send))
+        self.assertEqual({"ok": False, "error": "ratelimited"},
+                         limiter.call("chat.update", {"channel": "C2", "ts": "2.0"}, send))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import json
+import time
+import unittest
+from unittest import mock
+
+from amazon_bedrock_ai_slack_app_lambda.helpers.thread_cache import (
+    ThreadMessageCache,
+    get_settled_messages,
+    merge_messages,
+)
+
+CHANNEL_ID = "C123"
+THREAD_TS = "100.000000"
+TABLE_NAME = "ThreadMessages"
+MESSAGES = [
+    {"ts": "100.000000", "user": "U1", "text": "parent", "blocks": []},
+    {"ts": "101.000000", "user": "UBOT", "text": "answer", "bot_id": "B1"},
+    {"ts": "102.000000", "user": "U1", "text": "thanks"},
+]
+
+
+class SettledMessagesTests(unittest.TestCase):
+    def test_cached_messages_are_reduced_to_the_prompt_fields(self):
+        settled_messages = get_settled_messages(MESSAGES, now=1000)
+
+        self.assertEqual(3, len(settled_messages))
+        self.assertEqual({"ts": "100.000000", "user": "U1", "text": "parent"}, settled_messages[0])
+
+    def test_cache_stops_at_recent_bot_messages(self):
+        self.assertEqual(["100.000000"], [message["ts"] for message in get_settled_messages(MESSAGES, now=200)])
+
+    def test_merge_skips_already_cached_messages(self):
+        merged = merge_messages(MESSAGES[:2], [MESSAGES[0], MESSAGES[2]])
+
+        self.assertEqual(MESSAGES, merged)
+        self.assertEqual(MESSAGES[:1], merge_messages([], MESSAGES[:1]))
+
+
+class ThreadMessageCacheTests(unittest.TestCase):
+    def test_threads_are_persisted_to_the_table(self):
+        client = mock.Mock()
+        writer = ThreadMessageCache(TABLE_NAME, dynamodb_client_provider=lambda: client)
+        writer.put(CHANNEL_ID, THREAD_TS, MESSAGES[:1])
+
+        item = client.put_item.call_args.kwargs["Item"]
+        self.assertEqual({"S": "C123/100.000000"}, item["thread_key"])
+        client.get_item.return_value = {"Item": item}
+
+        reader = ThreadMessageCache(TABLE_NAME, dynamodb_client_provider=lambda: client)
+        self.assertEqual([{"ts": "100.000000", "user": "U1", "text": "parent"}], reader.get(CHANNEL_ID, THREAD_TS))
+        reader.get(CHANNEL_ID, THREAD_TS)
+        client.get_item.assert_called_once()
+
+    def test_expired_threads_are_ignored(self):
+        client = mock.Mock()
+        client.get_item.return_value = {"Item": {"messages": {"S": json.dumps(MESSAGES)},
+                                                 "expires_at": {"N": str(int(time.time()) - 60)}}}
+        cache = ThreadMessageCache(TABLE_NAME, dynamodb_client_provider=lambda: client)
+
+        self.assertIsNone(cache.get(CHANNEL_ID, THREAD_TS))
+
+
+if __name__ == '__main__':
+    unittest.main()
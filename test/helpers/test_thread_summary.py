@@ -0,0 +1,132 @@
+import io
+import json
+import time
+import unittest
+from unittest import mock
+
+from botocore.exceptions import ClientError
+
+from amazon_bedrock_ai_slack_app_lambda.helpers import thread_summary
+from amazon_bedrock_ai_slack_app_lambda.helpers.thread_summary import (
+    ThreadSummary,
+    ThreadSummaryStore,
+    get_recent_messages,
+    needs_summary,
+    summarize_thread,
+)
+from amazon_bedrock_ai_slack_app_lambda.helpers.utils import SlackMessage
+
+BOT = "UBOT"
+CHANNEL_ID = "C123"
+THREAD_TS = "100.000000"
+TABLE_NAME = "ThreadSummaries"
+
+
+def thread(count):
+    return [SlackMessage("{}.000000".format(101 + index), BOT if index % 2 else "U1", "message {}".format(index))
+            for index in range(count)]
+
+
+def model_response(completion):
+    return {"body": io.BytesIO(json.dumps({"completion": completion}).encode('utf-8'))}
+
+
+class ThreadSummaryStoreTests(unittest.TestCase):
+    def test_summaries_are_kept_in_memory_without_a_table(self):
+        store = ThreadSummaryStore()
+
+        self.assertIsNone(store.get(CHANNEL_ID, THREAD_TS))
+        self.assertTrue(store.put(CHANNEL_ID, THREAD_TS, ThreadSummary("summary", "110.000000")))
+        self.assertEqual(ThreadSummary("summary", "110.000000"), store.get(CHANNEL_ID, THREAD_TS))
+
+    def test_summary_is_read_from_the_table(self):
+        client = mock.Mock()
+        client.get_item.return_value = {"Item": {
+            "summary": {"S": "summary"},
+            "watermark_ts": {"N": "110.000000"},
+            "expires_at": {"N": str(int(time.time()) + 60)},
+        }}
+        store = ThreadSummaryStore(TABLE_NAME, dynamodb_client_provider=lambda: client)
+
+        self.assertEqual(ThreadSummary("summary", "110.000000"), store.get(CHANNEL_ID, THREAD_TS))
+        self.assertEqual(ThreadSummary("summary", "110.000000"), store.get(CHANNEL_ID, THREAD_TS))
+        client.get_item.assert_called_once()
+        self.assertEqual({"thread_key": {"S": "C123/100.000000"}}, client.get_item.call_args.kwargs["Key"])
+
+    def test_expired_summaries_are_ignored(self):
+        client = mock.Mock()
+        client.get_item.return_value = {"Item": {
+            "summary": {"S": "summary"},
+            "watermark_ts": {"N": "110.000000"},
+            "expires_at": {"N": str(int(time.time()) - 60)},
+        }}
+        store = ThreadSummaryStore(TABLE_NAME, dynamodb_client_provider=lambda: client)
+
+        self.assertIsNone(store.get(CHANNEL_ID, THREAD_TS))
+
+    def test_older_summaries_do_not_replace_newer_ones(self):
+        client = mock.Mock()
+        client.put_item.side_effect = ClientError({"Error": {"Code": "ConditionalCheckFailedException"}}, "PutItem")
+        store = ThreadSummaryStore(TABLE_NAME, dynamodb_client_provider=lambda: client)
+
+        self.assertFalse(store.put(CHANNEL_ID, THREAD_TS, ThreadSummary("summary", "110.000000")))
+        self.assertEqual({":watermark_ts": {"N": "110.000000"}},
+                         client.put_item.call_args.kwargs["ExpressionAttributeValues"])
+
+
+class RecentMessagesTests(unittest.TestCase):
+    def test_messages_after_the_watermark_are_kept(self):
+        messages = thread(5)
+
+        self.assertIs(messages, get_recent_messages(messages, None))
+        self.assertEqual(messages[2:], get_recent_messages(messages, ThreadSummary("summary", "102.000000")))
+
+
+@mock.patch.object(thread_summary, "detect_and_redact_pii_concurrently",
+                   side_effect=lambda messages: [(message.replace("message", "redacted"), set())
+                                                 for message in messages])
+class SummarizeThreadTests(unittest.TestCase):
+    def setUp(self):
+        self.store = ThreadSummaryStore()
+        patcher = mock.patch.object(thread_summary, "THREAD_SUMMARY_STORE", self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_threads_need_a_summary_after_the_trigger(self, _):
+        self.assertFalse(needs_summary(thread(24), None))
+        self.assertTrue(needs_summary(thread(25), None))
+        self.assertFalse(needs_summary(thread(30), ThreadSummary("summary", thread(30)[5].ts)))
+
+    def test_short_threads_are_not_summarized(self, _):
+        with mock.patch.object(thread_summary, "get_client") as get_client:
+            self.assertIsNone(summarize_thread(CHANNEL_ID, THREAD_TS, thread(24), None, BOT))
+
+        get_client.assert_not_called()
+
+    def test_older_turns_are_folded_into_the_summary(self, _):
+        messages = thread(30)
+        with mock.patch.object(thread_summary, "get_client") as get_client:
+            get_client.return_value.invoke_model.return_value = model_response(" new summary ")
+            new_summary = summarize_thread(CHANNEL_ID, THREAD_TS, messages, ThreadSummary("old summary", "100.5"),
+                                           BOT)
+
+        # 8 turns are kept, they start with a user turn
+        self.assertEqual(ThreadSummary("new summary", messages[21].ts), new_summary)
+        self.assertEqual("U1", get_recent_messages(messages, new_summary)[0].user)
+        self.assertEqual(new_summary, self.store.get(CHANNEL_ID, THREAD_TS))
+        prompt = json.loads(get_client.return_value.invoke_model.call_args.kwargs["body"])["prompt"]
+        self.assertIn("<summary>\nold summary\n</summary>", prompt)
+        self.assertIn("User: redacted 0", prompt)
+        self.assertIn("Assistant: redacted 21", prompt)
+        self.assertNotIn("redacted 22", prompt)
+
+    def test_failed_summarization_keeps_the_summary(self, _):
+        with mock.patch.object(thread_summary, "get_client") as get_client:
+            get_client.return_value.invoke_model.side_effect = Exception("throttled")
+            self.assertIsNone(summarize_thread(CHANNEL_ID, THREAD_TS, thread(30), None, BOT))
+
+        self.assertIsNone(self.store.get(CHANNEL_ID, THREAD_TS))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import time
+import unittest
+
+from amazon_bedrock_ai_slack_app_lambda.helpers.ttl_cache import TtlLruCache
+
+
+class TtlLruCacheTests(unittest.TestCase):
+    def test_get_returns_cached_value_and_counts_hits(self):
+        test_unit = TtlLruCache(max_size=2, ttl_seconds=60)
+        test_unit.put("C1", "im")
+
+        self.assertEqual("im", test_unit.get("C1"))
+        self.assertIsNone(test_unit.get("C2"))
+        self.assertEqual({"hits": 1, "misses": 1, "evictions": 0, "size": 1}, test_unit.stats())
+
+    def test_least_recently_used_entry_is_evicted(self):
+        test_unit = TtlLruCache(max_size=2, ttl_seconds=60)
+        test_unit.put("C1", 1)
+        test_unit.put("C2", 2)
+        test_unit.get("C1")
+        test_unit.put("C3", 3)
+
+        self.assertEqual(1, test_unit.get("C1"))
+        self.assertIsNone(test_unit.get("C2"))
+        self.assertEqual(3, test_unit.get("C3"))
+        self.assertEqual(1, test_unit.stats()["evictions"])
+
+    def test_expired_entry_is_a_miss(self):
+        test_unit = TtlLruCache(max_size=2, ttl_seconds=0.01)
+        test_unit.put("C1", 1)
+        time.sleep(0.02)
+
+        self.assertEqual("default", test_unit.get("C1", "default"))
+        self.assertEqual(0, test_unit.stats()["size"])
+
+    def test_invalidate(self):
+        test_unit = TtlLruCache(max_size=2, ttl_seconds=60)
+        test_unit.put("C1", 1)
+        test_unit.put("C2", 2)
+
+        test_unit.invalidate("C1")
+        self.assertIsNone(test_unit.get("C1"))
+        test_unit.invalidate()
+        self.assertIsNone(test_unit.get("C2"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+
+from amazon_bedrock_ai_slack_app_lambda.helpers.constants import DISCLAIMER, PII_SYSTEM_MESSAGE_TAG
+from amazon_bedrock_ai_slack_app_lambda.helpers.utils import SlackMessage, get_sorted_messages
+
+
+def slack_message(ts, text, user="U1", **kwargs):
+    return dict({"ts": ts, "user": user, "text": text}, **kwargs)
+
+
+class GetSortedMessagesTests(unittest.TestCase):
+    def test_oldest_first_messages_keep_their_order(self):
+        messages = [slack_message("1.0", "a"), slack_message("2.0", "b"), slack_message("3.0", "c")]
+
+        self.assertEqual([SlackMessage("1.0", "U1", "a"), SlackMessage("2.0", "U1", "b"),
+                          SlackMessage("3.0", "U1", "c")], get_sorted_messages(messages))
+
+    def test_newest_first_messages_are_reversed(self):
+        messages = [slack_message("3.0", "c"), slack_message("2.0", "b"), slack_message("1.0", "a")]
+
+        self.assertEqual(["a", "b", "c"], [record.msg for record in get_sorted_messages(messages, newest_first=True)])
+
+    def test_unexpected_order_is_sorted(self):
+        messages = [slack_message("2.0", "b"), slack_message("10.0", "c"), slack_message("1.0", "a")]
+
+        self.assertEqual(["a", "b", "c"], [record.msg for record in get_sorted_messages(messages)])
+        self.assertEqual(["a", "b", "c"], [record.msg for record in get_sorted_messages(messages, newest_first=True)])
+
+    def test_subtypes_are_dropped_and_list_is_cut_at_new_conversation(self):
+        messages = [slack_message("5.0", "latest"), slack_message("4.0", "edited", subtype="message_changed"),
+                    slack_message("3.0", "new-conversation"), slack_message("2.0", "older"),
+                    slack_message("1.0", "new-conversation")]
+
+        self.assertEqual(["latest"], [record.msg for record in get_sorted_messages(messages, newest_first=True)])
+
+    def test_system_messages_are_flagged(self):
+        texts = ["  help", "[SYSTEM] Settings saved", "x {} y".format(PII_SYSTEM_MESSAGE_TAG), DISCLAIMER,
+                 "what does help mean?", "settle this"]
+
+        self.assertEqual([True, True, True, True, False, False],
+                         [SlackMessage("1.0", "U1", text).is_system_message for text in texts])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,259 @@
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+
+from amazon_bedrock_ai_slack_app_lambda import handler_main
+from amazon_bedrock_ai_slack_app_lambda.helpers import slack_helper
+from amazon_bedrock_ai_slack_app_lambda.helpers.constants import THINKING_FACE
+from amazon_bedrock_ai_slack_app_lambda.helpers.event_deduplicator import EventDeduplicator
+from amazon_bedrock_ai_slack_app_lambda.helpers.thread_summary import ThreadSummary
+from amazon_bedrock_ai_slack_app_lambda.helpers.ttl_cache import TtlLruCache
+from amazon_bedrock_ai_slack_app_lambda.helpers.utils import SlackMessage
+from amazon_bedrock_ai_slack_app_lambda.validation.slack_params_validator import SLACK_PARAMETER_VALIDATOR
+
+TEST_CHANNEL_ID = "D123ABC456"
+TEST_USER_ID = "U123"
+TEST_BOT_USER_ID = "UBOT"
+TEST_SETTINGS = {"model_id": "anthropic.claude-v2:1", "mode": "assistant", "last_disclaimer_date": "2999-01-01"}
+TEST_PROCESSING_TS = "1700000000.000200"
+TEST_THREAD_TS = "1699999990.000100"
+LOOKUP_DELAY_SECONDS = 0.2
+
+
+NO_FAILURES = {"batchItemFailures": []}
+
+
+def slack_record(text, thread_ts=None, event_id=None, message_id="m1"):
+    body = {"event": {"channel": TEST_CHANNEL_ID, "user": TEST_USER_ID, "event_ts": "1700000000.000100",
+                      "text": text}}
+    if thread_ts:
+        body["event"]["thread_ts"] = thread_ts
+    if event_id:
+        body["event_id"] = event_id
+    return {"messageId": message_id, "body": json.dumps(body)}
+
+
+def slack_event(text, thread_ts=None):
+    return {"Records": [slack_record(text, thread_ts)]}
+
+
+def slow(return_value):
+    def lookup(*args, **kwargs):
+        time.sleep(LOOKUP_DELAY_SECONDS)
+        return return_value
+    return lookup
+
+
+@mock.patch.object(handler_main, "flush_metrics")
+@mock.patch.object(handler_main, "report_slack_rate_limiter_metrics")
+@mock.patch.object(handler_main, "report_slack_request_message_size_bytes")
+@mock.patch.object(handler_main, "get_bot_user_id", return_value=TEST_BOT_USER_ID)
+@mock.patch.object(handler_main, "get_channel_type", return_value="im")
+@mock.patch.object(handler_main, "get_user_settings", side_effect=slow(TEST_SETTINGS))
+@mock.patch.object(handler_main, "get_user_from_userid", side_effect=slow({"user": {"name": "testUser"}}))
+@mock.patch.object(handler_main, "get_conversation_history", side_effect=slow([]))
+@mock.patch.object(handler_main, "send_chat", return_value={"ok": True, "ts": TEST_PROCESSING_TS})
+@mock.patch.object(handler_main, "generate_payload", return_value={})
+@mock.patch.object(handler_main, "invoke_bedrock_streaming")
+class LambdaHandlerTests(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(handler_main, "EVENT_DEDUPLICATOR", EventDeduplicator())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(handler_main, "get_users_settings", return_value={})
+        self.get_users_settings = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        SLACK_PARAMETER_VALIDATOR.set_channel_id(None)
+        SLACK_PARAMETER_VALIDATOR.set_disclaimer_ts(-1)
+
+    def test_lookups_run_concurrently(self, invoke_bedrock_streaming, generate_payload, send_chat,
+                                      get_conversation_history, *_):
+        start = time.monotonic()
+        self.assertEqual(NO_FAILURES, handler_main.lambda_handler(slack_event("hello"), None))
+        elapsed = time.monotonic() - start
+
+        # settings, user and history lookups take 0.2s each; in sequence they would take 0.6s
+        self.assertLess(elapsed, 2 * LOOKUP_DELAY_SECONDS)
+        get_conversation_history.assert_called_once_with(TEST_CHANNEL_ID, 5)
+        invoke_bedrock_streaming.assert_called_once_with(mock.ANY, {}, None, TEST_PROCESSING_TS)
+
+    def test_placeholder_is_posted_before_lookups_complete(self, invoke_bedrock_streaming, generate_payload,
+                                                           send_chat, get_conversation_history, *_):
+        def assert_placeholder_posted(*args, **kwargs):
+            time.sleep(LOOKUP_DELAY_SECONDS)
+            send_chat.assert_called_once_with(TEST_CHANNEL_ID, THINKING_FACE, None)
+            return []
+        get_conversation_history.side_effect = assert_placeholder_posted
+
+        handler_main.lambda_handler(slack_event("hello"), None)
+
+        invoke_bedrock_streaming.assert_called_once_with(mock.ANY, {}, None, TEST_PROCESSING_TS)
+
+    def test_placeholder_is_not_sent_as_history(self, invoke_bedrock_streaming, generate_payload, send_chat,
+                                                get_conversation_history, *_):
+        message = SlackMessage("1700000000.000100", TEST_USER_ID, "hello")
+        get_conversation_history.side_effect = None
+        get_conversation_history.return_value = [
+            message, SlackMessage(TEST_PROCESSING_TS, TEST_BOT_USER_ID, THINKING_FACE)]
+
+        self.assertEqual(NO_FAILURES, handler_main.lambda_handler(slack_event("hello"), None))
+
+        generate_payload.assert_called_once_with([message], TEST_BOT_USER_ID, mock.ANY, "assistant", None)
+
+    def test_commands_do_not_fetch_history(self, invoke_bedrock_streaming, generate_payload, send_chat,
+                                           get_conversation_history, *_):
+        with mock.patch.object(handler_main, "handle_command", return_value={"status": "success"}) as handle_command:
+            self.assertEqual(NO_FAILURES, handler_main.lambda_handler(slack_event("help"), None))
+
+        handle_command.assert_called_once_with(TEST_CHANNEL_ID, TEST_USER_ID, "help", TEST_BOT_USER_ID, None)
+        get_conversation_history.assert_not_called()
+        send_chat.assert_not_called()
+        invoke_bedrock_streaming.assert_not_called()
+
+    def test_threads_are_sent_with_their_summary(self, invoke_bedrock_streaming, generate_payload, *_):
+        thread_summary = ThreadSummary("earlier turns", "1699999999.000000")
+        with mock.patch.object(handler_main, "get_channel_type", return_value="channel"), \
+                mock.patch.object(handler_main, "check_if_mentioning_bot", return_value=True), \
+                mock.patch.object(handler_main, "get_thread_replies", return_value=[]), \
+                mock.patch.object(handler_main.THREAD_SUMMARY_STORE, "get", return_value=thread_summary), \
+                mock.patch.object(handler_main, "summarize_thread") as summarize_thread:
+            handler_main.lambda_handler(slack_event("<@UBOT> hello", TEST_THREAD_TS), None)
+
+        generate_payload.assert_called_once_with([], TEST_BOT_USER_ID, mock.ANY, "assistant", "earlier turns")
+        # short threads are not folded
+        summarize_thread.assert_not_called()
+
+    def test_long_threads_are_summarized_while_the_response_streams(self, invoke_bedrock_streaming, *_):
+        summarizing = threading.Event()
+        invoke_bedrock_streaming.side_effect = lambda *args: self.assertTrue(summarizing.wait(1))
+        with mock.patch.object(handler_main, "get_channel_type", return_value="channel"), \
+                mock.patch.object(handler_main, "check_if_mentioning_bot", return_value=True), \
+                mock.patch.object(handler_main, "get_thread_replies", return_value=[]), \
+                mock.patch.object(handler_main.THREAD_SUMMARY_STORE, "get", return_value=None), \
+                mock.patch.object(handler_main, "needs_summary", return_value=True), \
+                mock.patch.object(handler_main, "summarize_thread") as summarize_thread:
+            summarize_thread.side_effect = lambda *args: summarizing.set()
+            self.assertEqual(NO_FAILURES,
+                             handler_main.lambda_handler(slack_event("<@UBOT> hello", TEST_THREAD_TS), None))
+
+        summarize_thread.assert_called_once_with(TEST_CHANNEL_ID, TEST_THREAD_TS, [], None, TEST_BOT_USER_ID)
+
+    def test_messages_from_the_bot_are_skipped(self, invoke_bedrock_streaming, generate_payload, send_chat,
+                                               get_conversation_history, get_user_from_userid, get_user_settings,
+                                               *_):
+        with mock.patch.object(handler_main, "get_bot_user_id", return_value=TEST_USER_ID):
+            self.assertEqual(NO_FAILURES, handler_main.lambda_handler(slack_event("hello"), None))
+
+        get_user_settings.assert_not_called()
+        get_conversation_history.assert_not_called()
+
+    def test_batch_records_are_handled_concurrently(self, invoke_bedrock_streaming, *_):
+        event = {"Records": [slack_record("hello", event_id="Ev1", message_id="m1"),
+                             slack_record("hello", event_id="Ev2", message_id="m2")]}
+        start = time.monotonic()
+        self.assertEqual(NO_FAILURES, handler_main.lambda_handler(event, None))
+
+        # one record takes 0.2s, in sequence they would take 0.4s
+        self.assertLess(time.monotonic() - start, 2 * LOOKUP_DELAY_SECONDS)
+        self.assertEqual(2, invoke_bedrock_streaming.call_count)
+
+    def test_settings_of_a_batch_are_prefetched(self, invoke_bedrock_streaming, generate_payload, send_chat,
+                                                get_conversation_history, get_user_from_userid, get_user_settings,
+                                                *_):
+        self.get_users_settings.return_value = {"{}/{}".format(TEST_CHANNEL_ID, TEST_USER_ID): TEST_SETTINGS}
+        bot_record = slack_record("hello", event_id="Ev3", message_id="m3")
+        bot_record["body"] = bot_record["body"].replace(TEST_USER_ID, TEST_BOT_USER_ID)
+        event = {"Records": [slack_record("hello", event_id="Ev1", message_id="m1"),
+                             slack_record("hello", event_id="Ev2", message_id="m2"),
+                             bot_record, {"messageId": "m4", "body": "not json"}]}
+
+        self.assertEqual(NO_FAILURES, handler_main.lambda_handler(event, None))
+
+        self.get_users_settings.assert_called_once_with([(TEST_CHANNEL_ID, TEST_USER_ID)] * 2)
+        get_user_settings.assert_not_called()
+        self.assertEqual(2, invoke_bedrock_streaming.call_count)
+
+    def test_failed_records_are_reported_and_can_be_retried(self, invoke_bedrock_streaming, *_):
+        invoke_bedrock_streaming.side_effect = [None, Exception("throttled"), None]
+        event = {"Records": [slack_record("hello", event_id="Ev1", message_id="m1"),
+                             slack_record("hello", event_id="Ev2", message_id="m2")]}
+
+        with mock.patch.object(handler_main, "BATCH_ITEM_FAILURES_REPORTED", True):
+            response = handler_main.lambda_handler(event, None)
+
+        self.assertEqual(1, len(response["batchItemFailures"]))
+        failed_record = [record for record in event["Records"]
+                         if record["messageId"] == response["batchItemFailures"][0]["itemIdentifier"]]
+        self.assertEqual(NO_FAILURES, handler_main.lambda_handler({"Records": failed_record}, None))
+        self.assertEqual(3, invoke_bedrock_streaming.call_count)
+
+    def test_failed_batches_are_redelivered_when_failures_are_not_reported(self, invoke_bedrock_streaming, *_):
+        invoke_bedrock_streaming.side_effect = [None, Exception("throttled"), None]
+        event = {"Records": [slack_record("hello", event_id="Ev1", message_id="m1"),
+                             slack_record("hello", event_id="Ev2", message_id="m2")]}
+
+        with self.assertRaises(RuntimeError):
+            handler_main.lambda_handler(event, None)
+
+        # the completed event is skipped when the batch is redelivered
+        self.assertEqual(NO_FAILURES, handler_main.lambda_handler(event, None))
+        self.assertEqual(3, invoke_bedrock_streaming.call_count)
+
+    def test_events_are_claimed_until_the_invocation_times_out(self, *_):
+        context = mock.Mock()
+        context.get_remaining_time_in_millis.return_value = 29500
+        with mock.patch.object(handler_main, "EVENT_DEDUPLICATOR") as event_deduplicator:
+            self.assertEqual(NO_FAILURES,
+                             handler_main.lambda_handler({"Records": [slack_record("hello", event_id="Ev1")]}, context))
+
+        event_deduplicator.claim.assert_called_once_with("Ev1", 30)
+        event_deduplicator.complete.assert_called_once_with("Ev1")
+
+    def test_duplicate_events_are_answered_once(self, invoke_bedrock_streaming, *_):
+        event = {"Records": [slack_record("hello", event_id="Ev1", message_id="m1")]}
+
+        self.assertEqual(NO_FAILURES, handler_main.lambda_handler(event, None))
+        self.assertEqual(NO_FAILURES, handler_main.lambda_handler(event, None))
+
+        invoke_bedrock_streaming.assert_called_once()
+
+
+class PrefetchUserSettingsTests(unittest.TestCase):
+    def setUp(self):
+        for name in ("BOT_IDENTITY_CACHE", "CHANNEL_INFO_CACHE"):
+            patcher = mock.patch.object(slack_helper, name, TtlLruCache(max_size=8, ttl_seconds=60))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patchers = [
+            mock.patch.object(handler_main, "EVENT_DEDUPLICATOR", EventDeduplicator()),
+            mock.patch.object(handler_main, "flush_metrics"),
+            mock.patch.object(handler_main, "report_slack_rate_limiter_metrics"),
+            mock.patch.object(handler_main, "__handle_event"),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(handler_main, "get_users_settings", return_value={})
+        self.get_users_settings = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_settings_are_prefetched_with_the_slack_lookups(self):
+        responses = {
+            "auth.test": {"ok": True, "user_id": TEST_BOT_USER_ID},
+            "conversations.info": {"ok": True, "channel": {"id": TEST_CHANNEL_ID, "is_im": True}},
+        }
+        event = {"Records": [slack_record("hello", event_id="Ev1", message_id="m1"),
+                             slack_record("hello", event_id="Ev2", message_id="m2")]}
+        with mock.patch.object(slack_helper.SLACK_CLIENT, "api_call",
+                               side_effect=lambda api_method, *args, **kwargs: responses[api_method]):
+            self.assertEqual(NO_FAILURES, handler_main.lambda_handler(event, None))
+
+        self.get_users_settings.assert_called_once_with([(TEST_CHANNEL_ID, TEST_USER_ID)] * 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
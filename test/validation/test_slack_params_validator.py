@@ -1,3 +1,4 @@
+import contextvars
 import unittest
 
 from amazon_bedrock_ai_slack_app_lambda.validation.slack_params_validator import SlackParameterValidator
@@ -29,6 +30,19 @@ class SlackParameterValidatorTests(unittest.TestCase):
         with self.assertRaises(AssertionError):
             test_unit.validate_channel_id(TEST_CHANNEL_ID + "STRING")
 
+    def test_state_is_kept_per_context(self):
+        test_unit = SlackParameterValidator()
+
+        def handle(channel_id):
+            test_unit.set_channel_id(channel_id)
+            # work submitted for the request sees the request's state
+            contextvars.copy_context().run(test_unit.validate_channel_id, channel_id)
+
+        contextvars.Context().run(handle, TEST_CHANNEL_ID)
+        contextvars.Context().run(handle, TEST_CHANNEL_ID + "OTHER")
+        with self.assertRaises(AssertionError):
+            test_unit.validate_channel_id(TEST_CHANNEL_ID)
+
 
 if __name__ == '__main__':
     unittest.main()